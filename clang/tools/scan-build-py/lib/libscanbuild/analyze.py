@@ -27,6 +27,7 @@ from collections import defaultdict
 
 from libscanbuild import command_entry_point, compiler_wrapper, \
     wrapper_environment, run_build, run_command, CtuConfig
+from libscanbuild.cdb import read_entries
 from libscanbuild.arguments import parse_args_for_scan_build, \
     parse_args_for_analyze_build
 from libscanbuild.intercept import capture
@@ -230,19 +231,18 @@ def run_analyzer_parallel(args):
     }
 
     logging.debug('run analyzer against compilation database')
-    with open(args.cdb, 'r') as handle:
-        generator = (dict(cmd, **consts)
-                     for cmd in json.load(handle) if not exclude(
-                            cmd['file'], cmd['directory']))
-        # when verbose output requested execute sequentially
-        pool = multiprocessing.Pool(1 if args.verbose > 2 else None)
-        for current in pool.imap_unordered(run, generator):
-            if current is not None:
-                # display error message from the static analyzer
-                for line in current['error_output']:
-                    logging.info(line.rstrip())
-        pool.close()
-        pool.join()
+    generator = (dict(cmd, **consts)
+                 for cmd in read_entries(args.cdb) if not exclude(
+                        cmd['file'], cmd['directory']))
+    # when verbose output requested execute sequentially
+    pool = multiprocessing.Pool(1 if args.verbose > 2 else None)
+    for current in pool.imap_unordered(run, generator):
+        if current is not None:
+            # display error message from the static analyzer
+            for line in current['error_output']:
+                logging.info(line.rstrip())
+    pool.close()
+    pool.join()
 
 
 def govern_analyzer_runs(args):
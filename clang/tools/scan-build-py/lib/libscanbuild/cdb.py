@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# Part of the LLVM Project, under the Apache License v2.0 with LLVM Exceptions.
+# See https://llvm.org/LICENSE.txt for license information.
+# SPDX-License-Identifier: Apache-2.0 WITH LLVM-exception
+""" This module reads and writes compilation databases incrementally.
+
+A compilation database is a JSON array of entries. Loading the whole array
+(or dumping a list of all the entries) needs memory proportional to the size
+of the database, which is a problem for databases of several gigabytes. The
+reader here decodes one entry at a time from a buffer of the file, and the
+writer formats one entry at a time, with the same layout `json.dump` would
+produce with `indent=4`. """
+
+import json
+import os
+import os.path
+import tempfile
+
+__all__ = ['iter_entries', 'read_entries', 'write_entries']
+
+# The size of the blocks read from a compilation database.
+CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_entries(handle, chunk_size=CHUNK_SIZE):
+    """ Generates the entries of a compilation database one at a time.
+
+    :param handle: the compilation database file opened for reading
+    :param chunk_size: the size of the blocks read from the file
+    :return: generator of the entries """
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill():
+        """ Reads the next block, drops what was consumed already. """
+        nonlocal buffer, position, eof
+        chunk = handle.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+        return not eof
+
+    def next_token():
+        """ Skips whitespace and returns the next character ('' at end). """
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position < len(buffer) or not fill():
+                return buffer[position:position + 1]
+
+    def error(message):
+        return ValueError('Invalid compilation database: ' + message)
+
+    if next_token() != '[':
+        raise error('expected a JSON array')
+    position += 1
+    if next_token() == ']':
+        return
+    while True:
+        next_token()
+        while True:
+            try:
+                entry, end = decoder.raw_decode(buffer, position)
+                # A value ending the buffer may be cut short, like a number.
+                if end < len(buffer) or eof:
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            # The entry is not complete yet: read more of it.
+            fill()
+        position = end
+        yield entry
+        token = next_token()
+        if token == ']':
+            return
+        if token != ',':
+            raise error('expected "," or "]" after an entry')
+        position += 1
+
+
+def read_entries(filename):
+    """ Generates the entries of the compilation database file.
+
+    :param filename: the compilation database file name
+    :return: generator of the entries """
+
+    with open(filename, 'r') as handle:
+        for entry in iter_entries(handle):
+            yield entry
+
+
+def write_entries(entries, filename):
+    """ Writes the entries into a compilation database file.
+
+    The database is written into a temporary file, which replaces the file
+    once all the entries were written. So the entries can be read from the
+    previous version of the same file. When the file name is a symbolic
+    link, the file it points to is replaced, and the replaced file keeps its
+    permissions.
+
+    :param entries: iterable of the entries
+    :param filename: the compilation database file name
+    :return: the number of entries written """
+
+    filename = os.path.realpath(filename)
+    directory = os.path.dirname(filename)
+    handle = tempfile.NamedTemporaryFile(mode='w', dir=directory,
+                                         prefix='.cdb-', delete=False)
+    try:
+        with handle:
+            count = 0
+            for entry in entries:
+                text = json.dumps(entry, sort_keys=True, indent=4)
+                handle.write(',\n    ' if count else '[\n    ')
+                handle.write(text.replace('\n', '\n    '))
+                count += 1
+            handle.write('\n]' if count else '[]')
+        try:
+            mode = os.stat(filename).st_mode & 0o7777
+        except FileNotFoundError:
+            # Use the permissions a newly created file would have.
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(handle.name, mode)
+        os.replace(handle.name, filename)
+    except BaseException:
+        os.unlink(handle.name)
+        raise
+    return count
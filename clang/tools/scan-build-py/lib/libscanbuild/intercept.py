@@ -24,13 +24,13 @@ import os
 import os.path
 import re
 import itertools
-import json
 import glob
 import logging
 from libear import build_libear, TemporaryDirectory
 from libscanbuild import command_entry_point, compiler_wrapper, \
     wrapper_environment, run_command, run_build
 from libscanbuild import duplicate_check
+from libscanbuild.cdb import read_entries, write_entries
 from libscanbuild.compilation import split_command
 from libscanbuild.arguments import parse_args_for_intercept_build
 from libscanbuild.shell import encode, decode
@@ -73,8 +73,7 @@ def capture(args):
             format_entry(command) for command in commands)
         # read entries from previous run
         if 'append' in args and args.append and os.path.isfile(args.cdb):
-            with open(args.cdb) as handle:
-                previous = iter(json.load(handle))
+            previous = read_entries(args.cdb)
         else:
             previous = iter([])
         # filter out duplicate entries from both
@@ -94,8 +93,7 @@ def capture(args):
         # do post processing
         entries = post_processing(exec_traces)
         # dump the compilation database
-        with open(args.cdb, 'w+') as handle:
-            json.dump(list(entries), handle, sort_keys=True, indent=4)
+        write_entries(entries, args.cdb)
         return exit_code
 
 
@@ -18,6 +18,7 @@ import json
 import logging
 import datetime
 from libscanbuild import duplicate_check
+from libscanbuild.cdb import read_entries
 from libscanbuild.clang import get_version
 
 __all__ = ['document']
@@ -580,8 +581,7 @@ def comment(name, opts=dict()):
 def commonprefix_from(filename):
     """ Create file prefix from a compilation database entries. """
 
-    with open(filename, 'r') as handle:
-        return commonprefix(item['file'] for item in json.load(handle))
+    return commonprefix(item['file'] for item in read_entries(filename))
 
 
 def commonprefix(files):
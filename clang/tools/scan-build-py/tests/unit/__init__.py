@@ -10,6 +10,7 @@ from . import test_report
 from . import test_analyze
 from . import test_intercept
 from . import test_shell
+from . import test_cdb
 
 
 def load_tests(loader, suite, _):
@@ -20,4 +21,5 @@ def load_tests(loader, suite, _):
     suite.addTests(loader.loadTestsFromModule(test_analyze))
     suite.addTests(loader.loadTestsFromModule(test_intercept))
     suite.addTests(loader.loadTestsFromModule(test_shell))
+    suite.addTests(loader.loadTestsFromModule(test_cdb))
     return suite
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Part of the LLVM Project, under the Apache License v2.0 with LLVM Exceptions.
+# See https://llvm.org/LICENSE.txt for license information.
+# SPDX-License-Identifier: Apache-2.0 WITH LLVM-exception
+
+import io
+import json
+import libear
+import libscanbuild.cdb as sut
+import unittest
+import os.path
+
+
+ENTRIES = [
+    {'directory': '/src', 'file': '/src/a.c',
+     'arguments': ['cc', '-c', '-DNAME="a, b]"', 'a.c']},
+    {'directory': '/src', 'file': '/src/b.c', 'command': 'cc -c b.c'},
+    {'directory': '/src/é', 'file': '/src/é/c.c',
+     'arguments': ['cc', '-c', 'c.c'], 'output': 'c.o'},
+]
+
+
+class ReadEntriesTest(unittest.TestCase):
+
+    def read(self, content, chunk_size=sut.CHUNK_SIZE):
+        handle = io.StringIO(content)
+        return list(sut.iter_entries(handle, chunk_size=chunk_size))
+
+    def test_reads_what_json_writes(self):
+        for indent in (None, 4):
+            content = json.dumps(ENTRIES, indent=indent)
+            for chunk_size in (1, 2, 7, 64, sut.CHUNK_SIZE):
+                self.assertEqual(ENTRIES, self.read(content, chunk_size))
+
+    def test_empty_database(self):
+        self.assertEqual([], self.read('[]'))
+        self.assertEqual([], self.read(' [ \n ] \n', chunk_size=1))
+
+    def test_numbers_are_not_cut(self):
+        self.assertEqual([12345, 6], self.read('[12345 ,6]', chunk_size=2))
+
+    def test_invalid_database(self):
+        for content in ('', '{}', '[{}', '[{} {}]', '[{"file": ]', '[{},]'):
+            with self.assertRaises(ValueError):
+                self.read(content, chunk_size=3)
+
+
+class WriteEntriesTest(unittest.TestCase):
+
+    def test_writes_like_json_dump(self):
+        with libear.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'compile_commands.json')
+            for entries in (ENTRIES, ENTRIES[:1], []):
+                self.assertEqual(len(entries),
+                                 sut.write_entries(iter(entries), filename))
+                with open(filename, 'r') as handle:
+                    content = handle.read()
+                self.assertEqual(
+                    json.dumps(entries, sort_keys=True, indent=4), content)
+                self.assertEqual(entries, list(sut.read_entries(filename)))
+
+    def test_rewrites_the_file_it_reads(self):
+        with libear.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'compile_commands.json')
+            sut.write_entries(ENTRIES, filename)
+            entries = sut.read_entries(filename)
+            sut.write_entries(
+                (dict(entry, output='x.o') for entry in entries), filename)
+            self.assertEqual([dict(entry, output='x.o') for entry in ENTRIES],
+                             list(sut.read_entries(filename)))
+            self.assertEqual(['compile_commands.json'], os.listdir(tmpdir))
+
+    def test_keeps_the_file_when_failing(self):
+        def entries():
+            yield ENTRIES[0]
+            raise KeyError('failure')
+
+        with libear.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'compile_commands.json')
+            sut.write_entries(ENTRIES, filename)
+            with self.assertRaises(KeyError):
+                sut.write_entries(entries(), filename)
+            self.assertEqual(ENTRIES, list(sut.read_entries(filename)))
+            self.assertEqual(['compile_commands.json'], os.listdir(tmpdir))
+
+    def test_keeps_the_symbolic_link(self):
+        with libear.TemporaryDirectory() as tmpdir:
+            target = os.path.join(tmpdir, 'build.json')
+            filename = os.path.join(tmpdir, 'compile_commands.json')
+            sut.write_entries(ENTRIES, target)
+            os.symlink('build.json', filename)
+            sut.write_entries(ENTRIES[:1], filename)
+            self.assertTrue(os.path.islink(filename))
+            self.assertEqual(ENTRIES[:1], list(sut.read_entries(target)))
+
+    def test_keeps_the_permissions(self):
+        with libear.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'compile_commands.json')
+            sut.write_entries(ENTRIES, filename)
+            os.chmod(filename, 0o640)
+            sut.write_entries(ENTRIES[:1], filename)
+            self.assertEqual(0o640, os.stat(filename).st_mode & 0o777)
@@ -126,6 +126,7 @@ if config.have_ocamlopt:
         config.ocamlfind_executable, config.llvm_lib_dir, config.llvm_lib_dir, config.ocaml_flags)
 
 opt_viewer_cmd = '%s %s/tools/opt-viewer/opt-viewer.py' % (sys.executable, config.llvm_src_root)
+opt_diff_cmd = '%s %s/tools/opt-viewer/opt-diff.py' % (sys.executable, config.llvm_src_root)
 
 llvm_original_di_preservation_cmd = os.path.join(
     config.llvm_src_root,'utils', 'llvm-original-di-preservation.py')
@@ -148,6 +149,7 @@ tools = [
     ToolSubst('%ocamlc', ocamlc_command, unresolved='ignore'),
     ToolSubst('%ocamlopt', ocamlopt_command, unresolved='ignore'),
     ToolSubst('%opt-viewer', opt_viewer_cmd),
+    ToolSubst('%opt-diff', opt_diff_cmd),
     ToolSubst('%llvm-objcopy', FindTool('llvm-objcopy')),
     ToolSubst('%llvm-strip', FindTool('llvm-strip')),
     ToolSubst('%llvm-install-name-tool', FindTool('llvm-install-name-tool')),
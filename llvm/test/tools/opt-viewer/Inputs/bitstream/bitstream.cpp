@@ -0,0 +1,7 @@
+int foo(int x) {
+  return x + 1;
+}
+int bar(int y) {
+  int r = foo(y);
+  return ext(r);
+}
@@ -0,0 +1,24 @@
+define internal i32 @_Z3fooi(i32 %x) !dbg !6 !prof !20 {
+  %a = add i32 %x, 1, !dbg !9
+  ret i32 %a, !dbg !9
+}
+define i32 @_Z3bari(i32 %y) sspreq !dbg !10 !prof !21 {
+  %r = call i32 @_Z3fooi(i32 %y), !dbg !11
+  %s = call i32 @ext(i32 %r), !dbg !12
+  ret i32 %s, !dbg !12
+}
+declare i32 @ext(i32)
+!llvm.dbg.cu = !{!0}
+!llvm.module.flags = !{!3, !4}
+!0 = distinct !DICompileUnit(language: DW_LANG_C_plus_plus, file: !1, producer: "x", isOptimized: true, runtimeVersion: 0, emissionKind: LineTablesOnly)
+!1 = !DIFile(filename: "bitstream.cpp", directory: "/")
+!3 = !{i32 2, !"Debug Info Version", i32 3}
+!4 = !{i32 7, !"Dwarf Version", i32 4}
+!5 = !DISubroutineType(types: !{})
+!6 = distinct !DISubprogram(name: "foo", linkageName: "_Z3fooi", scope: !1, file: !1, line: 1, type: !5, scopeLine: 1, spFlags: DISPFlagDefinition | DISPFlagOptimized, unit: !0)
+!9 = !DILocation(line: 2, column: 3, scope: !6)
+!10 = distinct !DISubprogram(name: "bar", linkageName: "_Z3bari", scope: !1, file: !1, line: 4, type: !5, scopeLine: 4, spFlags: DISPFlagDefinition | DISPFlagOptimized, unit: !0)
+!11 = !DILocation(line: 5, column: 10, scope: !10)
+!12 = !DILocation(line: 6, column: 10, scope: !10)
+!20 = !{!"function_entry_count", i64 30}
+!21 = !{!"function_entry_count", i64 30}
@@ -16,9 +16,121 @@ try:
 except ImportError:
     from yaml import Loader
 
+import optpmap
 import optrecord
+import optstore
 import argparse
-from collections import defaultdict
+import array
+import glob
+import os
+import pickle
+import shutil
+import tempfile
+import zlib
+
+
+# The marker of the start of every YAML document but the first of a file.
+DOCUMENT_START = '--- '
+
+
+def partition_of(store, i, partitions):
+    """Returns the partition of the i-th remark of a store, which only
+    depends on the remark."""
+    string = store.string
+    key = '\0'.join([string(store.tag[i]), string(store.pass_[i]),
+                     string(store.name[i]), string(store.function[i]),
+                     string(store.file[i]), str(store.line[i]),
+                     str(store.column[i])])
+    return zlib.crc32(key.encode('utf-8')) % partitions
+
+
+def spill(entry, filter_):
+    """
+    Reads the remarks of an optimization record file and appends them,
+    hash-partitioned, to the spill files of this process for its side of
+    the diff.  Returns the maximum hotness of the file and the partitions
+    its remarks were spilled to.
+    """
+    side, filename, temp_dir, partitions = entry
+    if optstore.is_index_file(filename):
+        store = optstore.RemarkStore.load(filename)
+    else:
+        store = optrecord.get_remarks(filename)
+
+    parts = [optstore.RemarkStore() for _ in range(partitions)]
+    for i in range(len(store)):
+        parts[partition_of(store, i, partitions)].add(*store.get(i))
+    spilled = [p for p, part in enumerate(parts) if len(part)]
+    for p in spilled:
+        path = os.path.join(temp_dir, '{}-{}-{}.spill'.format(
+            side, os.getpid(), p))
+        with open(path, 'ab') as f:
+            pickle.dump(parts[p], f, pickle.HIGHEST_PROTOCOL)
+    return store.max_hotness, spilled
+
+
+def read_partition(temp_dir, side, p):
+    store = optstore.RemarkStore()
+    for path in glob.glob(os.path.join(temp_dir, '{}-*-{}.spill'.format(side, p))):
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    store.extend(pickle.load(f))
+                except EOFError:
+                    break
+    return store
+
+
+def diff_partition(entry, filter_):
+    """
+    Writes the remarks of a partition that are only on one side of the diff
+    as YAML documents to a file.  Returns the file and the offsets of the
+    documents in it.
+    """
+    p, temp_dir, max_hotness1, max_hotness2 = entry
+    store1 = read_partition(temp_dir, 1, p)
+    store2 = read_partition(temp_dir, 2, p)
+    keys1 = set(store1.key(i) for i in range(len(store1)))
+    keys2 = set(store2.key(i) for i in range(len(store2)))
+
+    path = os.path.join(temp_dir, 'diff-{}.opt.yaml'.format(p))
+    offsets = array.array('Q', [0])
+    with open(path, 'w') as stream:
+        for store, other_keys, max_hotness, added in \
+                ((store2, keys1, max_hotness2, True),
+                 (store1, keys2, max_hotness1, False)):
+            for i in range(len(store)):
+                if store.key(i) in other_keys:
+                    continue
+                r = optrecord.make_remark(*store.get(i))
+                r.canonicalize()
+                r.max_hotness = max_hotness
+                r.Added = added
+                r.recover_yaml_structure()
+                offsets.append(offsets[-1] +
+                               stream.write(DOCUMENT_START + yaml.dump(r)))
+    return path, offsets
+
+
+def write_output(results, output, max_size):
+    """Copy the documents of the partitions into files of at most
+    max_size remarks."""
+    stream = None
+    count = 0
+    for path, offsets in results:
+        with open(path) as f:
+            for start, end in zip(offsets, offsets[1:]):
+                document = f.read(end - start)
+                if count % max_size == 0:
+                    if stream:
+                        stream.close()
+                    stream = open(output.format(count / max_size), 'w')
+                    document = document[len(DOCUMENT_START):]
+                stream.write(document)
+                count += 1
+    if stream:
+        stream.close()
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=desc)
@@ -48,6 +160,18 @@ if __name__ == '__main__':
         action='store_true',
         default=False,
         help='Do not display any indicator of how many YAML files were read.')
+    parser.add_argument(
+        '--partitions',
+        default=64,
+        type=int,
+        help='Number of partitions the remarks are split into, each of them '
+             'diffed on its own so that only one partition per job needs to '
+             'be in memory (defaults to %(default)s)')
+    parser.add_argument(
+        '--temp-dir',
+        default=None,
+        help='Directory where the partitions are spilled to (defaults to the '
+             'system temporary directory)')
     parser.add_argument('--output', '-o', default='diff{}.opt.yaml')
     args = parser.parse_args()
 
@@ -55,21 +179,26 @@ if __name__ == '__main__':
     files2 = optrecord.find_opt_files(args.yaml_dir_or_file_2)
 
     print_progress = not args.no_progress_indicator
-    all_remarks1, _, _ = optrecord.gather_results(files1, args.jobs, print_progress)
-    all_remarks2, _, _ = optrecord.gather_results(files2, args.jobs, print_progress)
-
-    added = set(all_remarks2.values()) - set(all_remarks1.values())
-    removed = set(all_remarks1.values()) - set(all_remarks2.values())
-
-    for r in added:
-        r.Added = True
-    for r in removed:
-        r.Added = False
-
-    result = list(added | removed)
-    for r in result:
-        r.recover_yaml_structure()
+    temp_dir = tempfile.mkdtemp(prefix='opt-diff-', dir=args.temp_dir)
+    try:
+        if print_progress:
+            print('Partitioning optimization record files...')
+        entries = [(1, f, temp_dir, args.partitions) for f in files1] + \
+                  [(2, f, temp_dir, args.partitions) for f in files2]
+        spilled = optpmap.pmap(spill, entries, args.jobs, print_progress)
+        max_hotness = [hotness for hotness, _ in spilled]
+        max_hotness1 = max(max_hotness[:len(files1)] or [0])
+        max_hotness2 = max(max_hotness[len(files1):] or [0])
+        # Small inputs only fill some of the partitions.
+        partitions = sorted(set(p for _, parts in spilled for p in parts))
 
-    for i in range(0, len(result), args.max_size):
-        with open(args.output.format(i / args.max_size), 'w') as stream:
-            yaml.dump_all(result[i:i + args.max_size], stream)
+        if print_progress:
+            print('Diffing partitions...')
+        results = optpmap.pmap(
+            diff_partition,
+            [(p, temp_dir, max_hotness1, max_hotness2)
+             for p in partitions],
+            args.jobs, print_progress)
+        write_output(results, args.output, args.max_size)
+    finally:
+        shutil.rmtree(temp_dir)
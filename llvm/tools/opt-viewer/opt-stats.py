@@ -2,15 +2,20 @@
 
 from __future__ import print_function
 
-desc = '''Generate statistics about optimization records from the YAML files
-generated with -fsave-optimization-record and -fdiagnostics-show-hotness.
+desc = '''Generate statistics about optimization records from the YAML or
+bitstream files generated with -fsave-optimization-record and
+-fdiagnostics-show-hotness.
 
 The tools requires PyYAML and Pygments Python packages.'''
 
+import optbitstream
 import optrecord
 import argparse
 import operator
-from collections import defaultdict
+import os
+import sys
+import time
+from collections import Counter, defaultdict
 from multiprocessing import cpu_count, Pool
 
 try:
@@ -20,6 +25,28 @@ except ImportError:
     print("Memory consumption not shown because guppy is not installed")
     hp = None
 
+
+def benchmark(files):
+    """Print how fast the files of each format are read, one at a time."""
+    by_format = defaultdict(list)
+    for name in files:
+        if optbitstream.is_bitstream_file(name):
+            by_format['bitstream'].append(name)
+        else:
+            by_format['YAML'].append(name)
+
+    print("{:10s} {:>6s} {:>10s} {:>10s} {:>12s} {:>8s}".format(
+        "Format", "Files", "Remarks", "MB", "Remarks/s", "MB/s"))
+    for format, names in sorted(by_format.items()):
+        size = sum(os.path.getsize(name) for name in names) / 1e6
+        start = time.time()
+        count = sum(1 for name in names
+                    for _ in optrecord.load_remarks(name))
+        elapsed = max(time.time() - start, 1e-6)
+        print("{:10s} {:6d} {:10d} {:10.1f} {:12.0f} {:8.1f}".format(
+            format, len(names), count, size, count / elapsed, size / elapsed))
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=desc)
     parser.add_argument(
@@ -39,32 +66,52 @@ if __name__ == '__main__':
         action='store_true',
         default=False,
         help='Do not display any indicator of how many YAML files were read.')
+    parser.add_argument(
+        '--benchmark',
+        action='store_true',
+        default=False,
+        help='Only measure the throughput of reading the YAML and the '
+             'bitstream files')
+    parser.add_argument(
+        '--save-index',
+        metavar='FILE',
+        help='Save the remarks that were read to a remark index file, which '
+             'can be passed instead of the optimization record files later')
     args = parser.parse_args()
 
     print_progress = not args.no_progress_indicator
 
     files = optrecord.find_opt_files(*args.yaml_dirs_or_files)
     if not files:
-        parser.error("No *.opt.yaml files found")
+        parser.error("No *.opt.yaml or *.opt.bitstream files found")
         sys.exit(1)
 
-    all_remarks, file_remarks, _ = optrecord.gather_results(
-        files, args.jobs, print_progress)
+    if args.benchmark:
+        benchmark(files)
+        sys.exit(0)
+
+    store = optrecord.load_store(files, args.jobs, print_progress)
     if print_progress:
         print('\n')
+    if args.save_index:
+        store.save(args.save_index)
 
+    # Count the remarks by the ids of their pass and name, without building
+    # the remarks themselves.
     bypass = defaultdict(int)
     byname = defaultdict(int)
-    for r in optrecord.itervalues(all_remarks):
-        bypass[r.Pass] += 1
-        byname[r.Pass + "/" + r.Name] += 1
+    for (pass_id, name_id), count in Counter(zip(store.pass_,
+                                                 store.name)).items():
+        passname = store.string(pass_id)
+        bypass[passname] += count
+        byname[passname + "/" + store.string(name_id)] += count
 
-    total = len(all_remarks)
+    total = len(store)
     print("{:24s} {:10d}".format("Total number of remarks", total))
     if hp:
         h = hp.heap()
         print("{:24s} {:10d}".format("Memory per remark",
-                                     h.size / len(all_remarks)))
+                                     h.size / total))
     print('\n')
 
     print("Top 10 remarks by pass:")
@@ -3,12 +3,15 @@
 from __future__ import print_function
 
 import argparse
+from collections import defaultdict
 import errno
 import functools
+import hashlib
 import html
 import io
 from multiprocessing import cpu_count
 import os.path
+import json
 import re
 import shutil
 import sys
@@ -17,24 +20,81 @@ from pygments import highlight
 from pygments.lexers.c_cpp import CppLexer
 from pygments.formatters import HtmlFormatter
 
+import optdemangle
 import optpmap
 import optrecord
+import optstore
 
 
-desc = '''Generate HTML output to visualize optimization records from the YAML files
-generated with -fsave-optimization-record and -fdiagnostics-show-hotness.
+desc = '''Generate HTML output to visualize optimization records from the YAML or
+bitstream files generated with -fsave-optimization-record and
+-fdiagnostics-show-hotness.
 
 The tools requires PyYAML and Pygments Python packages.'''
 
 
 # This allows passing the global context to the child processes.
 class Context:
-    def __init__(self, caller_loc = dict()):
+    def __init__(self, caller_loc = dict(), demangler = None):
        # Map function names to their source location for function where inlining happened
        self.caller_loc = caller_loc
+       # The demangler of the main process, for the child processes to create
+       # their own.
+       self.demangler = demangler
 
 context = Context()
 
+# The pages rendered by a previous run, see read_manifest().
+MANIFEST_FILE = '.opt-viewer-manifest.json'
+# Bump this whenever the rendered HTML changes, to render every page again.
+MANIFEST_VERSION = 1
+
+def digest(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(repr(part).encode('utf-8'))
+    return h.hexdigest()
+
+def read_manifest(output_dir):
+    """
+    Returns a map from the name of every page rendered into the output
+    directory by a previous run to the digest of everything it was rendered
+    from.  A page whose digest did not change does not need to be rendered
+    again.
+    """
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or \
+            manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('pages', {})
+
+def write_manifest(output_dir, pages):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'pages': pages}, f)
+    os.replace(path + '.tmp', path)
+
+def is_up_to_date(output_dir, page, old_digest, new_digest):
+    return old_digest == new_digest and \
+        os.path.exists(os.path.join(output_dir, page))
+
+def remark_digest_parts(r):
+    """The fields of a remark that its rendering depends on."""
+    return (r.yaml_tag, r.PassWithDiffPrefix, r.Name, r.File, r.Line,
+            r.Column, r.Function, r.Args, r.Hotness, r.max_hotness)
+
+def find_source_file(source_dir, filename):
+    if os.path.exists(filename):
+        return filename
+    fn = os.path.join(source_dir, filename)
+    if os.path.exists(fn):
+        return fn
+    return None
+
 def suppress(remark):
     if remark.Name == 'sil.Specialized':
         return remark.getArgDict()['Function'][0].startswith('\"Swift.')
@@ -45,13 +105,7 @@ def suppress(remark):
 class SourceFileRenderer:
     def __init__(self, source_dir, output_dir, filename, no_highlight):
         self.filename = filename
-        existing_filename = None
-        if os.path.exists(filename):
-            existing_filename = filename
-        else:
-            fn = os.path.join(source_dir, filename)
-            if os.path.exists(fn):
-                existing_filename = fn
+        existing_filename = find_source_file(source_dir, filename)
 
         self.no_highlight = no_highlight
         self.stream = io.open(os.path.join(output_dir, optrecord.html_file_name(filename)), 'w', encoding='utf-8')
@@ -191,10 +245,21 @@ function toggleExpandedMessage(e) {{
 
 
 class IndexRenderer:
-    def __init__(self, output_dir, should_display_hotness, max_hottest_remarks_on_index):
-        self.stream = io.open(os.path.join(output_dir, 'index.html'), 'w', encoding='utf-8')
+    """
+    Renders the index as pages of at most `page_size` remarks each,
+    index.html being the first page and index-N.html the N-th.
+    """
+    def __init__(self, output_dir, should_display_hotness, max_hottest_remarks_on_index, page_size):
+        self.output_dir = output_dir
         self.should_display_hotness = should_display_hotness
         self.max_hottest_remarks_on_index = max_hottest_remarks_on_index
+        self.page_size = page_size
+
+    @staticmethod
+    def page_name(page):
+        if page == 1:
+            return 'index.html'
+        return 'index-{}.html'.format(page)
 
     def render_entry(self, r, odd):
         escaped_name = html.escape(r.DemangledFunctionName)
@@ -206,14 +271,32 @@ class IndexRenderer:
 <td class=\"column-entry-{r.color}\">{r.PassWithDiffPrefix}</td>
 </tr>'''.format(**locals()), file=self.stream)
 
-    def render(self, all_remarks):
+    def render_navigation(self, page, num_pages):
+        if num_pages == 1:
+            return
+        links = []
+        if page > 1:
+            links.append(u'<a href="{}">Previous</a>'.format(
+                self.page_name(page - 1)))
+        links.append(u'Page {} of {}'.format(page, num_pages))
+        if page < num_pages:
+            links.append(u'<a href="{}">Next</a>'.format(
+                self.page_name(page + 1)))
+        print(u'''
+<div class="centered">{}</div>'''.format(' | '.join(links)), file=self.stream)
+
+    def render_page(self, remarks, first, page, num_pages):
+        optrecord.Remark.prefetch_demangled(remarks)
+        self.stream = io.open(os.path.join(self.output_dir, self.page_name(page)), 'w', encoding='utf-8')
         print(u'''
 <html>
 <meta charset="utf-8" />
 <head>
 <link rel='stylesheet' type='text/css' href='style.css'>
 </head>
-<body>
+<body>''', file=self.stream)
+        self.render_navigation(page, num_pages)
+        print(u'''
 <div class="centered">
 <table>
 <tr>
@@ -223,50 +306,131 @@ class IndexRenderer:
 <td>Pass</td>
 </tr>''', file=self.stream)
 
-        max_entries = None
-        if self.should_display_hotness:
-            max_entries = self.max_hottest_remarks_on_index
-
-        for i, remark in enumerate(all_remarks[:max_entries]):
+        for i, remark in enumerate(remarks, start=first):
             if not suppress(remark):
                 self.render_entry(remark, i % 2)
         print(u'''
 </table>
+</div>''', file=self.stream)
+        self.render_navigation(page, num_pages)
+        print(u'''
 </body>
 </html>''', file=self.stream)
-
-
-def _render_file(source_dir, output_dir, ctx, no_highlight, entry, filter_):
+        self.stream.close()
+
+    def render(self, store, sorted_indices, manifest):
+        """
+        Renders the pages of the index whose remarks changed since the
+        manifest was written, and returns the digests of all of them.  The
+        remarks are given as their indices in the store, and only the
+        remarks of one page are built at a time.
+        """
+        max_entries = None
+        if self.should_display_hotness:
+            max_entries = self.max_hottest_remarks_on_index
+        indices = sorted_indices[:max_entries]
+
+        num_pages = max(1, (len(indices) + self.page_size - 1) // self.page_size)
+        pages = {}
+        for page in range(1, num_pages + 1):
+            first = (page - 1) * self.page_size
+            page_remarks = [optrecord.store_remark(store, i)
+                            for i in indices[first:first + self.page_size]]
+            name = self.page_name(page)
+            pages[name] = digest(MANIFEST_VERSION,
+                                 optrecord.Remark.get_demangler().name,
+                                 num_pages, page,
+                                 [remark_digest_parts(r)
+                                  for r in page_remarks])
+            if not is_up_to_date(self.output_dir, name, manifest.get(name),
+                                 pages[name]):
+                self.render_page(page_remarks, first, page, num_pages)
+        return pages
+
+
+def _render_file(source_dir, output_dir, ctx, no_highlight, entry, filter_,
+                 store):
     global context
     context = ctx
-    filename, remarks = entry
-    SourceFileRenderer(source_dir, output_dir, filename, no_highlight).render(remarks)
-
-
-def map_remarks(all_remarks):
+    demangler = optrecord.Remark.demangler
+    if ctx.demangler and (not demangler or demangler.name != ctx.demangler):
+        optrecord.Remark.set_demangler(ctx.demangler)
+    filename, indices, old_digest = entry
+    page = optrecord.html_file_name(filename)
+    remarks = defaultdict(list)
+    for i in indices:
+        remark = optrecord.store_remark(store, i)
+        remarks[remark.Line].append(remark)
+
+    existing_filename = find_source_file(source_dir, filename)
+    source = None
+    if existing_filename:
+        with open(existing_filename, 'rb') as f:
+            source = f.read()
+    new_digest = digest(MANIFEST_VERSION, optrecord.Remark.get_demangler().name,
+                        no_highlight, filename, source,
+                        [(context.caller_loc.get(r.Function),
+                          remark_digest_parts(r))
+                         for line in sorted(remarks) for r in remarks[line]])
+    if not is_up_to_date(output_dir, page, old_digest, new_digest):
+        optrecord.Remark.prefetch_demangled(
+            r for line_remarks in remarks.values() for r in line_remarks)
+        SourceFileRenderer(source_dir, output_dir, filename, no_highlight).render(remarks)
+    return page, new_digest
+
+
+def map_remarks(store):
     # Set up a map between function names and their source location for
     # function where inlining happened
-    for remark in optrecord.itervalues(all_remarks):
-        if isinstance(remark, optrecord.Passed) and remark.Pass == "inline" and remark.Name == "Inlined":
-            for arg in remark.Args:
-                arg_dict = dict(list(arg))
-                caller = arg_dict.get('Caller')
-                if caller:
-                    try:
-                        context.caller_loc[caller] = arg_dict['DebugLoc']
-                    except KeyError:
-                        pass
-
-
-def generate_report(all_remarks,
-                    file_remarks,
+    string = store.string
+    for i in range(len(store)):
+        if string(store.tag[i]) == optrecord.Passed.yaml_tag and \
+                string(store.pass_[i]) == "inline" and \
+                string(store.name[i]) == "Inlined":
+            for j in range(store.args_start[i], store.args_start[i + 1]):
+                if string(store.arg_key[j]) != 'Caller':
+                    continue
+                caller = string(store.arg_value[j])
+                if caller and store.arg_file[j] != optstore.NO_FILE:
+                    context.caller_loc[caller] = (
+                        ('File', string(store.arg_file[j])),
+                        ('Line', store.arg_line[j]),
+                        ('Column', store.arg_column[j]))
+
+
+def sort_remarks(store, should_display_hotness):
+    """Returns the indices of the remarks of the store, in the order the index
+    lists them."""
+    string = store.string
+
+    def pass_with_diff_prefix(i):
+        added = store.added[i]
+        if added == optstore.NOT_DIFF:
+            return string(store.pass_[i])
+        return ('+' if added else '-') + string(store.pass_[i])
+
+    def location_key(i):
+        return (string(store.file[i]), store.line[i], store.column[i],
+                pass_with_diff_prefix(i), string(store.tag[i]),
+                string(store.function[i]))
+
+    if should_display_hotness:
+        return sorted(range(len(store)),
+                      key=lambda i: (store.hotness[i],) + location_key(i),
+                      reverse=True)
+    return sorted(range(len(store)), key=location_key)
+
+
+def generate_report(store,
+                    file_indices,
                     source_dir,
                     output_dir,
                     no_highlight,
                     should_display_hotness,
                     max_hottest_remarks_on_index,
                     num_jobs,
-                    should_print_progress):
+                    should_print_progress,
+                    index_page_size=1000):
     try:
         os.makedirs(output_dir)
     except OSError as e:
@@ -277,11 +441,10 @@ def generate_report(all_remarks,
 
     if should_print_progress:
         print('Rendering index page...')
-    if should_display_hotness:
-        sorted_remarks = sorted(optrecord.itervalues(all_remarks), key=lambda r: (r.Hotness, r.File, r.Line, r.Column, r.PassWithDiffPrefix, r.yaml_tag, r.Function), reverse=True)
-    else:
-        sorted_remarks = sorted(optrecord.itervalues(all_remarks), key=lambda r: (r.File, r.Line, r.Column, r.PassWithDiffPrefix, r.yaml_tag, r.Function))
-    IndexRenderer(output_dir, should_display_hotness, max_hottest_remarks_on_index).render(sorted_remarks)
+    sorted_indices = sort_remarks(store, should_display_hotness)
+    manifest = read_manifest(output_dir)
+    pages = IndexRenderer(output_dir, should_display_hotness, max_hottest_remarks_on_index,
+                          index_page_size).render(store, sorted_indices, manifest)
 
     shutil.copy(os.path.join(os.path.dirname(os.path.realpath(__file__)),
             "style.css"), output_dir)
@@ -289,10 +452,25 @@ def generate_report(all_remarks,
     _render_file_bound = functools.partial(_render_file, source_dir, output_dir, context, no_highlight)
     if should_print_progress:
         print('Rendering HTML files...')
-    optpmap.pmap(_render_file_bound,
-                 file_remarks.items(),
-                 num_jobs,
-                 should_print_progress)
+    # Only the pages whose digest changed are rendered again.
+    # The store is sent once to each process, which builds the remarks of
+    # one file at a time.
+    entries = [(filename, indices, manifest.get(optrecord.html_file_name(filename)))
+               for filename, indices in file_indices.items()]
+    pages.update(optpmap.pmap(_render_file_bound,
+                              entries,
+                              num_jobs,
+                              should_print_progress,
+                              shared=store))
+
+    # Remove the pages of a previous run that are not part of this one.
+    for page in manifest:
+        if page not in pages:
+            try:
+                os.remove(os.path.join(output_dir, page))
+            except OSError:
+                pass
+    write_manifest(output_dir, pages)
 
 
 def main():
@@ -331,7 +509,12 @@ def main():
         '--max-hottest-remarks-on-index',
         default=1000,
         type=int,
-        help='Maximum number of the hottest remarks to appear on the index page')
+        help='Maximum number of the hottest remarks to appear on the index')
+    parser.add_argument(
+        '--index-page-size',
+        default=1000,
+        type=int,
+        help='Maximum number of remarks on each page of the index')
     parser.add_argument(
         '--no-highlight',
         action='store_true',
@@ -339,12 +522,19 @@ def main():
         help='Do not use a syntax highlighter when rendering the source code')
     parser.add_argument(
         '--demangler',
-        help='Set the demangler to be used (defaults to %s)' % optrecord.Remark.default_demangler)
+        help='Set the demangler to be used (defaults to %s), or "%s" to '
+             'demangle in-process with the LLVM shared library' %
+             (optrecord.Remark.default_demangler, optdemangle.IN_PROCESS))
 
     parser.add_argument(
         '--filter',
         default='',
         help='Only display remarks from passes matching filter expression')
+    parser.add_argument(
+        '--save-index',
+        metavar='FILE',
+        help='Save the remarks that were read to a remark index file, which '
+             'can be passed instead of the optimization record files later')
 
     # Do not make this a global variable.  Values needed to be propagated through
     # to individual classes and functions to be portable with multiprocessing across
@@ -354,26 +544,29 @@ def main():
     print_progress = not args.no_progress_indicator
     if args.demangler:
         optrecord.Remark.set_demangler(args.demangler)
+        context.demangler = args.demangler
 
     files = optrecord.find_opt_files(*args.yaml_dirs_or_files)
     if not files:
-        parser.error("No *.opt.yaml files found")
+        parser.error("No *.opt.yaml or *.opt.bitstream files found")
         sys.exit(1)
 
-    all_remarks, file_remarks, should_display_hotness = \
-        optrecord.gather_results(files, args.jobs, print_progress, args.filter)
+    store, file_indices, should_display_hotness = \
+        optrecord.gather_results(files, args.jobs, print_progress, args.filter,
+                                 args.save_index)
 
-    map_remarks(all_remarks)
+    map_remarks(store)
 
-    generate_report(all_remarks,
-                    file_remarks,
+    generate_report(store,
+                    file_indices,
                     args.source_dir,
                     args.output_dir,
                     args.no_highlight,
                     should_display_hotness,
                     args.max_hottest_remarks_on_index,
                     args.jobs,
-                    print_progress)
+                    print_progress,
+                    args.index_page_size)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+
+"""
+A streaming reader for optimization records in LLVM's bitstream remark format,
+as written by -fsave-optimization-record=bitstream and
+-pass-remarks-format=bitstream.
+
+A remark file starts with the "RMRK" magic, followed by a BLOCKINFO block, a
+META block and one REMARK block per remark.  All strings are indices into a
+string table, which comes from one of two places:
+
+  * Standalone files carry it in their own META block.
+  * Files written next to an object file only contain the remarks.  The
+    string table and the path of the remark file are in the object's
+    __LLVM,__remarks section instead.
+
+The remarks are read one block at a time from a memory-mapped file and
+returned as (type, fields) pairs, where fields has the same keys and nesting
+as the YAML representation of the remark.
+"""
+
+import mmap
+import os
+import struct
+
+CONTAINER_MAGIC = b'RMRK'
+MACHO_MAGIC = b'\xcf\xfa\xed\xfe'
+
+# BitstreamRemarkContainerType
+SEPARATE_REMARKS_META = 0
+SEPARATE_REMARKS_FILE = 1
+STANDALONE = 2
+
+BLOCKINFO_BLOCK_ID = 0
+META_BLOCK_ID = 8
+REMARK_BLOCK_ID = 9
+
+RECORD_META_CONTAINER_INFO = 1
+RECORD_META_REMARK_VERSION = 2
+RECORD_META_STRTAB = 3
+RECORD_META_EXTERNAL_FILE = 4
+RECORD_REMARK_HEADER = 5
+RECORD_REMARK_DEBUG_LOC = 6
+RECORD_REMARK_HOTNESS = 7
+RECORD_REMARK_ARG_WITH_DEBUGLOC = 8
+RECORD_REMARK_ARG_WITHOUT_DEBUGLOC = 9
+
+# The YAML tags of llvm::remarks::Type, which starts with Unknown.
+REMARK_TYPES = [None, '!Passed', '!Missed', '!Analysis', '!AnalysisFPCommute',
+                '!AnalysisAliasing', '!Failure']
+
+# Builtin abbreviation IDs.
+END_BLOCK = 0
+ENTER_SUBBLOCK = 1
+DEFINE_ABBREV = 2
+UNABBREV_RECORD = 3
+
+# Abbreviation operand encodings.
+FIXED = 1
+VBR = 2
+ARRAY = 3
+CHAR6 = 4
+BLOB = 5
+
+BLOCKINFO_CODE_SETBID = 1
+
+_CHAR6 = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789._'
+
+
+class BitstreamError(Exception):
+    pass
+
+
+class BitstreamReader:
+    """Reads fixed and variable width fields, least significant bit first."""
+
+    def __init__(self, data, start=0):
+        self.data = data
+        self.pos = start * 8
+        self.end = len(data) * 8
+
+    def at_end(self):
+        return self.pos >= self.end
+
+    def read(self, width):
+        pos = self.pos
+        self.pos = pos + width
+        if self.pos > self.end:
+            raise BitstreamError('unexpected end of bitstream')
+        if not width:
+            return 0
+        # Fields are at most 64 bits wide.
+        value = int.from_bytes(self.data[pos >> 3:(pos >> 3) + 9], 'little')
+        return (value >> (pos & 7)) & ((1 << width) - 1)
+
+    def read_vbr(self, width):
+        high_bit = 1 << (width - 1)
+        value = 0
+        shift = 0
+        while True:
+            piece = self.read(width)
+            value |= (piece & (high_bit - 1)) << shift
+            if not piece & high_bit:
+                return value
+            shift += width - 1
+
+    def align32(self):
+        self.pos = (self.pos + 31) & ~31
+
+    def read_bytes(self, size):
+        start = self.pos >> 3
+        self.pos += size * 8
+        if self.pos > self.end:
+            raise BitstreamError('unexpected end of bitstream')
+        return bytes(self.data[start:start + size])
+
+    def read_abbrev(self):
+        """Returns the operands of a DEFINE_ABBREV as (encoding, value) pairs,
+        where the encoding is None for literals."""
+        ops = []
+        for _ in range(self.read_vbr(5)):
+            if self.read(1):
+                ops.append((None, self.read_vbr(8)))
+                continue
+            encoding = self.read(3)
+            if encoding in (FIXED, VBR):
+                ops.append((encoding, self.read_vbr(5)))
+            elif encoding in (ARRAY, CHAR6, BLOB):
+                ops.append((encoding, None))
+            else:
+                raise BitstreamError('invalid abbreviation encoding %d' %
+                                     encoding)
+        return ops
+
+    def _read_scalar(self, encoding, width):
+        if encoding is None:
+            return width
+        if encoding == FIXED:
+            return self.read(width)
+        if encoding == VBR:
+            return self.read_vbr(width)
+        if encoding == CHAR6:
+            return ord(_CHAR6[self.read(6)])
+        raise BitstreamError('invalid array element encoding %d' % encoding)
+
+    def read_record(self, abbrev_id, abbrevs):
+        """Returns (code, [operands], blob or None)."""
+        if abbrev_id == UNABBREV_RECORD:
+            code = self.read_vbr(6)
+            return code, [self.read_vbr(6) for _ in range(self.read_vbr(6))], None
+        try:
+            ops = abbrevs[abbrev_id - 4]
+        except IndexError:
+            raise BitstreamError('undefined abbreviation %d' % abbrev_id)
+        values = []
+        blob = None
+        i = 0
+        while i < len(ops):
+            encoding, width = ops[i]
+            if encoding == ARRAY:
+                i += 1
+                element = ops[i]
+                for _ in range(self.read_vbr(6)):
+                    values.append(self._read_scalar(*element))
+            elif encoding == BLOB:
+                size = self.read_vbr(6)
+                self.align32()
+                blob = self.read_bytes(size)
+                self.align32()
+            else:
+                values.append(self._read_scalar(encoding, width))
+            i += 1
+        return values[0], values[1:], blob
+
+    def enter_block(self):
+        """Reads the rest of an ENTER_SUBBLOCK, returning (block ID, abbrev
+        width, end position in bits)."""
+        block_id = self.read_vbr(8)
+        width = self.read_vbr(4)
+        self.align32()
+        num_words = self.read(32)
+        return block_id, width, self.pos + num_words * 32
+
+    def read_blockinfo(self, width, blockinfo):
+        current = None
+        while True:
+            abbrev_id = self.read(width)
+            if abbrev_id == END_BLOCK:
+                self.align32()
+                return
+            if abbrev_id == DEFINE_ABBREV:
+                if current is None:
+                    raise BitstreamError('abbreviation before SETBID')
+                blockinfo.setdefault(current, []).append(self.read_abbrev())
+                continue
+            if abbrev_id == ENTER_SUBBLOCK:
+                self.pos = self.enter_block()[2]
+                continue
+            code, values, _ = self.read_record(abbrev_id, [])
+            if code == BLOCKINFO_CODE_SETBID:
+                current = values[0]
+
+    def records(self, block_id, width, blockinfo):
+        """Yields the (code, operands, blob) records of the block being read,
+        skipping nested blocks."""
+        abbrevs = list(blockinfo.get(block_id, []))
+        while True:
+            abbrev_id = self.read(width)
+            if abbrev_id == END_BLOCK:
+                self.align32()
+                return
+            if abbrev_id == ENTER_SUBBLOCK:
+                self.pos = self.enter_block()[2]
+            elif abbrev_id == DEFINE_ABBREV:
+                abbrevs.append(self.read_abbrev())
+            else:
+                yield self.read_record(abbrev_id, abbrevs)
+
+
+class RemarkContainer:
+    """The contents of the META block of a remark container."""
+
+    def __init__(self, records):
+        self.container_type = None
+        self.strtab = None
+        self.external_file = None
+        for code, values, blob in records:
+            if code == RECORD_META_CONTAINER_INFO:
+                self.container_type = values[1]
+            elif code == RECORD_META_STRTAB:
+                # Each string is null-terminated.
+                self.strtab = blob.decode('utf-8').split('\0')[:-1]
+            elif code == RECORD_META_EXTERNAL_FILE:
+                self.external_file = blob.decode('utf-8')
+
+
+def _open_container(data):
+    """Returns the reader positioned after the META block, the container and
+    the abbreviations from the BLOCKINFO block."""
+    if data[:4] != CONTAINER_MAGIC:
+        raise BitstreamError('not a bitstream remark file')
+    reader = BitstreamReader(data, 4)
+    blockinfo = {}
+    while True:
+        if reader.read(2) != ENTER_SUBBLOCK:
+            raise BitstreamError('expected a block')
+        block_id, width, end = reader.enter_block()
+        if block_id == BLOCKINFO_BLOCK_ID:
+            reader.read_blockinfo(width, blockinfo)
+        elif block_id == META_BLOCK_ID:
+            container = RemarkContainer(
+                reader.records(META_BLOCK_ID, width, blockinfo))
+            return reader, container, blockinfo
+        else:
+            reader.pos = end
+
+
+def _read_remark(records, strtab):
+    fields = {}
+    args = []
+    remark_type = None
+    for code, values, _ in records:
+        if code == RECORD_REMARK_HEADER:
+            remark_type = REMARK_TYPES[values[0]]
+            fields['Name'] = strtab[values[1]]
+            fields['Pass'] = strtab[values[2]]
+            fields['Function'] = strtab[values[3]]
+        elif code == RECORD_REMARK_DEBUG_LOC:
+            fields['DebugLoc'] = {'File': strtab[values[0]],
+                                  'Line': values[1], 'Column': values[2]}
+        elif code == RECORD_REMARK_HOTNESS:
+            fields['Hotness'] = values[0]
+        elif code == RECORD_REMARK_ARG_WITH_DEBUGLOC:
+            args.append({strtab[values[0]]: strtab[values[1]],
+                         'DebugLoc': {'File': strtab[values[2]],
+                                      'Line': values[3],
+                                      'Column': values[4]}})
+        elif code == RECORD_REMARK_ARG_WITHOUT_DEBUGLOC:
+            args.append({strtab[values[0]]: strtab[values[1]]})
+    fields['Args'] = args
+    return remark_type, fields
+
+
+def _iter_remark_blocks(reader, blockinfo, strtab):
+    while not reader.at_end():
+        if reader.read(2) != ENTER_SUBBLOCK:
+            raise BitstreamError('expected a block')
+        block_id, width, end = reader.enter_block()
+        if block_id == REMARK_BLOCK_ID:
+            yield _read_remark(
+                reader.records(REMARK_BLOCK_ID, width, blockinfo), strtab)
+        else:
+            reader.pos = end
+
+
+def get_macho_remarks_section(data):
+    """Returns the contents of the __LLVM,__remarks section of a 64-bit
+    little-endian Mach-O object, or None."""
+    if data[:4] != MACHO_MAGIC:
+        return None
+    ncmds, = struct.unpack_from('<I', data, 16)
+    offset = 32
+    for _ in range(ncmds):
+        cmd, cmdsize = struct.unpack_from('<II', data, offset)
+        # LC_SEGMENT_64
+        if cmd == 0x19:
+            nsects, = struct.unpack_from('<I', data, offset + 64)
+            for i in range(nsects):
+                sect = offset + 72 + i * 80
+                sectname, segname, _, size, fileoff = struct.unpack_from(
+                    '<16s16sQQI', data, sect)
+                if segname.rstrip(b'\0') == b'__LLVM' and \
+                        sectname.rstrip(b'\0') == b'__remarks':
+                    return bytes(data[fileoff:fileoff + size])
+        offset += cmdsize
+    return None
+
+
+def _map_file(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def is_bitstream_file(path):
+    with open(path, 'rb') as f:
+        return f.read(4) in (CONTAINER_MAGIC, MACHO_MAGIC)
+
+
+def _find_separate_meta(path):
+    """Finds the metadata of a remark file written next to an object file,
+    which clang names after the object file."""
+    base = path
+    for suffix in ('.opt.bitstream', '.bitstream'):
+        if path.endswith(suffix):
+            base = path[:-len(suffix)]
+            break
+    for candidate in (base + '.o', base + '.obj'):
+        if os.path.isfile(candidate):
+            meta = get_macho_remarks_section(_map_file(candidate))
+            if meta is not None:
+                return meta
+    raise BitstreamError(
+        '{}: the string table of these remarks is in the __LLVM,__remarks '
+        'section of the object file, which was not found; pass the object '
+        'file instead'.format(path))
+
+
+def iter_remarks(path):
+    """
+    Yields the (YAML tag, fields) pairs of the remarks in a bitstream remark
+    file, or in the remark file referenced by a Mach-O object.
+    """
+    data = _map_file(path)
+    section = get_macho_remarks_section(data)
+    if section is not None:
+        data = section
+    reader, container, blockinfo = _open_container(data)
+    strtab = container.strtab
+
+    if container.container_type == SEPARATE_REMARKS_FILE:
+        _, meta, _ = _open_container(_find_separate_meta(path))
+        strtab = meta.strtab
+    elif container.container_type == SEPARATE_REMARKS_META:
+        remarks_path = container.external_file
+        if not os.path.exists(remarks_path):
+            remarks_path = os.path.join(os.path.dirname(path),
+                                        os.path.basename(remarks_path))
+        reader, _, blockinfo = _open_container(_map_file(remarks_path))
+    if strtab is None:
+        raise BitstreamError('{}: missing string table'.format(path))
+
+    for remark in _iter_remark_blocks(reader, blockinfo, strtab):
+        yield remark
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+"""
+Demangling of the function names of remarks.
+
+A demangler caches every name it demangled, so each name is demangled once
+per process, and demangles the names it has not seen in batches: one run of
+an external demangler such as c++filt demangles a whole batch.  Each process
+has its own demangler, so no pipe or lock is shared between the processes
+of optpmap.
+"""
+
+from __future__ import print_function
+
+import ctypes
+import ctypes.util
+import subprocess
+import sys
+
+# The name of the in-process demangler.
+IN_PROCESS = 'llvm'
+
+# Mangled name of `char *llvm::itaniumDemangle(const char *mangled_name,
+# char *buf, size_t *n, int *status)`.
+_ITANIUM_DEMANGLE = '_ZN4llvm15itaniumDemangleEPKcPcPmPi'
+
+
+class Demangler(object):
+    def __init__(self, name):
+        self.name = name
+        self.cache = {}
+
+    def demangle(self, name):
+        try:
+            return self.cache[name]
+        except KeyError:
+            self.prefetch([name])
+            return self.cache[name]
+
+    def prefetch(self, names):
+        """Demangle the names that are not cached yet, in one batch."""
+        missing = list(set(name for name in names if name not in self.cache))
+        if missing:
+            self.cache.update(zip(missing, self.demangle_batch(missing)))
+
+    def demangle_batch(self, names):
+        raise NotImplementedError
+
+
+class CommandDemangler(Demangler):
+    """Runs a demangler that reads a name per line, such as c++filt -n."""
+    def __init__(self, name, command=None):
+        Demangler.__init__(self, name)
+        self.command = command or name
+
+    def demangle_batch(self, names):
+        if not self.command:
+            return names
+        try:
+            proc = subprocess.Popen(self.command.split(),
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE)
+        except OSError as e:
+            print('Cannot run demangler {}: {}'.format(self.command, e),
+                  file=sys.stderr)
+            self.command = None
+            return names
+        out, _ = proc.communicate(('\n'.join(names) + '\n').encode('utf-8'))
+        demangled = out.decode('utf-8').splitlines()
+        if len(demangled) != len(names):
+            return names
+        return [d.rstrip() for d in demangled]
+
+
+class LLVMDemangler(Demangler):
+    """Calls llvm::itaniumDemangle of the LLVM shared library."""
+    def __init__(self, library):
+        Demangler.__init__(self, IN_PROCESS)
+        self._demangle = getattr(library, _ITANIUM_DEMANGLE)
+        self._demangle.restype = ctypes.c_void_p
+        self._demangle.argtypes = [ctypes.c_char_p, ctypes.c_void_p,
+                                   ctypes.c_void_p, ctypes.c_void_p]
+        self._free = ctypes.CDLL(ctypes.util.find_library('c')).free
+        self._free.argtypes = [ctypes.c_void_p]
+
+    def demangle_batch(self, names):
+        demangled = []
+        for name in names:
+            # Like llvm::demangle(), leave names alone that are not Itanium
+            # encoded: itaniumDemangle() would take 'x' for 'long long'.
+            result = None
+            if name.startswith(('_Z', '__Z', '___Z', '____Z')):
+                result = self._demangle(name.encode('utf-8'), None, None, None)
+            if result:
+                demangled.append(
+                    ctypes.string_at(result).decode('utf-8', 'replace'))
+                self._free(result)
+            else:
+                demangled.append(name)
+        return demangled
+
+
+def _load_llvm():
+    for name in ('LLVMDemangle', 'LLVM'):
+        path = ctypes.util.find_library(name)
+        if not path:
+            continue
+        try:
+            library = ctypes.CDLL(path)
+            getattr(library, _ITANIUM_DEMANGLE)
+            return library
+        except (OSError, AttributeError):
+            pass
+    # Versioned libraries such as libLLVM-14.so are not found by
+    # find_library('LLVM').
+    try:
+        output = subprocess.check_output(['llvm-config', '--libdir',
+                                          '--shared-mode'])
+        libdir, mode = output.decode('utf-8').split()
+        if mode == 'shared':
+            version = subprocess.check_output(['llvm-config', '--version'])
+            major = version.decode('utf-8').split('.')[0]
+            library = ctypes.CDLL('{}/libLLVM-{}.so'.format(libdir, major))
+            getattr(library, _ITANIUM_DEMANGLE)
+            return library
+    except (OSError, ValueError, AttributeError,
+            subprocess.CalledProcessError):
+        pass
+    return None
+
+
+def create_demangler(name):
+    """
+    Returns a demangler running the given command, or the in-process
+    demangler of the LLVM shared library for IN_PROCESS.
+    """
+    if name == IN_PROCESS:
+        library = _load_llvm()
+        if library:
+            return LLVMDemangler(library)
+        print('Cannot load llvm::itaniumDemangle, using llvm-cxxfilt',
+              file=sys.stderr)
+        return CommandDemangler(IN_PROCESS, 'llvm-cxxfilt -n')
+    return CommandDemangler(name)
@@ -4,13 +4,16 @@ import multiprocessing
 
 _current = None
 _total = None
+_shared = None
 
 
-def _init(current, total):
+def _init(current, total, shared):
     global _current
     global _total
+    global _shared
     _current = current
     _total = total
+    _shared = shared
 
 
 def _wrapped_func(func_and_args):
@@ -22,10 +25,13 @@ def _wrapped_func(func_and_args):
         sys.stdout.write('\r\t{} of {}'.format(_current.value, _total.value))
         sys.stdout.flush()
 
+    if _shared is not None:
+        return func(argument, filter_, _shared)
     return func(argument, filter_)
 
 
-def pmap(func, iterable, processes, should_print_progress, filter_=None, *args, **kwargs):
+def pmap(func, iterable, processes, should_print_progress, filter_=None,
+         shared=None, *args, **kwargs):
     """
     A parallel map function that reports on its progress.
 
@@ -33,19 +39,26 @@ def pmap(func, iterable, processes, should_print_progress, filter_=None, *args,
     results. If `processes` is greater than one, a process pool is used to run
     the functions in parallel. `should_print_progress` is a boolean value that
     indicates whether a string 'N of M' should be printed to indicate how many
-    of the functions have finished being run.
+    of the functions have finished being run.  If `shared` is not None, it is
+    sent once to each process rather than with every item, and passed to
+    `func` as a third argument.
     """
     global _current
     global _total
+    global _shared
     _current = multiprocessing.Value('i', 0)
     _total = multiprocessing.Value('i', len(iterable))
 
     func_and_args = [(func, arg, should_print_progress, filter_) for arg in iterable]
     if processes == 1:
-        result = list(map(_wrapped_func, func_and_args, *args, **kwargs))
+        _shared = shared
+        try:
+            result = list(map(_wrapped_func, func_and_args, *args, **kwargs))
+        finally:
+            _shared = None
     else:
         pool = multiprocessing.Pool(initializer=_init,
-                                    initargs=(_current, _total,),
+                                    initargs=(_current, _total, shared),
                                     processes=processes)
         result = pool.map(_wrapped_func, func_and_args, *args, **kwargs)
         pool.close()
@@ -14,10 +14,7 @@ except ImportError:
 import html
 from collections import defaultdict
 import fnmatch
-import functools
-from multiprocessing import Lock
 import os, os.path
-import subprocess
 try:
     # The previously builtin function `intern()` was moved
     # to the `sys` module in Python 3.
@@ -27,7 +24,10 @@ except:
 
 import re
 
+import optbitstream
+import optdemangle
 import optpmap
+import optstore
 
 try:
     dict.iteritems
@@ -58,19 +58,33 @@ class Remark(yaml.YAMLObject):
     yaml_loader = Loader
 
     default_demangler = 'c++filt -n'
-    demangler_proc = None
+    demangler = None
 
     @classmethod
     def set_demangler(cls, demangler):
-        cls.demangler_proc = subprocess.Popen(demangler.split(), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        cls.demangler_lock = Lock()
+        cls.demangler = optdemangle.create_demangler(demangler)
+
+    @classmethod
+    def get_demangler(cls):
+        if not cls.demangler:
+            cls.set_demangler(cls.default_demangler)
+        return cls.demangler
 
     @classmethod
     def demangle(cls, name):
-        with cls.demangler_lock:
-            cls.demangler_proc.stdin.write((name + '\n').encode('utf-8'))
-            cls.demangler_proc.stdin.flush()
-            return cls.demangler_proc.stdout.readline().rstrip().decode('utf-8')
+        return cls.get_demangler().demangle(name)
+
+    @classmethod
+    def prefetch_demangled(cls, remarks):
+        """Demangle the names the given remarks display, in one batch."""
+        names = []
+        for remark in remarks:
+            names.append(remark.Function)
+            for arg in remark.Args:
+                for key, value in arg:
+                    if key == 'Caller' or key == 'Callee' or key == 'DirectCallee':
+                        names.append(value)
+        cls.get_demangler().prefetch(names)
 
     # Intern all strings since we have lot of duplication across filenames,
     # remark text.
@@ -166,7 +180,8 @@ class Remark(yaml.YAMLObject):
             return u"<a href={}>{}</a>".format(
                 make_link(dl_dict['File'], dl_dict['Line']), value)
         else:
-            return value
+            # Values read from YAML may be numbers or booleans.
+            return str(value)
 
     # Return a cached dictionary for the arguments.  The key for each entry is
     # the argument key (e.g. 'Callee' for inlining remarks.  The value is a
@@ -268,66 +283,102 @@ class Missed(Remark):
 class Failure(Missed):
     yaml_tag = '!Failure'
 
-def get_remarks(input_file, filter_=None):
-    max_hotness = 0
-    all_remarks = dict()
-    file_remarks = defaultdict(functools.partial(defaultdict, list))
-
-    with io.open(input_file, encoding = 'utf-8') as f:
-        docs = yaml.load_all(f, Loader=Loader)
-
-        filter_e = None
-        if filter_:
-            filter_e = re.compile(filter_)
-        for remark in docs:
-            remark.canonicalize()
-            # Avoid remarks withoug debug location or if they are duplicated
-            if not hasattr(remark, 'DebugLoc') or remark.key in all_remarks:
-                continue
+remark_classes = dict((cls.yaml_tag, cls) for cls in
+                      (Analysis, AnalysisFPCommute, AnalysisAliasing, Passed,
+                       Missed, Failure))
+
+def make_remark(tag, fields):
+    """Build the Remark for the YAML tag and fields of a remark."""
+    # Build the object the way PyYAML does for a YAMLObject.
+    remark = remark_classes[tag].__new__(remark_classes[tag])
+    remark.__dict__.update(fields)
+    return remark
+
+def load_remarks(input_file):
+    """Yields the remarks of a YAML or bitstream optimization record file."""
+    if optbitstream.is_bitstream_file(input_file):
+        for tag, fields in optbitstream.iter_remarks(input_file):
+            if tag in remark_classes:
+                yield make_remark(tag, fields)
+    else:
+        with io.open(input_file, encoding = 'utf-8') as f:
+            for remark in yaml.load_all(f, Loader=Loader):
+                yield remark
 
-            if filter_e and not filter_e.search(remark.Pass):
-                continue
-
-            all_remarks[remark.key] = remark
-
-            file_remarks[remark.File][remark.Line].append(remark)
-
-            # If we're reading a back a diff yaml file, max_hotness is already
-            # captured which may actually be less than the max hotness found
-            # in the file.
-            if hasattr(remark, 'max_hotness'):
-                max_hotness = remark.max_hotness
-            max_hotness = max(max_hotness, remark.Hotness)
-
-    return max_hotness, all_remarks, file_remarks
-
-
-def gather_results(filenames, num_jobs, should_print_progress, filter_=None):
+def get_remarks(input_file, filter_=None):
+    """Returns the remarks of a file as a RemarkStore."""
+    store = optstore.RemarkStore()
+
+    filter_e = None
+    if filter_:
+        filter_e = re.compile(filter_)
+    for remark in load_remarks(input_file):
+        if filter_e and not filter_e.search(remark.Pass):
+            continue
+        # Remarks without debug location or that are duplicated are skipped.
+        store.add(remark.yaml_tag, remark.__dict__)
+
+    return store
+
+
+def load_store(filenames, num_jobs, should_print_progress, filter_=None):
+    """
+    Returns a RemarkStore of the remarks of the given optimization record
+    files.  Remark index files written by RemarkStore.save() are opened
+    directly rather than parsed.
+    """
     if should_print_progress:
-        print('Reading YAML files...')
-    if not Remark.demangler_proc:
-        Remark.set_demangler(Remark.default_demangler)
-    remarks = optpmap.pmap(
-        get_remarks, filenames, num_jobs, should_print_progress, filter_)
-    max_hotness = max(entry[0] for entry in remarks)
-
-    def merge_file_remarks(file_remarks_job, all_remarks, merged):
-        for filename, d in iteritems(file_remarks_job):
-            for line, remarks in iteritems(d):
-                for remark in remarks:
-                    # Bring max_hotness into the remarks so that
-                    # RelativeHotness does not depend on an external global.
-                    remark.max_hotness = max_hotness
-                    if remark.key not in all_remarks:
-                        merged[filename][line].append(remark)
-
-    all_remarks = dict()
-    file_remarks = defaultdict(functools.partial(defaultdict, list))
-    for _, all_remarks_job, file_remarks_job in remarks:
-        merge_file_remarks(file_remarks_job, all_remarks, file_remarks)
-        all_remarks.update(all_remarks_job)
-
-    return all_remarks, file_remarks, max_hotness != 0
+        print('Reading optimization record files...')
+    index_files = [f for f in filenames if optstore.is_index_file(f)]
+    record_files = [f for f in filenames if f not in index_files]
+    stores = [optstore.RemarkStore.load(f) for f in index_files]
+    if filter_ and stores:
+        filter_e = re.compile(filter_)
+        for i, indexed in enumerate(stores):
+            filtered = optstore.RemarkStore()
+            for j in range(len(indexed)):
+                if filter_e.search(indexed.string(indexed.pass_[j])):
+                    filtered.add(*indexed.get(j))
+            stores[i] = filtered
+    if record_files:
+        stores += optpmap.pmap(get_remarks, record_files, num_jobs,
+                               should_print_progress, filter_)
+
+    store = optstore.RemarkStore()
+    for other in stores:
+        store.extend(other)
+    return store
+
+
+def store_remark(store, i):
+    """Build the Remark of the i-th remark of a RemarkStore."""
+    remark = make_remark(*store.get(i))
+    remark.canonicalize()
+    # Bring max_hotness into the remarks so that RelativeHotness does not
+    # depend on an external global.
+    remark.max_hotness = store.max_hotness
+    return remark
+
+
+def gather_results(filenames, num_jobs, should_print_progress, filter_=None,
+                   save_index=None):
+    """
+    Returns the RemarkStore of the remarks of the given files, a map from
+    each source file to the indices of its remarks in the store, and whether
+    the remarks have hotness.  The remarks are already unique, and their
+    Remark objects are built with store_remark() as they are rendered.
+    """
+    store = load_store(filenames, num_jobs, should_print_progress, filter_)
+    if save_index:
+        store.save(save_index)
+
+    file_indices = defaultdict(list)
+    for i, file_id in enumerate(store.file):
+        file_indices[file_id].append(i)
+    file_indices = dict((store.string(file_id), indices)
+                        for file_id, indices in file_indices.items())
+
+    return store, file_indices, store.max_hotness != 0
 
 
 def find_opt_files(*dirs_or_files):
@@ -341,6 +392,7 @@ def find_opt_files(*dirs_or_files):
                 subdirs[:] = [d for d in subdirs
                               if not os.path.ismount(os.path.join(dir, d))]
                 for file in files:
-                    if fnmatch.fnmatch(file, "*.opt.yaml*"):
+                    if fnmatch.fnmatch(file, "*.opt.yaml*") or \
+                            fnmatch.fnmatch(file, "*.opt.bitstream"):
                         all.append(os.path.join(dir, file))
     return all
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+
+"""
+A columnar store of optimization remarks.
+
+Every string (pass, remark name, function, file, argument key and value) is
+stored once in a string table and referred to by its index.  A remark is a row
+of integer columns, and its arguments are rows of the argument columns, from
+args_start[i] to args_start[i + 1].  Compared to a Remark object per remark,
+this takes a fraction of the memory and is cheap to send between processes.
+
+A store can be saved to an index file and reopened without reparsing the
+optimization records it was built from.  The columns of a reopened store are
+memory-mapped from the file rather than read into memory.
+"""
+
+import array
+import mmap
+import struct
+import sys
+
+INDEX_MAGIC = b'OPTRIDX\0'
+INDEX_VERSION = 2
+
+# The index file starts with the magic, the version, the byte order of the
+# columns, the number of remarks, arguments and strings, and the maximum
+# hotness, followed by the sections below, each aligned to 8 bytes.
+_HEADER = struct.Struct('<8sIBxxxQQQQ')
+
+# Remark columns, then argument columns, in file order.
+REMARK_COLUMNS = [('tag', 'I'), ('pass_', 'I'), ('name', 'I'),
+                  ('function', 'I'), ('file', 'I'), ('line', 'I'),
+                  ('column', 'I'), ('hotness', 'Q'), ('added', 'b')]
+ARG_COLUMNS = [('arg_key', 'I'), ('arg_value', 'I'), ('arg_type', 'B'),
+               ('arg_file', 'I'), ('arg_line', 'I'), ('arg_column', 'I')]
+
+# The types of argument values, indexed by the arg_type column.  Values are
+# stored as their str() and converted back by get().  LLVM quotes every value,
+# but YAML files from other tools may hold unquoted numbers and booleans;
+# values of any other type are stored as strings.
+ARG_TYPES = [str, int, float, bool]
+
+# The file of an argument without a debug location.
+NO_FILE = 0xffffffff
+
+# The 'added' column of remarks that are not from a diff.
+NOT_DIFF = -1
+
+
+class IndexFileError(Exception):
+    pass
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def is_index_file(path):
+    with open(path, 'rb') as f:
+        return f.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+
+
+class RemarkStore:
+    def __init__(self):
+        self.strings = []
+        self.string_ids = {}
+        for name, typecode in REMARK_COLUMNS + ARG_COLUMNS:
+            setattr(self, name, array.array(typecode))
+        self.args_start = array.array('Q', [0])
+        self.max_hotness = 0
+        # Identifies the remarks already in the store, see add().  A store
+        # received from another process or loaded from an index file has no
+        # keys, and can only be extend()ed into a new store.
+        self.keys = set()
+        self._blob = None
+        self._offsets = None
+
+    def __len__(self):
+        return len(self.tag)
+
+    def __getstate__(self):
+        # The lookup tables are rebuilt by the receiving process.
+        state = dict(self.__dict__)
+        del state['string_ids'], state['keys']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.string_ids = dict((s, i) for i, s in enumerate(self.strings))
+        self.keys = None
+
+    def intern(self, string):
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(string)
+            self.string_ids[string] = string_id
+        return string_id
+
+    def string(self, string_id):
+        if self._blob is None:
+            return self.strings[string_id]
+        string = self.strings[string_id]
+        if string is None:
+            start, end = self._offsets[string_id], self._offsets[string_id + 1]
+            string = self.strings[string_id] = \
+                bytes(self._blob[start:end]).decode('utf-8')
+        return string
+
+    def _arg_value(self, j):
+        value = self.string(self.arg_value[j])
+        arg_type = ARG_TYPES[self.arg_type[j]]
+        if arg_type is bool:
+            return value == 'True'
+        return arg_type(value)
+
+    def add(self, tag, fields):
+        """
+        Add a remark given as its YAML tag and the fields of its YAML
+        mapping, unless it has no debug location or is already in the store.
+        Returns whether it was added.
+        """
+        if 'DebugLoc' not in fields:
+            return False
+        intern = self.intern
+        loc = fields['DebugLoc']
+        args = []
+        for arg in fields.get('Args', []):
+            arg = dict(arg)
+            arg_loc = arg.pop('DebugLoc', None)
+            (key, value), = arg.items()
+            arg_type = (ARG_TYPES.index(type(value))
+                        if type(value) in ARG_TYPES else 0)
+            if arg_loc:
+                args.append((intern(key), intern(str(value)), arg_type,
+                             intern(arg_loc['File']), int(arg_loc['Line']),
+                             int(arg_loc['Column'])))
+            else:
+                args.append((intern(key), intern(str(value)), arg_type,
+                             NO_FILE, 0, 0))
+        added = fields.get('Added')
+        row = (intern(tag), intern(fields['Pass']), intern(fields['Name']),
+               intern(fields['Function']), intern(loc['File']),
+               int(loc['Line']), int(loc['Column']),
+               NOT_DIFF if added is None else int(added))
+        key = row + tuple(args)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+
+        hotness = fields.get('Hotness', 0)
+        # A diff file records the maximum hotness of its inputs.
+        if 'max_hotness' in fields:
+            self.max_hotness = fields['max_hotness']
+        self.max_hotness = max(self.max_hotness, hotness)
+        self._append(row[:7] + (hotness, row[7]), args)
+        return True
+
+    def _append(self, row, args):
+        for (name, _), value in zip(REMARK_COLUMNS, row):
+            getattr(self, name).append(value)
+        for arg in args:
+            for (name, _), value in zip(ARG_COLUMNS, arg):
+                getattr(self, name).append(value)
+        self.args_start.append(len(self.arg_key))
+
+    def extend(self, other):
+        """Add the remarks of another store that are not in this one."""
+        remap = [None] * len(other.strings)
+
+        def intern(string_id):
+            if remap[string_id] is None:
+                remap[string_id] = self.intern(other.string(string_id))
+            return remap[string_id]
+
+        for i in range(len(other)):
+            row = (intern(other.tag[i]), intern(other.pass_[i]),
+                   intern(other.name[i]), intern(other.function[i]),
+                   intern(other.file[i]), other.line[i], other.column[i],
+                   other.added[i])
+            args = []
+            for j in range(other.args_start[i], other.args_start[i + 1]):
+                arg_file = other.arg_file[j]
+                args.append((intern(other.arg_key[j]),
+                             intern(other.arg_value[j]), other.arg_type[j],
+                             NO_FILE if arg_file == NO_FILE
+                             else intern(arg_file),
+                             other.arg_line[j], other.arg_column[j]))
+            key = row + tuple(args)
+            if key in self.keys:
+                continue
+            self.keys.add(key)
+            self._append(row[:7] + (other.hotness[i], row[7]), args)
+        self.max_hotness = max(self.max_hotness, other.max_hotness)
+
+    def key(self, i):
+        """Returns a key of the i-th remark that can be compared with the
+        keys of the remarks of other stores."""
+        string = self.string
+        args = []
+        for j in range(self.args_start[i], self.args_start[i + 1]):
+            arg_file = self.arg_file[j]
+            args.append((string(self.arg_key[j]), string(self.arg_value[j]),
+                         self.arg_type[j],
+                         None if arg_file == NO_FILE else string(arg_file),
+                         self.arg_line[j], self.arg_column[j]))
+        return (string(self.tag[i]), string(self.pass_[i]),
+                string(self.name[i]), string(self.function[i]),
+                string(self.file[i]), self.line[i], self.column[i],
+                self.added[i], tuple(args))
+
+    def get(self, i):
+        """Returns the YAML tag and the fields of the YAML mapping of the i-th
+        remark."""
+        string = self.string
+        fields = {
+            'Pass': string(self.pass_[i]),
+            'Name': string(self.name[i]),
+            'DebugLoc': {'File': string(self.file[i]), 'Line': self.line[i],
+                         'Column': self.column[i]},
+            'Function': string(self.function[i]),
+            'Hotness': self.hotness[i],
+        }
+        args = []
+        for j in range(self.args_start[i], self.args_start[i + 1]):
+            arg = {string(self.arg_key[j]): self._arg_value(j)}
+            if self.arg_file[j] != NO_FILE:
+                arg['DebugLoc'] = {'File': string(self.arg_file[j]),
+                                   'Line': self.arg_line[j],
+                                   'Column': self.arg_column[j]}
+            args.append(arg)
+        fields['Args'] = args
+        if self.added[i] != NOT_DIFF:
+            fields['Added'] = bool(self.added[i])
+        return string(self.tag[i]), fields
+
+    def save(self, path):
+        strings = [self.string(i).encode('utf-8')
+                   for i in range(len(self.strings))]
+        offsets = array.array('Q', [0])
+        for s in strings:
+            offsets.append(offsets[-1] + len(s))
+        sections = [offsets.tobytes(), b''.join(strings)]
+        for name, _ in REMARK_COLUMNS:
+            sections.append(array.array(getattr(self, name).typecode,
+                                        getattr(self, name)).tobytes())
+        sections.append(array.array('Q', self.args_start).tobytes())
+        for name, _ in ARG_COLUMNS:
+            sections.append(array.array(getattr(self, name).typecode,
+                                        getattr(self, name)).tobytes())
+
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(INDEX_MAGIC, INDEX_VERSION,
+                                 sys.byteorder == 'little', len(self),
+                                 len(self.arg_key), len(strings),
+                                 self.max_hotness))
+            offset = _HEADER.size
+            for section in sections:
+                padding = _align(offset) - offset
+                f.write(b'\0' * padding)
+                f.write(section)
+                offset += padding + len(section)
+
+    @classmethod
+    def load(cls, path):
+        """Open an index file written by save()."""
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, little_endian, num_remarks, num_args, num_strings,
+         max_hotness) = _HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise IndexFileError('{}: not a remark index of version {}'.format(
+                path, INDEX_VERSION))
+        if bool(little_endian) != (sys.byteorder == 'little'):
+            raise IndexFileError('{}: written on a machine of different '
+                              'endianness'.format(path))
+
+        view = memoryview(data)
+        offset = [_HEADER.size]
+
+        def section(typecode, count):
+            start = _align(offset[0])
+            size = array.array(typecode).itemsize * count
+            offset[0] = start + size
+            return view[start:start + size].cast(typecode)
+
+        store = cls()
+        store._offsets = section('Q', num_strings + 1)
+        store._blob = section('B', store._offsets[num_strings])
+        store.strings = [None] * num_strings
+        for name, typecode in REMARK_COLUMNS:
+            setattr(store, name, section(typecode, num_remarks))
+        store.args_start = section('Q', num_remarks + 1)
+        for name, typecode in ARG_COLUMNS:
+            setattr(store, name, section(typecode, num_args))
+        store.max_hotness = max_hotness
+        return store
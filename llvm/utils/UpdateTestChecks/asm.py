@@ -1,15 +1,8 @@
 from __future__ import print_function
 import re
-import sys
 
 from . import common
 
-if sys.version_info[0] > 2:
-  class string:
-    expandtabs = str.expandtabs
-else:
-  import string
-
 # RegEx: this is where the magic happens.
 
 ##### Assembly parser
@@ -222,206 +215,122 @@ SCRUB_X86_RIP_RE = re.compile(r'[.\w]+\(%rip\)')
 SCRUB_X86_LCP_RE = re.compile(r'\.?LCPI[0-9]+_[0-9]+')
 SCRUB_X86_RET_RE = re.compile(r'ret[l|q]')
 
+# The x86 scrubbers without and with --extra_scrub, by their other options.
+_x86_scrubbers = {}
+
+def _x86_scrubber(args):
+  no_mem_shuffle = getattr(args, 'no_x86_scrub_mem_shuffle', True)
+  scrub_sp = getattr(args, 'x86_scrub_sp', True)
+  scrub_rip = getattr(args, 'x86_scrub_rip', False)
+  extra_scrub = getattr(args, 'extra_scrub', False)
+  key = (no_mem_shuffle, scrub_sp, scrub_rip)
+  if key not in _x86_scrubbers:
+    steps = [common.scrub_whitespace_line]
+    # Detect shuffle asm comments and hide the operands in favor of the comments.
+    if no_mem_shuffle:
+      steps.append(common.scrub_line_step(SCRUB_X86_SHUFFLES_NO_MEM_RE,
+                                          r'\1 {{.*#+}} \2', ' = '))
+    else:
+      steps.append(common.scrub_line_step(SCRUB_X86_SHUFFLES_RE,
+                                          r'\1 {{.*#+}} \2', ' = '))
+    # Detect stack spills and reloads and hide their exact offset and whether
+    # they used the stack pointer or frame pointer.
+    steps.append(common.scrub_line_step(SCRUB_X86_SPILL_RELOAD_RE,
+                                        r'{{[-0-9]+}}(%\1{{[sb]}}p)\2',
+                                        'Spill', 'Reload'))
+    if scrub_sp:
+      # Generically match the stack offset of a memory operand.
+      steps.append(common.scrub_line_step(SCRUB_X86_SP_RE,
+                                          r'{{[0-9]+}}(%\1)', 'sp)'))
+    if scrub_rip:
+      # Generically match a RIP-relative memory operand.
+      steps.append(common.scrub_line_step(SCRUB_X86_RIP_RE,
+                                          r'{{.*}}(%rip)', '(%rip)'))
+    # Generically match a LCP symbol.
+    steps.append(common.scrub_line_step(SCRUB_X86_LCP_RE,
+                                        r'{{\.?LCPI[0-9]+_[0-9]+}}', 'LCPI'))
+    # Strip trailing whitespace.
+    steps.append(common.scrub_trailing_whitespace_line)
+    # Strip kill operands inserted into the asm.
+    scrubber = common.LineScrubber(steps, drop_kill_comment=True)
+    # Avoid generating different checks for 32- and 64-bit because of 'retl'
+    # vs 'retq'.
+    extra_scrubber = scrubber.extend([
+        common.scrub_line_step(SCRUB_X86_RET_RE, r'ret{{[l|q]}}', 'ret')])
+    _x86_scrubbers[key] = (scrubber, extra_scrubber)
+  return _x86_scrubbers[key][bool(extra_scrub)]
+
 def scrub_asm_x86(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-
-  # Detect shuffle asm comments and hide the operands in favor of the comments.
-  if getattr(args, 'no_x86_scrub_mem_shuffle', True):
-    asm = SCRUB_X86_SHUFFLES_NO_MEM_RE.sub(r'\1 {{.*#+}} \2', asm)
-  else:
-    asm = SCRUB_X86_SHUFFLES_RE.sub(r'\1 {{.*#+}} \2', asm)
-
-  # Detect stack spills and reloads and hide their exact offset and whether
-  # they used the stack pointer or frame pointer.
-  asm = SCRUB_X86_SPILL_RELOAD_RE.sub(r'{{[-0-9]+}}(%\1{{[sb]}}p)\2', asm)
-  if getattr(args, 'x86_scrub_sp', True):
-    # Generically match the stack offset of a memory operand.
-    asm = SCRUB_X86_SP_RE.sub(r'{{[0-9]+}}(%\1)', asm)
-  if getattr(args, 'x86_scrub_rip', False):
-    # Generically match a RIP-relative memory operand.
-    asm = SCRUB_X86_RIP_RE.sub(r'{{.*}}(%rip)', asm)
-  # Generically match a LCP symbol.
-  asm = SCRUB_X86_LCP_RE.sub(r'{{\.?LCPI[0-9]+_[0-9]+}}', asm)
-  if getattr(args, 'extra_scrub', False):
-    # Avoid generating different checks for 32- and 64-bit because of 'retl' vs 'retq'.
-    asm = SCRUB_X86_RET_RE.sub(r'ret{{[l|q]}}', asm)
-  # Strip kill operands inserted into the asm.
-  asm = common.SCRUB_KILL_COMMENT_RE.sub('', asm)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _x86_scrubber(args)(asm)
+
+# Scrub runs of whitespace out of the assembly, but leave the leading
+# whitespace in place, expand the tabs used for indentation and strip
+# trailing whitespace.
+_whitespace_scrubber = common.LineScrubber([
+    common.scrub_whitespace_line,
+    common.scrub_trailing_whitespace_line])
+
+# Also strip kill operands inserted into the asm.
+_kill_comment_scrubber = common.LineScrubber([
+    common.scrub_whitespace_line,
+    common.scrub_trailing_whitespace_line], drop_kill_comment=True)
+
+_powerpc_scrubber = common.LineScrubber([
+    common.scrub_whitespace_line,
+    # Strip unimportant comments, but leave the token '#' in place.
+    common.scrub_line_step(common.SCRUB_LOOP_COMMENT_RE, r'#',
+                           '# =>This Inner Loop Header:', '# in Loop:'),
+    common.scrub_trailing_whitespace_line,
+    # Strip the tailing token '#', except the line only has token '#'.
+    common.scrub_line_step(common.SCRUB_TAILING_COMMENT_TOKEN_RE, r'', '#')])
 
 def scrub_asm_amdgpu(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 def scrub_asm_arm_eabi(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip kill operands inserted into the asm.
-  asm = common.SCRUB_KILL_COMMENT_RE.sub('', asm)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _kill_comment_scrubber(asm)
 
 def scrub_asm_hexagon(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 def scrub_asm_powerpc(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip unimportant comments, but leave the token '#' in place.
-  asm = common.SCRUB_LOOP_COMMENT_RE.sub(r'#', asm)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  # Strip the tailing token '#', except the line only has token '#'.
-  asm = common.SCRUB_TAILING_COMMENT_TOKEN_RE.sub(r'', asm)
-  return asm
+  return _powerpc_scrubber(asm)
 
 def scrub_asm_m68k(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 def scrub_asm_mips(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 def scrub_asm_msp430(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 def scrub_asm_avr(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 def scrub_asm_riscv(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 def scrub_asm_lanai(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 def scrub_asm_sparc(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 def scrub_asm_systemz(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 def scrub_asm_wasm32(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 def scrub_asm_ve(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 def scrub_asm_csky(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip kill operands inserted into the asm.
-  asm = common.SCRUB_KILL_COMMENT_RE.sub('', asm)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _kill_comment_scrubber(asm)
 
 def scrub_asm_nvptx(asm, args):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  asm = common.SCRUB_WHITESPACE_RE.sub(r' ', asm)
-  # Expand the tabs used for indentation.
-  asm = string.expandtabs(asm, 2)
-  # Strip trailing whitespace.
-  asm = common.SCRUB_TRAILING_WHITESPACE_RE.sub(r'', asm)
-  return asm
+  return _whitespace_scrubber(asm)
 
 # Returns a tuple of a scrub function and a function regex. Scrub function is
 # used to alter function body in some way, for example, remove trailing spaces.
@@ -1,14 +1,20 @@
 from __future__ import print_function
 
 import argparse
+import collections
+import concurrent.futures
 import copy
 import glob
+import hashlib
 import itertools
 import os
 import re
+import shutil
 import subprocess
 import sys
 import shlex
+import tempfile
+import threading
 
 from typing import List
 
@@ -17,10 +23,12 @@ from typing import List
 
 _verbose = False
 _prefix_filecheck_ir_name = ''
+_tool_pool = None
+_tool_cache = None
 
 class Regex(object):
   """Wrap a compiled regular expression object to allow deep copy of a regexp.
-  This is required for the deep copy done in do_scrub.
+  This is required for deep copies of the arguments, which hold the filters.
 
   """
   def __init__(self, regex):
@@ -138,9 +146,26 @@ def parse_commandline_args(parser):
                       dest='gen_unused_prefix_body',
                       default=True,
                       help='Generate a function body that always matches for unused prefixes. This is useful when unused prefixes are desired, and it avoids needing to annotate each FileCheck as allowing them.')
+  parser.add_argument('-j', '--jobs', type=int, default=1,
+                      help='Number of RUN line tool invocations to run in parallel, across all tests')
+  parser.add_argument('--cache-dir', default=os.environ.get('UTC_CACHE_DIR'),
+                      help='Directory of a cache of the output of the RUN line tools, which is reused '
+                           'as long as the tool binary, its arguments and its input do not change '
+                           '(defaults to $UTC_CACHE_DIR, no cache if unset)')
+  parser.add_argument('--cache-clang', action='store_true',
+                      help='Also cache the output of clang, although headers it finds through #include '
+                           'lines or include paths are not part of the cache key')
+  parser.add_argument('--cache-size', type=int, default=1024,
+                      help='Maximum size of the cache in MiB, the least recently used outputs are '
+                           'evicted first (defaults to %(default)s)')
   args = parser.parse_args()
-  global _verbose, _global_value_regex, _global_hex_value_regex
+  global _verbose, _global_value_regex, _global_hex_value_regex, _tool_pool, _tool_cache
   _verbose = args.verbose
+  if args.jobs > 1:
+    _tool_pool = ToolInvocationPool(args.jobs)
+  if args.cache_dir:
+    _tool_cache = ToolOutputCache(args.cache_dir, args.cache_size * 1024 * 1024,
+                                  args.cache_clang)
   _global_value_regex = args.global_value_regex
   _global_hex_value_regex = args.global_hex_value_regex
   return args
@@ -280,8 +305,293 @@ def applySubstitutions(s, substitutions):
     s = s.replace(a, b)
   return s
 
-# Invoke the tool that is being tested.
-def invoke_tool(exe, cmd_args, ir, preprocess_cmd=None, verbose=False):
+class ToolInvocationPool(object):
+  """Runs tool invocations on a pool of threads.
+
+  The update scripts generate the checks of one test after the other, and
+  prefetch the invocations of the RUN lines of the next few tests (see
+  iter_prefetched()), taking the output of each invocation as it is needed.
+  Identical invocations, i.e. the same tool, arguments, input and
+  preprocessing command, only run once.
+  """
+  def __init__(self, jobs):
+    self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    self._lock = threading.Lock()
+    # Maps each invocation to its future and its number of pending uses.
+    self._pending = {}
+    # The number of tests prefetched ahead of the one being updated.
+    self.window = 2 * jobs
+
+  @staticmethod
+  def _key(exe, cmd_args, ir, preprocess_cmd):
+    if isinstance(cmd_args, list):
+      cmd_args = tuple(cmd_args)
+    return (exe, cmd_args, os.path.abspath(ir), preprocess_cmd)
+
+  def prefetch(self, exe, cmd_args, ir, preprocess_cmd=None, verbose=False):
+    key = self._key(exe, cmd_args, ir, preprocess_cmd)
+    with self._lock:
+      entry = self._pending.get(key)
+      if entry is None:
+        future = self._executor.submit(_run_tool, exe, cmd_args, ir,
+                                       preprocess_cmd, verbose)
+        self._pending[key] = [future, 1]
+      else:
+        entry[1] += 1
+
+  def take(self, exe, cmd_args, ir, preprocess_cmd=None):
+    """Return the future of a prefetched invocation, or None."""
+    key = self._key(exe, cmd_args, ir, preprocess_cmd)
+    with self._lock:
+      entry = self._pending.get(key)
+      if entry is None:
+        return None
+      entry[1] -= 1
+      if entry[1] == 0:
+        del self._pending[key]
+      return entry[0]
+
+  def shutdown(self):
+    """Cancel the invocations that did not start, and wait for the others."""
+    with self._lock:
+      pending, self._pending = self._pending, {}
+    if sys.version_info >= (3, 9):
+      self._executor.shutdown(cancel_futures=True)
+    else:
+      for future, _ in pending.values():
+        future.cancel()
+      self._executor.shutdown()
+
+def prefetch_tool_output(exe, cmd_args, ir, preprocess_cmd=None, verbose=False):
+  """Start an invocation of invoke_tool() ahead of time when running with
+  --jobs, so that it can run in parallel with other invocations."""
+  if _tool_pool is not None:
+    _tool_pool.prefetch(exe, cmd_args, ir, preprocess_cmd, verbose)
+
+def iter_prefetched(items, start):
+  """Generate (item, start(item)) for each item.
+
+  start() prefetches the tool invocations of an item with
+  prefetch_tool_output() and returns what is needed to process it.  With
+  --jobs, it is called on a bounded window of items ahead of the one being
+  processed, so that their invocations run in parallel with its processing
+  without queueing the invocations of all the items at once.
+  """
+  window = collections.deque()
+  ahead = _tool_pool.window if _tool_pool is not None else 1
+  for item in items:
+    window.append((item, start(item)))
+    if len(window) >= ahead:
+      yield window.popleft()
+  while window:
+    yield window.popleft()
+
+def shutdown_tool_pool():
+  """Cancel the prefetched invocations that did not start.
+
+  The update scripts call this when they exit, also on errors, as the
+  interpreter would otherwise run every queued invocation before exiting.
+  """
+  if _tool_pool is not None:
+    _tool_pool.shutdown()
+
+class ToolOutputCache(object):
+  """A cache of the output of tool invocations, stored in a directory.
+
+  The output is stored under a digest of the contents of the tool binary and
+  of the LLVM shared libraries of its build, the arguments and preprocessing
+  command after substitutions, the contents of the input file, and the
+  contents of the other files the arguments name, alone or as the value of
+  an -option=PATH.  Directories named by the arguments, like include paths,
+  are not part of the digest, and neither are the headers a compiler finds
+  through #include lines, so the output of clang is only cached when
+  cache_clang is set.  Reading an output marks it as used, and the least
+  recently used outputs are removed once the cache grows beyond its maximum
+  size.
+  """
+  # The shared libraries a tool built with BUILD_SHARED_LIBS or
+  # LLVM_LINK_LLVM_DYLIB loads, relative to the parent of its bin directory.
+  LIBRARY_PATTERNS = ['lib/libLLVM*.so*', 'lib/libclang*.so*',
+                      'lib/libLLVM*.dylib', 'lib/libclang*.dylib',
+                      'bin/*.dll']
+
+  # The names of temporary files, like the %t of update_cc_test_checks.py,
+  # which differ between runs.
+  TEMP_NAME_RE = re.compile(
+      re.escape(os.path.join(tempfile.gettempdir(), tempfile.gettempprefix()))
+      + r'[a-z0-9_]{8}')
+
+  def __init__(self, path, max_size, cache_clang=False):
+    self.path = path
+    self.max_size = max_size
+    self.cache_clang = cache_clang
+    self._lock = threading.Lock()
+    self._file_digests = {}
+    self._libraries = {}
+    self._size = None
+
+  def _file_digest(self, path):
+    st = os.stat(path)
+    stamp = (path, st.st_mtime_ns, st.st_size)
+    with self._lock:
+      digest = self._file_digests.get(stamp)
+    if digest is None:
+      h = hashlib.sha256()
+      with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+          h.update(chunk)
+      digest = h.hexdigest()
+      with self._lock:
+        self._file_digests[stamp] = digest
+    return digest
+
+  def _find_libraries(self, path):
+    prefix = os.path.dirname(os.path.dirname(os.path.realpath(path)))
+    with self._lock:
+      libraries = self._libraries.get(prefix)
+    if libraries is None:
+      # The versioned names of a library are symlinks to the same file.
+      libraries = sorted(set(
+          os.path.realpath(library) for pattern in self.LIBRARY_PATTERNS
+          for library in glob.glob(os.path.join(prefix, pattern))))
+      with self._lock:
+        self._libraries[prefix] = libraries
+    return libraries
+
+  def _binary_digest(self, exe):
+    path = shutil.which(exe)
+    if path is None:
+      return None
+    h = hashlib.sha256(self._file_digest(path).encode('utf-8'))
+    for library in self._find_libraries(path):
+      h.update(self._file_digest(library).encode('utf-8'))
+    return h.hexdigest()
+
+  def _referenced_files(self, words, ir):
+    """Return the digests of the files other than ir that the given words of
+    a command line name, alone or as the value of an -option=PATH."""
+    ir = os.path.realpath(ir)
+    digests = []
+    for word in words:
+      for path in (word, word.partition('=')[2]):
+        if path and os.path.isfile(path) and os.path.realpath(path) != ir:
+          digests.append(self._file_digest(path))
+    return digests
+
+  def key(self, exe, cmd_args, ir, preprocess_cmd):
+    """Return the key of an invocation, or None if it cannot be cached."""
+    # The shell form of an invocation starts with the tool.
+    tool = exe if isinstance(cmd_args, list) else shlex.split(exe)[0]
+    if not self.cache_clang and \
+        os.path.basename(tool).startswith('clang'):
+      return None
+    binary_digest = self._binary_digest(tool)
+    if binary_digest is None:
+      return None
+    substitutions = getSubstitutions(ir)
+    if isinstance(cmd_args, list):
+      args = [applySubstitutions(a, substitutions) for a in cmd_args]
+      words = list(args)
+    else:
+      args = applySubstitutions(cmd_args, substitutions)
+    if preprocess_cmd:
+      preprocess_cmd = applySubstitutions(preprocess_cmd, substitutions)
+    try:
+      if not isinstance(cmd_args, list):
+        words = shlex.split(args)
+      if preprocess_cmd:
+        words += shlex.split(preprocess_cmd)
+    except ValueError:
+      # The files a malformed shell command refers to cannot be told.
+      return None
+    files = self._referenced_files(words, ir)
+    def normalize(arg):
+      return self.TEMP_NAME_RE.sub('%t', arg)
+    if isinstance(cmd_args, list):
+      args = [normalize(a) for a in args]
+    else:
+      args = normalize(args)
+    if preprocess_cmd:
+      preprocess_cmd = normalize(preprocess_cmd).strip()
+    h = hashlib.sha256()
+    h.update(repr((binary_digest, exe, args, preprocess_cmd, files))
+             .encode('utf-8'))
+    with open(ir, 'rb') as f:
+      h.update(f.read())
+    return h.hexdigest()
+
+  def _entry_path(self, key):
+    return os.path.join(self.path, key[:2], key[2:])
+
+  def get(self, key):
+    entry_path = self._entry_path(key)
+    try:
+      with open(entry_path, 'rb') as f:
+        output = f.read().decode('utf-8')
+      os.utime(entry_path)
+      return output
+    except OSError:
+      return None
+
+  def put(self, key, output):
+    entry_path = self._entry_path(key)
+    data = output.encode('utf-8')
+    try:
+      os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+      fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path))
+      with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+      os.replace(temp_path, entry_path)
+    except OSError as e:
+      warn('Could not write to the tool output cache: {}'.format(e))
+      return
+    with self._lock:
+      if self._size is None:
+        self._size = sum(size for _, size, _ in self._entries())
+      else:
+        self._size += len(data)
+      if self._size > self.max_size:
+        self._evict()
+
+  def _entries(self):
+    for dirpath, _, filenames in os.walk(self.path):
+      for filename in filenames:
+        entry_path = os.path.join(dirpath, filename)
+        try:
+          st = os.stat(entry_path)
+        except OSError:
+          continue
+        yield st.st_mtime, st.st_size, entry_path
+
+  def _evict(self):
+    # Make room for some more outputs, so that the cache is not scanned for
+    # every new output once it is full.
+    entries = sorted(self._entries())
+    self._size = sum(size for _, size, _ in entries)
+    for _, size, entry_path in entries:
+      if self._size <= self.max_size * 0.9:
+        break
+      try:
+        os.unlink(entry_path)
+        self._size -= size
+      except OSError:
+        pass
+
+def _run_tool(exe, cmd_args, ir, preprocess_cmd=None, verbose=False):
+  if _tool_cache is None:
+    return _execute_tool(exe, cmd_args, ir, preprocess_cmd, verbose)
+  key = _tool_cache.key(exe, cmd_args, ir, preprocess_cmd)
+  if key is not None:
+    output = _tool_cache.get(key)
+    if output is not None:
+      debug('Using cached output of', exe, 'for', ir)
+      return output
+  output = _execute_tool(exe, cmd_args, ir, preprocess_cmd, verbose)
+  if key is not None:
+    _tool_cache.put(key, output)
+  return output
+
+def _execute_tool(exe, cmd_args, ir, preprocess_cmd=None, verbose=False):
   with open(ir) as ir_file:
     substitutions = getSubstitutions(ir)
 
@@ -315,6 +625,37 @@ def invoke_tool(exe, cmd_args, ir, preprocess_cmd=None, verbose=False):
   # Fix line endings to unix CR style.
   return stdout.replace('\r\n', '\n')
 
+# Invoke the tool that is being tested.
+def invoke_tool(exe, cmd_args, ir, preprocess_cmd=None, verbose=False):
+  if _tool_pool is not None:
+    future = _tool_pool.take(exe, cmd_args, ir, preprocess_cmd)
+    if future is not None:
+      return future.result()
+  return _run_tool(exe, cmd_args, ir, preprocess_cmd, verbose)
+
+def write_test_file(path, output_lines):
+  """Replace the contents of a test with the given lines, atomically, so
+  that an interrupted update does not leave a truncated test behind.  When
+  the test is a symbolic link, the file it points to is replaced; a test
+  with several hard links is rewritten in place to keep them linked."""
+  data = b''.join('{}\n'.format(l).encode('utf-8') for l in output_lines)
+  path = os.path.realpath(path)
+  st = os.stat(path)
+  if st.st_nlink > 1:
+    with open(path, 'wb') as f:
+      f.write(data)
+    return
+  fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                   prefix=os.path.basename(path) + '.')
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      f.write(data)
+    os.chmod(temp_path, st.st_mode & 0o7777)
+    os.replace(temp_path, path)
+  except BaseException:
+    os.unlink(temp_path)
+    raise
+
 ##### LLVM IR parser
 RUN_LINE_RE = re.compile(r'^\s*(?://|[;#])\s*RUN:\s*(.*)$')
 CHECK_PREFIX_RE = re.compile(r'--?check-prefix(?:es)?[= ](\S+)')
@@ -349,10 +690,12 @@ DEBUG_ONLY_ARG_RE = re.compile(r'-debug-only[= ]([^ ]+)')
 
 SCRUB_LEADING_WHITESPACE_RE = re.compile(r'^(\s+)')
 SCRUB_WHITESPACE_RE = re.compile(r'(?!^(|  \w))[ \t]+', flags=re.M)
+SCRUB_WHITESPACE_RUN_RE = re.compile(r'[ \t]{2,}|\t')
 SCRUB_TRAILING_WHITESPACE_RE = re.compile(r'[ \t]+$', flags=re.M)
 SCRUB_TRAILING_WHITESPACE_TEST_RE = SCRUB_TRAILING_WHITESPACE_RE
 SCRUB_TRAILING_WHITESPACE_AND_ATTRIBUTES_RE = re.compile(r'([ \t]|(#[0-9]+))+$', flags=re.M)
 SCRUB_KILL_COMMENT_RE = re.compile(r'^ *#+ +kill:.*\n')
+SCRUB_KILL_COMMENT_LINE_RE = re.compile(r' *#+ +kill:')
 SCRUB_LOOP_COMMENT_RE = re.compile(
     r'# =>This Inner Loop Header:.*|# in Loop:.*', flags=re.M)
 SCRUB_TAILING_COMMENT_TOKEN_RE = re.compile(r'(?<=\S)+[ \t]*#$', flags=re.M)
@@ -421,19 +764,104 @@ def do_filter(body, filters):
   return body if not filters else '\n'.join(filter(
     lambda line: apply_filters(line, filters), body.splitlines()))
 
+class LineScrubber(object):
+  """Scrubs a function body in a single pass over its lines.
+
+  Each step is a function from a line to the scrubbed line.  All the steps
+  are applied to a line before moving on to the next one, instead of running
+  one regular expression after the other over the whole body.  A scrubber
+  created with extend() applies more steps to the lines scrubbed by its base,
+  which remembers the last body it scrubbed: scrubbing a body with and
+  without --extra_scrub then makes a single pass over it.
+  """
+  def __init__(self, steps, drop_kill_comment=False, base=None):
+    self.steps = steps
+    # Like SCRUB_KILL_COMMENT_RE, only a kill comment on the first line is
+    # dropped.
+    self.drop_kill_comment = drop_kill_comment
+    self.base = base
+    self._remember = False
+    self._last_body = None
+    self._last_lines = None
+
+  def extend(self, steps):
+    self._remember = True
+    return LineScrubber(steps, base=self)
+
+  def scrub_lines(self, body):
+    if body is self._last_body:
+      return self._last_lines
+    if self.base:
+      lines = self.base.scrub_lines(body)
+    else:
+      lines = body.split('\n')
+    steps = self.steps
+    scrubbed_lines = []
+    for line in lines:
+      for step in steps:
+        line = step(line)
+      scrubbed_lines.append(line)
+    if (self.drop_kill_comment and len(scrubbed_lines) > 1 and
+        SCRUB_KILL_COMMENT_LINE_RE.match(scrubbed_lines[0])):
+      del scrubbed_lines[0]
+    if self._remember:
+      self._last_body = body
+      self._last_lines = scrubbed_lines
+    return scrubbed_lines
+
+  def __call__(self, body):
+    return '\n'.join(self.scrub_lines(body))
+
+def scrub_line_step(regex, repl, *triggers):
+  """Returns a step substituting repl for the matches of regex in a line.
+
+  Every match of regex contains one of the triggers, so the regex is only
+  run over the lines containing one.
+  """
+  sub = regex.sub
+  if not triggers:
+    return lambda line: sub(repl, line)
+  def step(line):
+    for trigger in triggers:
+      if trigger in line:
+        return sub(repl, line)
+    return line
+  return step
+
+def scrub_whitespace_line(line):
+  # Scrub runs of whitespace out of the line, but leave the leading
+  # whitespace in place, and expand the tab used for indentation.  This is
+  # SCRUB_WHITESPACE_RE followed by str.expandtabs(line, 2): the first
+  # character is left alone, so a tab can only remain there.
+  if not line:
+    return line
+  first, rest = line[0], line[1:]
+  if '\t' in rest or '  ' in rest:
+    rest = SCRUB_WHITESPACE_RUN_RE.sub(' ', rest)
+  if first == '\t':
+    first = '  '
+  return first + rest
+
+def scrub_trailing_whitespace_line(line):
+  return line.rstrip(' \t')
+
+def scrub_trailing_whitespace_test_line(line):
+  if SCRUB_TRAILING_WHITESPACE_TEST_RE is SCRUB_TRAILING_WHITESPACE_RE:
+    return line.rstrip(' \t')
+  return SCRUB_TRAILING_WHITESPACE_TEST_RE.sub('', line)
+
+_body_scrubber = LineScrubber([scrub_whitespace_line,
+                               scrub_trailing_whitespace_test_line])
+
 def scrub_body(body):
-  # Scrub runs of whitespace out of the assembly, but leave the leading
-  # whitespace in place.
-  body = SCRUB_WHITESPACE_RE.sub(r' ', body)
-  # Expand the tabs used for indentation.
-  body = str.expandtabs(body, 2)
-  # Strip trailing whitespace.
-  body = SCRUB_TRAILING_WHITESPACE_TEST_RE.sub(r'', body)
-  return body
+  # Scrub runs of whitespace out of the body, expand the tabs used for
+  # indentation and strip trailing whitespace.
+  return _body_scrubber(body)
 
 def do_scrub(body, scrubber, scrubber_args, extra):
   if scrubber_args:
-    local_args = copy.deepcopy(scrubber_args)
+    # The scrubbers only read their arguments, so a shallow copy suffices.
+    local_args = [copy.copy(scrubber_args[0])] + scrubber_args[1:]
     local_args[0].extra_scrub = extra
     return scrubber(body, *local_args)
   return scrubber(body, *scrubber_args)
@@ -544,8 +972,12 @@ class FunctionTestBuilder:
       filtered_body = do_filter(body, self._filters)
       scrubbed_body = do_scrub(filtered_body, scrubber, self._scrubber_args,
                                extra=False)
-      scrubbed_extra = do_scrub(filtered_body, scrubber, self._scrubber_args,
-                                extra=True)
+      if self._scrubber_args:
+        scrubbed_extra = do_scrub(filtered_body, scrubber, self._scrubber_args,
+                                  extra=True)
+      else:
+        # Without arguments, there is no --extra_scrub to honor.
+        scrubbed_extra = scrubbed_body
       if 'analysis' in m.groupdict():
         analysis = m.group('analysis')
         if analysis.lower() != 'cost model analysis':
@@ -643,6 +1075,8 @@ class NamelessValue:
     # modifications to LLVM, replace those with an incrementing counter.
     self.replace_number_with_counter = replace_number_with_counter
     self.variable_mapping = {}
+    # The FileCheck variable names already created, see get_value_name.
+    self.value_names = {}
 
   # Return true if this kind of IR value is "local", basically if it matches '%{{.*}}'.
   def is_local_def_ir_value_match(self, match):
@@ -668,8 +1102,17 @@ class NamelessValue:
       return self.ir_regexp
     return self.global_ir_prefix_regexp
 
-  # Create a FileCheck variable name based on an IR name.
+  # Create a FileCheck variable name based on an IR name.  Values are used
+  # many times, so the name is only created for their first use.
   def get_value_name(self, var: str, check_prefix: str):
+    key = (var, check_prefix, _prefix_filecheck_ir_name)
+    name = self.value_names.get(key)
+    if name is None:
+      name = self._create_value_name(var, check_prefix)
+      self.value_names[key] = name
+    return name
+
+  def _create_value_name(self, var: str, check_prefix: str):
     var = var.replace('!', '')
     if self.replace_number_with_counter:
       assert var.isdigit(), var
@@ -802,9 +1245,18 @@ def get_name_from_ir_value_match(match):
 def get_nameless_value_from_match(match, nameless_values) -> NamelessValue:
   return nameless_values[get_idx_from_ir_value_match(match)]
 
+# The regexps matching the scripted FileCheck names, by check_prefix.
+_check_prefix_name_res = {}
+
 # Return true if var clashes with the scripted FileCheck check_prefix.
 def may_clash_with_default_check_prefix_name(check_prefix, var):
-  return check_prefix and re.match(r'^' + check_prefix + r'[0-9]+?$', var, re.IGNORECASE)
+  if not check_prefix:
+    return check_prefix
+  regex = _check_prefix_name_res.get(check_prefix)
+  if regex is None:
+    regex = re.compile(r'^' + check_prefix + r'[0-9]+?$', re.IGNORECASE)
+    _check_prefix_name_res[check_prefix] = regex
+  return regex.match(var)
 
 def generalize_check_lines_common(lines, is_analyze, vars_seen,
                                   global_vars_seen, nameless_values,
@@ -832,11 +1284,9 @@ def generalize_check_lines_common(lines, is_analyze, vars_seen,
       else:
         global_vars_seen[key] = nameless_value.check_prefix
       rv = nameless_value.get_value_definition(var, match)
-    # re.sub replaces the entire regex match
-    # with whatever you return, so we have
-    # to make sure to hand it back everything
-    # including the commas and spaces.
-    return match.group(1) + rv + match.group(match.lastindex)
+    # Hand back the leading spaces, the separator after the value is left in
+    # place.
+    return match.group(1) + rv
 
   lines_with_def = []
 
@@ -854,13 +1304,23 @@ def generalize_check_lines_common(lines, is_analyze, vars_seen,
       scrubbed_line = SCRUB_IR_COMMENT_RE.sub(r'', line)
       lines[i] = scrubbed_line
     if is_asm or not is_analyze:
-      # It can happen that two matches are back-to-back and for some reason sub
-      # will not replace both of them. For now we work around this by
-      # substituting until there is no more match.
-      changed = True
-      while changed:
-        (lines[i], changed) = nameless_value_regex.subn(transform_line_vars,
-                                                        lines[i], count=1)
+      # Replace the values from left to right in a single pass over the line.
+      # A match includes the separator after the value, which can also start
+      # the next value when two are back-to-back, so each search resumes at
+      # the separator rather than after it.  The replacements never match, so
+      # this is the same as substituting the first match until none is left.
+      line = lines[i]
+      pieces = []
+      pos = 0
+      match = nameless_value_regex.search(line)
+      while match:
+        separator_start = match.start(match.lastindex)
+        pieces.append(line[pos:match.start()])
+        pieces.append(transform_line_vars(match))
+        pos = separator_start
+        match = nameless_value_regex.search(line, pos)
+      pieces.append(line[pos:])
+      lines[i] = ''.join(pieces)
   return lines
 
 # Replace IR value defs and uses with FileCheck variables.
@@ -1140,7 +1600,8 @@ def get_autogennote_suffix(parser, args):
       continue  # Ignore options such as --help that aren't included in args
     # Ignore parameters such as paths to the binary or the list of tests
     if action.dest in ('tests', 'update_only', 'opt_binary', 'llc_binary',
-                       'clang', 'opt', 'llvm_bin', 'verbose'):
+                       'clang', 'opt', 'llvm_bin', 'verbose', 'jobs',
+                       'cache_dir', 'cache_size', 'cache_clang'):
       continue
     value = getattr(args, action.dest)
     if action.const is not None:  # action stores a constant (usually True/False)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+"""Compare the scrubbers of UpdateTestChecks with those of another tree.
+
+This script runs the llc RUN lines of test cases the way
+update_llc_test_checks.py does, and scrubs the body of every function in
+their output with the scrubbers of this tree and with those of a baseline
+tree.  It reports the functions the two scrub differently and how long each
+took, so that it serves both as a differential test and as a benchmark of a
+change to the scrubbers.
+
+Example usage:
+$ git worktree add /tmp/baseline main
+$ compare_test_checks_scrubbers.py --baseline /tmp/baseline/llvm/utils \\
+    --llc-binary ../bin/llc test/CodeGen/X86/*.ll
+
+Adding --cache-dir makes later runs reuse the output of llc.
+"""
+
+from __future__ import print_function
+
+import argparse
+import importlib
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+
+from UpdateTestChecks import common
+import update_llc_test_checks
+
+BASELINE_PACKAGE = 'baseline_UpdateTestChecks'
+
+
+def load_baseline(utils_dir):
+  package_dir = os.path.join(utils_dir, 'UpdateTestChecks')
+  spec = importlib.util.spec_from_file_location(
+      BASELINE_PACKAGE, os.path.join(package_dir, '__init__.py'),
+      submodule_search_locations=[package_dir])
+  package = importlib.util.module_from_spec(spec)
+  sys.modules[BASELINE_PACKAGE] = package
+  spec.loader.exec_module(package)
+  return importlib.import_module(BASELINE_PACKAGE + '.common')
+
+
+def get_triple(ti, triple_in_cmd, march_in_cmd):
+  if triple_in_cmd:
+    return triple_in_cmd
+  for l in ti.input_lines:
+    m = common.TRIPLE_IR_RE.match(l)
+    if m:
+      return m.groups()[0]
+  return common.get_triple_from_march(march_in_cmd)
+
+
+def first_difference(text, baseline_text):
+  lines = text.splitlines()
+  baseline_lines = baseline_text.splitlines()
+  for i, (line, baseline_line) in enumerate(zip(lines, baseline_lines)):
+    if line != baseline_line:
+      return i + 1, line, baseline_line
+  i = min(len(lines), len(baseline_lines))
+  return (i + 1, lines[i] if i < len(lines) else '<end>',
+          baseline_lines[i] if i < len(baseline_lines) else '<end>')
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--baseline', required=True,
+                      help='The llvm/utils directory of the baseline tree')
+  parser.add_argument('--llc-binary', default=None,
+                      help='The "llc" binary to run')
+  parser.add_argument(
+      '--x86_scrub_sp', action='store_true', default=True,
+      help='Use regex for x86 sp matching to reduce diffs between various subtargets')
+  parser.add_argument(
+      '--no_x86_scrub_sp', action='store_false', dest='x86_scrub_sp')
+  parser.add_argument(
+      '--x86_scrub_rip', action='store_true', default=False,
+      help='Use more regex for x86 rip matching to reduce diffs between various subtargets')
+  parser.add_argument(
+      '--no_x86_scrub_rip', action='store_false', dest='x86_scrub_rip')
+  parser.add_argument(
+      '--no_x86_scrub_mem_shuffle', action='store_true', default=False,
+      help='Reduce scrubbing shuffles with memory operands')
+  parser.add_argument('tests', nargs='+')
+  initial_args = common.parse_commandline_args(parser)
+
+  baseline_common = load_baseline(initial_args.baseline)
+
+  tests = common.itertests(initial_args.tests, parser,
+                           script_name='utils/update_llc_test_checks.py')
+
+  def start(ti):
+    run_list, output_type = update_llc_test_checks.get_run_list(ti)
+    for _, llc_tool, llc_args, preprocess_cmd, _, _ in run_list:
+      common.prefetch_tool_output(ti.args.llc_binary or llc_tool, llc_args,
+                                  ti.path, preprocess_cmd,
+                                  verbose=ti.args.verbose)
+    return run_list, output_type
+
+  num_functions = 0
+  num_differences = 0
+  num_bytes = 0
+  elapsed = 0.0
+  baseline_elapsed = 0.0
+  for ti, (run_list, output_type) in common.iter_prefetched(tests, start):
+    if not run_list:
+      continue
+    baseline_output_type = importlib.import_module(
+        BASELINE_PACKAGE + '.' + output_type.__name__.rsplit('.', 1)[-1])
+    for _, llc_tool, llc_args, preprocess_cmd, triple_in_cmd, march_in_cmd in run_list:
+      try:
+        raw_tool_output = common.invoke_tool(ti.args.llc_binary or llc_tool,
+                                             llc_args, ti.path, preprocess_cmd,
+                                             verbose=ti.args.verbose)
+      except subprocess.CalledProcessError as e:
+        common.warn('Skipping failed RUN line: {}'.format(e), ti.path)
+        continue
+      triple = get_triple(ti, triple_in_cmd, march_in_cmd)
+      scrubber, function_re = output_type.get_run_handler(triple)
+      baseline_scrubber, _ = baseline_output_type.get_run_handler(triple)
+      for m in function_re.finditer(raw_tool_output):
+        body = m.group('body')
+        num_functions += 1
+        num_bytes += len(body)
+        # Scrub like FunctionTestBuilder.process_run_line does.
+        start = time.time()
+        scrubbed = [common.do_scrub(body, scrubber, [ti.args], extra)
+                    for extra in (False, True)]
+        elapsed += time.time() - start
+        start = time.time()
+        baseline_scrubbed = [
+            baseline_common.do_scrub(body, baseline_scrubber, [ti.args], extra)
+            for extra in (False, True)]
+        baseline_elapsed += time.time() - start
+        for extra, text, baseline_text in zip((False, True), scrubbed,
+                                              baseline_scrubbed):
+          if text == baseline_text:
+            continue
+          num_differences += 1
+          line_number, line, baseline_line = first_difference(text,
+                                                              baseline_text)
+          print('{}: {}: function {} (extra scrub: {}) differs at line {}:'
+                .format(ti.path, llc_args, m.group('func'), extra,
+                        line_number))
+          print('  new:      ' + line)
+          print('  baseline: ' + baseline_line)
+
+  print('Scrubbed {} functions ({} bytes), {} differences'.format(
+      num_functions, num_bytes, num_differences))
+  print('Time: {:.3f}s, baseline: {:.3f}s'.format(elapsed, baseline_elapsed))
+  return 1 if num_differences else 0
+
+
+if __name__ == '__main__':
+  try:
+    sys.exit(main())
+  finally:
+    common.shutdown_tool_pool()
@@ -25,21 +25,54 @@ class BooleanExpression:
     # Substrings of `triple` are true.
     # 'true' is true.
     # All other identifiers are false.
+    #
+    # Each distinct expression is only parsed once per process.
     @staticmethod
     def evaluate(string, variables, triple=""):
         try:
-            parser = BooleanExpression(string, set(variables), triple)
-            return parser.parseAll()
+            expr = BooleanExpression.compile(string)
         except ValueError as e:
             raise ValueError(str(e) + ('\nin expression: %r' % string))
+        if not isinstance(variables, (set, frozenset)):
+            variables = set(variables)
+        return BooleanExpression.evaluateCompiled(expr, variables, triple)
+
+    # Parses `string` into a tree of tuples:
+    #   ('||', [operands]), ('&&', [operands]), ('!', operand),
+    #   ('match', token, regex), where regex is None for a plain identifier.
+    _compiled = {}
+
+    @staticmethod
+    def compile(string):
+        expr = BooleanExpression._compiled.get(string)
+        if expr is None:
+            expr = BooleanExpression(string).parseAll()
+            BooleanExpression._compiled[string] = expr
+        return expr
+
+    @staticmethod
+    def evaluateCompiled(expr, variables, triple):
+        op = expr[0]
+        if op == 'match':
+            _, token, regex = expr
+            if token in triple:
+                return True
+            if regex is None:
+                # A plain identifier only matches itself.
+                return token in variables or token == 'true'
+            return (regex.fullmatch('true') is not None or
+                    any(regex.fullmatch(var) for var in variables))
+        if op == '!':
+            return not BooleanExpression.evaluateCompiled(expr[1], variables,
+                                                          triple)
+        values = (BooleanExpression.evaluateCompiled(e, variables, triple)
+                  for e in expr[1])
+        return all(values) if op == '&&' else any(values)
 
     #####
 
-    def __init__(self, string, variables, triple=""):
+    def __init__(self, string):
         self.tokens = BooleanExpression.tokenize(string)
-        self.variables = variables
-        self.variables.add('true')
-        self.triple = triple
         self.value = None
         self.token = None
 
@@ -100,14 +133,14 @@ class BooleanExpression:
                 regex += '(?:{})'.format(part[2:-2])
             else:
                 regex += re.escape(part)
-        regex = re.compile(regex)
-        self.value = self.token in self.triple or any(regex.fullmatch(var) for var in self.variables)
+        regex = re.compile(regex) if '{{' in self.token else None
+        self.value = ('match', self.token, regex)
         self.token = next(self.tokens)
 
     def parseNOT(self):
         if self.accept('!'):
             self.parseNOT()
-            self.value = not self.value
+            self.value = ('!', self.value)
         elif self.accept('('):
             self.parseOR()
             self.expect(')')
@@ -119,23 +152,21 @@ class BooleanExpression:
 
     def parseAND(self):
         self.parseNOT()
+        operands = [self.value]
         while self.accept('&&'):
-            left = self.value
             self.parseNOT()
-            right = self.value
-            # this is technically the wrong associativity, but it
-            # doesn't matter for this limited expression grammar
-            self.value = left and right
+            operands.append(self.value)
+        if len(operands) > 1:
+            self.value = ('&&', operands)
 
     def parseOR(self):
         self.parseAND()
+        operands = [self.value]
         while self.accept('||'):
-            left = self.value
             self.parseAND()
-            right = self.value
-            # this is technically the wrong associativity, but it
-            # doesn't matter for this limited expression grammar
-            self.value = left or right
+            operands.append(self.value)
+        if len(operands) > 1:
+            self.value = ('||', operands)
 
     def parseAll(self):
         self.token = next(self.tokens)
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+
+
+CACHE_FILE = '.lit_discovery_cache.json'
+CACHE_VERSION = 2
+
+# The files lit keeps in the exec root of a suite, like this cache and
+# .lit_test_times.txt, start with this prefix.
+STATE_FILE_PREFIX = '.lit_'
+
+
+def _listing_stamp(path):
+    names = sorted(n for n in os.listdir(path)
+                   if not n.startswith(STATE_FILE_PREFIX))
+    return hashlib.sha1('\0'.join(names).encode('utf-8')).hexdigest()
+
+
+def dir_stamp(suite, path_in_suite):
+    """
+    dir_stamp(suite, path_in_suite) -> [source stamp, exec stamp]
+
+    Adding, removing or renaming an entry of a directory updates its mtime, so
+    an unchanged stamp means the directory listing can be reused.  The exec
+    directory is included because site configs of nested suites live there.
+
+    lit rewrites its own state files in the exec root of the suite on every
+    run, which updates the mtime of that directory.  The stamp of the exec root
+    is therefore a digest of the names in it, without the state files.
+    """
+    exec_root = os.path.normpath(suite.exec_root)
+    stamp = []
+    for path in (suite.getSourcePath(path_in_suite),
+                 suite.getExecPath(path_in_suite)):
+        try:
+            if os.path.normpath(path) == exec_root:
+                stamp.append(_listing_stamp(path))
+            else:
+                stamp.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    return stamp
+
+
+def config_fingerprint(config):
+    """
+    config_fingerprint(config) -> list or None
+
+    Describes everything in a local config that influences which tests are
+    found in a directory, or returns None if the test format discovers tests in
+    a way the cache cannot model.
+    """
+    from lit.formats.base import FileBasedTest
+
+    fmt = config.test_format
+    if fmt is None:
+        fmt_name = None
+    elif (isinstance(fmt, FileBasedTest) and
+          type(fmt).getTestsInDirectory is FileBasedTest.getTestsInDirectory):
+        fmt_name = type(fmt).__module__ + '.' + type(fmt).__name__
+    else:
+        return None
+    return [fmt_name, sorted(config.suffixes), sorted(config.excludes),
+            bool(config.standalone_tests)]
+
+
+class DiscoveryCache(object):
+    """
+    The directory listings of a test suite from a previous run, stored next to
+    .lit_test_times.txt in the suite's exec root.
+
+    Each entry records, for one directory, the names of the tests found in it
+    and of its subdirectories (and whether they contain a nested test suite),
+    along with the stamps and config fingerprint they were computed from.
+    """
+
+    def __init__(self, suite, rebuild):
+        self.suite = suite
+        self.path = os.path.join(suite.exec_root, CACHE_FILE)
+        self.dirs = {} if rebuild else self._read()
+        self.dirty = rebuild
+        self.hits = 0
+        self.misses = 0
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+            return {}
+        return data.get('dirs', {})
+
+    def lookup(self, path_in_suite, fingerprint, stamp):
+        entry = self.dirs.get('/'.join(path_in_suite))
+        if (entry is not None and entry['config'] == fingerprint and
+                entry['stamp'] == stamp):
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, path_in_suite, fingerprint, stamp, tests, subdirs):
+        self.dirs['/'.join(path_in_suite)] = {
+            'stamp': stamp,
+            'config': fingerprint,
+            'tests': tests,
+            'subdirs': subdirs,
+        }
+        self.dirty = True
+
+    def write(self, lit_config):
+        if not self.dirty:
+            return
+        try:
+            self._write()
+        except OSError:
+            lit_config.warning('Could not save discovery cache: ' + self.path)
+
+    def _write(self):
+        with open(self.path, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'dirs': self.dirs}, f)
@@ -26,7 +26,15 @@ class LitConfig(object):
                  params, config_prefix = None,
                  maxIndividualTestTime = 0,
                  parallelism_groups = {},
-                 echo_all_commands = False):
+                 echo_all_commands = False,
+                 discovery_cache = True,
+                 rebuild_discovery_cache = False,
+                 time_commands = False,
+                 max_output_size = 0,
+                 median_test_times = False,
+                 parse_cache = True,
+                 resource_usage = False,
+                 max_memory = 0):
         # The name of the test runner.
         self.progname = progname
         # The items to add to the PATH environment variable.
@@ -67,6 +75,14 @@ class LitConfig(object):
         self.maxIndividualTestTime = maxIndividualTestTime
         self.parallelism_groups = parallelism_groups
         self.echo_all_commands = echo_all_commands
+        self.discovery_cache = discovery_cache
+        self.rebuild_discovery_cache = rebuild_discovery_cache
+        self.time_commands = time_commands
+        self.max_output_size = max_output_size
+        self.median_test_times = median_test_times
+        self.parse_cache = parse_cache
+        self.resource_usage = resource_usage
+        self.max_memory = max_memory
 
     @property
     def maxIndividualTestTime(self):
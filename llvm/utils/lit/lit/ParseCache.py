@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import time
+
+
+CACHE_FILE = '.lit_parse_cache.json'
+CACHE_VERSION = 1
+
+# Files modified this recently may be modified again within the granularity
+# of their timestamp, so their stat stamps are not trusted.
+_RACY_SECONDS = 2
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    if time.time() - st.st_mtime < _RACY_SECONDS:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+class ParseCache(object):
+    """
+    The integrated test keyword lines of the tests of a suite from previous
+    runs, stored next to .lit_test_times.txt in the suite's exec root.
+
+    Each entry records, for one test file, the (line number, keyword, line)
+    commands found for each set of keywords it was scanned for, along with
+    the file's stat stamp and the SHA-1 of its contents.  An unchanged stamp
+    means the file does not need to be read at all; an unchanged hash means
+    it does not need to be scanned again.
+
+    The cache is loaded by the main process and copied into the workers.  The
+    entries a worker adds are sent back with the test result (see
+    take_updates()), and the main process writes the merged cache after the
+    run.
+    """
+
+    def __init__(self, suite):
+        self.path = os.path.join(suite.exec_root, CACHE_FILE)
+        self.files = self._read()
+        self.updates = {}
+        self.dirty = False
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+            return {}
+        return data.get('files', {})
+
+    def get_commands(self, source_path, keywords, scan):
+        """
+        get_commands(source_path, keywords, scan) -> [(line, keyword, text)]
+
+        Returns the commands of the file for the given keywords, calling
+        scan(data) with the contents of the file if they are not cached.
+        """
+        key = '|'.join(sorted(keywords))
+        entry = self.files.get(source_path)
+        try:
+            stamp = file_stamp(source_path)
+        except OSError:
+            stamp = None
+        if entry is not None and stamp is not None and entry['stamp'] == stamp:
+            commands = entry['scans'].get(key)
+            if commands is not None:
+                return commands
+
+        with open(source_path, 'rb') as f:
+            data = f.read()
+        sha = hashlib.sha1(data).hexdigest()
+        if entry is None or entry['sha'] != sha:
+            entry = {'stamp': stamp, 'sha': sha, 'scans': {}}
+        else:
+            entry = dict(entry, stamp=stamp)
+        commands = entry['scans'].get(key)
+        if commands is None:
+            commands = scan(data)
+            entry['scans'] = dict(entry['scans'], **{key: commands})
+
+        self.files[source_path] = entry
+        self.updates[source_path] = entry
+        return commands
+
+    def take_updates(self):
+        updates, self.updates = self.updates, {}
+        return updates
+
+    def merge(self, updates):
+        if updates:
+            self.files.update(updates)
+            self.dirty = True
+
+    def write(self, lit_config):
+        self.merge(self.take_updates())
+        if not self.dirty:
+            return
+        try:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump({'version': CACHE_VERSION, 'files': self.files}, f)
+            os.replace(temp_path, self.path)
+            self.dirty = False
+        except OSError:
+            lit_config.warning('Could not save parse cache: ' + self.path)
+
+
+def write_parse_caches(tests, lit_config):
+    """Save the parse caches of the suites of the given tests."""
+    suites = {id(t.suite): t.suite for t in tests}
+    for suite in suites.values():
+        if suite.parse_cache is not None:
+            suite.parse_cache.write(lit_config)
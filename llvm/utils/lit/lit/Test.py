@@ -157,6 +157,8 @@ class Result(object):
         self.metrics = {}
         # The micro-test results reported by this test.
         self.microResults = {}
+        # The file holding the full output, if the output was truncated.
+        self.output_file = None
 
     def addMetric(self, name, value):
         """
@@ -209,6 +211,10 @@ class TestSuite:
         self.config = config
 
         self.test_times = read_test_times(self)
+        # Loaded on demand during discovery, see lit.DiscoveryCache.
+        self.discovery_cache = None
+        # Loaded before the tests run, see lit.ParseCache.
+        self.parse_cache = None
 
     def getSourcePath(self, components):
         return os.path.join(self.source_root, *components)
@@ -406,7 +412,8 @@ class Test:
         REQUIRES annotations for this test.
         """
         import lit.TestRunner
-        parsed = lit.TestRunner._parseKeywords(self.getSourcePath(), require_script=False)
+        parsed = lit.TestRunner._parseKeywords(self.getSourcePath(), require_script=False,
+                                               cache=self.suite.parse_cache)
         feature_keywords = ('UNSUPPORTED:', 'REQUIRES:', 'XFAIL:')
         boolean_expressions = itertools.chain.from_iterable(
             parsed[k] or [] for k in feature_keywords
@@ -0,0 +1,202 @@
+"""
+The results of each test over many runs, used to find tests that became slower
+and tests that fail intermittently.
+
+The history of a test suite is stored in .lit_test_history in its exec root.
+Every run appends one line, a JSON object that maps the path of each test it
+ran to a list of [elapsed, result code] samples.  Samples of runs that
+measured the peak RSS of the test in bytes have it as a third element, see
+lit.worker._add_resource_metrics().  Once the file holds
+COMPACT_LINES lines, it is rewritten as a single line that keeps the last
+HISTORY_SIZE samples of each test.  The file starts with a fixed-width header
+line holding the number of lines, updated in place, so that a run does not
+need to read the history to append to it.
+"""
+
+import json
+import os
+
+HISTORY_FILE = '.lit_test_history'
+HISTORY_SIZE = 30
+COMPACT_LINES = 50
+
+# Only the durations of passing runs are comparable with each other.
+_passing_codes = {'PASS', 'FLAKYPASS', 'XFAIL'}
+_failing_codes = {'FAIL', 'XPASS', 'TIMEOUT', 'UNRESOLVED'}
+
+_HEADER = '#lines %08d\n'
+_HEADER_SIZE = len(_HEADER % 0)
+
+
+def _read_lines(exec_root):
+    try:
+        with open(os.path.join(exec_root, HISTORY_FILE), 'r') as f:
+            return f.readlines()
+    except OSError:
+        return []
+
+
+def _merge(lines):
+    history = {}
+    for line in lines:
+        if line.startswith('#'):
+            continue
+        try:
+            run = json.loads(line)
+        except ValueError:
+            # A line cut short by a killed run.
+            continue
+        for path, samples in run.items():
+            history.setdefault(path, []).extend(samples)
+    for path, samples in history.items():
+        del samples[:-HISTORY_SIZE]
+    return history
+
+
+def read_test_history(suite):
+    """
+    read_test_history(suite) -> {path: [[elapsed, code(, max_rss)], ...]}
+
+    Returns the last HISTORY_SIZE samples of each test of the suite, oldest
+    first, keyed by the '/'-joined path in suite.
+    """
+    return _merge(_read_lines(suite.exec_root))
+
+
+def _append(path, line):
+    """
+    Append a line to the history file and return True, or return False if
+    the file needs to be compacted first.
+    """
+    with open(path, 'r+') as f:
+        header = f.read(_HEADER_SIZE)
+        try:
+            count = int(header[len('#lines '):]) if header[0] == '#' else None
+        except (IndexError, ValueError):
+            count = None
+        if count is None or count + 1 >= COMPACT_LINES:
+            return False
+        f.seek(0, os.SEEK_END)
+        f.write(line)
+        f.seek(0)
+        f.write(_HEADER % (count + 1))
+    return True
+
+
+def record_test_history(exec_root, samples, lit_config):
+    """Append the samples of one run to the history in exec_root."""
+    path = os.path.join(exec_root, HISTORY_FILE)
+    line = json.dumps(samples, separators=(',', ':')) + '\n'
+    try:
+        try:
+            if _append(path, line):
+                return
+            lines = _read_lines(exec_root) + [line]
+        except FileNotFoundError:
+            lines = [line]
+        if len(lines) > 1:
+            history = _merge(lines)
+            lines = [json.dumps(history, separators=(',', ':')) + '\n']
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(_HEADER % 1)
+            f.write(lines[0])
+        os.replace(temp_path, path)
+    except OSError:
+        lit_config.warning('Could not save test history: ' + path)
+
+
+def _median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def get_median_times(history):
+    """
+    get_median_times(history) -> {path: median elapsed}
+
+    Only tests with passing runs are included.
+    """
+    times = {}
+    for path, samples in history.items():
+        elapsed = [s[0] for s in samples if s[1] in _passing_codes]
+        if elapsed:
+            times[path] = _median(elapsed)
+    return times
+
+
+def get_peak_memory(history):
+    """
+    get_peak_memory(history) -> {path: bytes}
+
+    The largest peak RSS recorded for each test, whatever its result.
+    """
+    peaks = {}
+    for path, samples in history.items():
+        rss = [s[2] for s in samples if len(s) > 2]
+        if rss:
+            peaks[path] = max(rss)
+    return peaks
+
+
+def use_median_times(suite):
+    """
+    Replace the last times of the tests of the suite with their median times,
+    keeping the sign that marks tests that failed last time.
+    """
+    if not suite.test_times:
+        return
+    medians = get_median_times(read_test_history(suite))
+    for path, time in suite.test_times.items():
+        if path in medians:
+            suite.test_times[path] = -medians[path] if time < 0 else medians[path]
+
+
+def find_slow_tests(history, recent=3, min_samples=5, threshold=3.5,
+                    min_increase=0.05):
+    """
+    find_slow_tests(history) -> [(path, before, after)]
+
+    A test is slow if the median of its last `recent` passing times is an
+    outlier among its earlier passing times: its robust z-score (the distance
+    from their median in units of their median absolute deviation) is above
+    `threshold`, and it is at least `min_increase` seconds slower.  Tests with
+    fewer than `min_samples` earlier times are not considered.
+    """
+    slow = []
+    for path, samples in history.items():
+        elapsed = [s[0] for s in samples if s[1] in _passing_codes]
+        if len(elapsed) < min_samples + recent:
+            continue
+        before = _median(elapsed[:-recent])
+        after = _median(elapsed[-recent:])
+        mad = _median([abs(e - before) for e in elapsed[:-recent]])
+        # Quantized or very stable times can have a zero deviation.
+        spread = max(1.4826 * mad, 0.05 * before, 1e-3)
+        if (after - before) / spread > threshold and \
+                after - before >= min_increase:
+            slow.append((path, before, after))
+    return slow
+
+
+def find_intermittent_tests(history, min_flips=3):
+    """
+    find_intermittent_tests(history) -> [(path, runs, failures, flaky)]
+
+    A test is intermittent if it only passed after a retry at least once, or
+    if its outcome flipped between pass and failure at least `min_flips`
+    times.  A test that broke and was then fixed flips only twice.
+    """
+    intermittent = []
+    for path, samples in history.items():
+        codes = [s[1] for s in samples]
+        outcomes = [code in _failing_codes for code in codes
+                    if code in _passing_codes or code in _failing_codes]
+        flaky = codes.count('FLAKYPASS')
+        flips = sum(1 for a, b in zip(outcomes, outcomes[1:]) if a != b)
+        if flaky or flips >= min_flips:
+            intermittent.append((path, len(outcomes), sum(outcomes), flaky))
+    return intermittent
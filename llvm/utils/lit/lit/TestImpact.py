@@ -0,0 +1,228 @@
+"""
+Select the tests that can be affected by a set of changed files.
+
+The selection is conservative: a test is dropped only if none of the changed
+files can be connected to it.  A changed file is connected to a test if
+
+  * it is the test itself,
+  * it is a lit configuration file in a directory enclosing the test,
+  * a RUN line of the test names it (or a directory containing it), usually
+    through %S or %p,
+  * it is a tool the test runs, or it is listed in the dependency map as an
+    input of such a tool, or
+  * it sits in a test directory without being named by any test, in which case
+    every test in and below that directory is selected.
+
+The dependency map is a JSON object mapping tool names (as they appear in RUN
+lines after substitution, or the executables of googletest suites) to the
+files and directories they are built from, relative to the map file:
+
+  {"opt": ["llvm/lib/Transforms", "llvm/tools/opt"], ...}
+
+If a changed file cannot be connected to any test or tool at all, its impact
+is unknown and every test is selected.  The files lit itself keeps next to the
+tests, like .lit_test_times.txt, are ignored.
+"""
+
+import json
+import os
+import re
+
+import lit.discovery
+import lit.TestRunner
+import lit.util
+
+
+def get_changed_files(rev, lit_config):
+    """
+    get_changed_files(rev, lit_config) -> [path]
+
+    Returns the absolute paths of the files that differ between the given git
+    revision and the working tree, including untracked files.
+    """
+    def git(*args):
+        try:
+            out, err, exitCode = lit.util.executeCommand(['git'] + list(args))
+        except OSError as e:
+            lit_config.fatal('unable to run git: %s' % e)
+        if exitCode:
+            lit_config.fatal('git %s failed: %s' % (' '.join(args),
+                                                    err.strip()))
+        return [ln for ln in out.splitlines() if ln]
+
+    toplevel = git('rev-parse', '--show-toplevel')[0]
+    changed = git('-C', toplevel, 'diff', '--name-only', rev, '--')
+    changed += git('-C', toplevel, 'ls-files', '--others', '--exclude-standard')
+    return [os.path.normpath(os.path.join(toplevel, p)) for p in changed]
+
+
+def read_dependency_map(path, lit_config):
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        lit_config.fatal('unable to read dependency map %r: %s' % (path, e))
+    base = os.path.dirname(os.path.abspath(path))
+    return {tool: [os.path.normpath(os.path.join(base, p)) for p in paths]
+            for tool, paths in data.items()}
+
+
+def _is_lit_state_file(path):
+    # .lit_test_times.txt, .lit_test_history, the parse and discovery caches,
+    # and their temporary files.
+    return os.path.basename(path).startswith('.lit_')
+
+
+def _is_within(path, dir):
+    return path == dir or path.startswith(dir.rstrip(os.sep) + os.sep)
+
+
+def _tool_name(path):
+    name = os.path.basename(path)
+    if name.lower().endswith('.exe'):
+        name = name[:-4]
+    return name
+
+
+def _is_config_file(path, lit_config):
+    name = os.path.basename(path)
+    if name.endswith('.in'):
+        name = name[:-3]
+    return (name in lit_config.config_names or
+            name in lit_config.site_config_names or
+            name in lit_config.local_config_names)
+
+
+def _in_other_test_suite(path, lit_config):
+    dir = os.path.dirname(path)
+    while True:
+        if lit.discovery.dirContainsTestSuite(dir, lit_config):
+            return True
+        parent = os.path.dirname(dir)
+        if parent == dir:
+            return False
+        dir = parent
+
+
+_token_re = re.compile(r'''[\s|;&<>()'"=,]+''')
+
+
+def _get_references(test):
+    """
+    _get_references(test) -> (paths, tools)
+
+    Returns the absolute paths named in the test's RUN lines and the names of
+    the programs it may run.  Returns None if the RUN lines cannot be analyzed.
+    """
+    source_path = test.getSourcePath()
+    if test.file_path or not os.path.isfile(source_path):
+        # E.g. googletest, where the test runs the executable it names.
+        return set(), {_tool_name(test.getFilePath())}
+    try:
+        parsed = lit.TestRunner._parseKeywords(source_path,
+                                               require_script=False,
+                                               cache=test.suite.parse_cache)
+        tmpDir, tmpBase = lit.TestRunner.getTempPaths(test)
+        substitutions = lit.TestRunner.getDefaultSubstitutions(test, tmpDir,
+                                                               tmpBase)
+        script = lit.TestRunner.applySubstitutions(
+            parsed['RUN:'] or [], substitutions,
+            recursion_limit=test.config.recursiveExpansionLimit)
+    except Exception:
+        return None
+
+    paths = set()
+    tools = set()
+    for ln in script:
+        for token in _token_re.split(ln):
+            if not token or token.startswith('-'):
+                continue
+            tools.add(_tool_name(token))
+            if os.path.isabs(token):
+                paths.add(os.path.normpath(token))
+    return paths, tools
+
+
+def select_affected_tests(tests, changed, dependencies, lit_config):
+    """
+    select_affected_tests(tests, changed, dependencies, lit_config)
+      -> ([(test, reason)], unknown)
+
+    Returns the affected tests, in the given order, with the reason each one
+    was selected, and the changed files whose impact could not be determined.
+    If `unknown` is non-empty, the caller should run every test.
+    """
+    changed = [os.path.normpath(os.path.abspath(p)) for p in changed
+               if not _is_lit_state_file(p)]
+    connected = set()
+
+    # Changed files that are, or that go into, a tool.
+    changed_tools = {}
+    for path in changed:
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            changed_tools.setdefault(_tool_name(path), []).append(path)
+        for tool, inputs in dependencies.items():
+            if any(_is_within(path, i) for i in inputs):
+                changed_tools.setdefault(tool, []).append(path)
+                connected.add(path)
+
+    test_paths = {os.path.normpath(t.getSourcePath()): t for t in tests}
+    test_dirs = {os.path.dirname(p) for p in test_paths}
+    suite_roots = {os.path.normpath(t.suite.source_root) for t in tests}
+
+    reasons = {}
+    def select(test, reason):
+        reasons.setdefault(test, reason)
+
+    for path in changed:
+        if path in test_paths:
+            select(test_paths[path], 'test changed')
+            connected.add(path)
+
+    for path in changed:
+        if _is_config_file(path, lit_config):
+            config_dir = os.path.dirname(path)
+            for test in tests:
+                if _is_within(test.getSourcePath(), config_dir):
+                    select(test, 'config %s changed' % path)
+                    connected.add(path)
+
+    candidates = [p for p in changed if p not in test_paths]
+    for test in (tests if candidates else []):
+        refs = _get_references(test)
+        if refs is None:
+            select(test, 'RUN lines could not be analyzed')
+            continue
+        paths, tools = refs
+        for path in candidates:
+            ref = next((r for r in paths if _is_within(path, r) and
+                        (r == path or
+                         _is_within(r, test.suite.source_root))), None)
+            if ref is not None:
+                select(test, 'input %s changed' % path)
+                connected.add(path)
+        for tool in sorted(tools & set(changed_tools)):
+            select(test, 'tool %s affected by %s' %
+                         (tool, changed_tools[tool][0]))
+            connected.update(changed_tools[tool])
+
+    # Files in a test tree that no test names are presumably used by the
+    # tests next to them in some way we could not see.  Files in the trees of
+    # suites that are not being run cannot affect anything.
+    for path in changed:
+        if path in connected:
+            continue
+        if not any(_is_within(path, r) for r in suite_roots):
+            if _in_other_test_suite(path, lit_config):
+                connected.add(path)
+            continue
+        dir = os.path.dirname(path)
+        while dir not in test_dirs and dir not in suite_roots:
+            dir = os.path.dirname(dir)
+        for test in tests:
+            if _is_within(test.getSourcePath(), dir):
+                select(test, 'file %s changed' % path)
+                connected.add(path)
+
+    unknown = [p for p in changed if p not in connected]
+    return [(t, reasons[t]) for t in tests if t in reasons], unknown
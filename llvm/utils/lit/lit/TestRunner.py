@@ -11,6 +11,7 @@ import platform
 import shutil
 import tempfile
 import threading
+import time
 
 import io
 try:
@@ -18,6 +19,11 @@ try:
 except ImportError:
     from io import StringIO
 
+try:
+    from re import _parser as sre_parse  # Python 3.11 and later
+except ImportError:
+    import sre_parse
+
 from lit.ShCommands import GlobItem, Command
 import lit.ShUtil as ShUtil
 import lit.Test as Test
@@ -152,13 +158,117 @@ class ShellCommandResult(object):
     """Captures the result of an individual command."""
 
     def __init__(self, command, stdout, stderr, exitCode, timeoutReached,
-                 outputFiles = []):
+                 outputFiles = [], elapsed = None, cpuTime = None,
+                 maxRss = None):
         self.command = command
         self.stdout = stdout
         self.stderr = stderr
         self.exitCode = exitCode
         self.timeoutReached = timeoutReached
         self.outputFiles = list(outputFiles)
+        # Wall and CPU time and peak RSS in bytes of the process, if one was
+        # run and measured.
+        self.elapsed = elapsed
+        self.cpuTime = cpuTime
+        self.maxRss = maxRss
+
+class PipeReader(object):
+    """Reads a pipe until EOF on a background thread.
+
+    Draining every pipe concurrently means no pipeline stage can block on a
+    full pipe, without spooling its output through a temporary file.
+    """
+
+    def __init__(self, pipe):
+        self._pipe = pipe
+        self._data = None
+        self._thread = threading.Thread(target=self._read)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _read(self):
+        try:
+            self._data = self._pipe.read()
+        finally:
+            self._pipe.close()
+
+    def read(self):
+        self._thread.join()
+        return self._data
+
+class ProcessWaiter(object):
+    """Waits for a process on a background thread.
+
+    Each stage of a pipeline is reaped as soon as it exits, so the time it
+    took is not stretched to the time the whole pipeline took.
+    """
+
+    def __init__(self, proc):
+        self._proc = proc
+        self._result = None
+        self._endTime = None
+        self._error = None
+        self._thread = threading.Thread(target=self._wait)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _wait(self):
+        try:
+            self._result = waitForProcess(self._proc)
+        except Exception as e:
+            # Raised again by wait(), in the thread running the test.
+            self._error = e
+        self._endTime = time.time()
+
+    def wait(self):
+        """Return (exit code, CPU time, peak RSS, time of exit)"""
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result + (self._endTime,)
+
+# The largest peak RSS, in bytes, of the processes reaped by waitForProcess()
+# since the last call to takePeakCommandRSS(), or None.
+_peakCommandRSS = None
+_peakCommandRSSLock = threading.Lock()
+
+def takePeakCommandRSS():
+    """Return the peak RSS of the commands run since the last call, and reset
+    it.
+
+    A worker runs one test at a time, so taking it before and after a test
+    gives the peak RSS of the largest command of that test.
+    """
+    global _peakCommandRSS
+    with _peakCommandRSSLock:
+        peak, _peakCommandRSS = _peakCommandRSS, None
+    return peak
+
+def waitForProcess(proc):
+    """Wait for proc to exit and return (exit code, CPU time or None, peak RSS
+    in bytes or None).
+
+    The peak RSS includes the descendants of proc it waited for.
+    """
+    global _peakCommandRSS
+    if hasattr(os, 'wait4'):
+        try:
+            _, status, rusage = os.wait4(proc.pid, 0)
+        except ChildProcessError:
+            pass
+        else:
+            if os.WIFSIGNALED(status):
+                proc.returncode = -os.WTERMSIG(status)
+            else:
+                proc.returncode = os.WEXITSTATUS(status)
+            # Kilobytes, but bytes on macOS.
+            maxRss = rusage.ru_maxrss * (1 if sys.platform == 'darwin'
+                                         else 1024)
+            with _peakCommandRSSLock:
+                _peakCommandRSS = max(_peakCommandRSS or 0, maxRss)
+            return (proc.returncode, rusage.ru_utime + rusage.ru_stime,
+                    maxRss)
+    return proc.wait(), None, None
 
 def executeShCmd(cmd, shenv, results, timeout=0):
     """
@@ -640,8 +750,9 @@ def _executeShCmd(cmd, shenv, results, timeoutHelper):
 
     procs = []
     proc_not_counts = []
+    proc_start_times = []
     default_stdin = subprocess.PIPE
-    stderrTempFiles = []
+    stderrReaders = []
     opened_files = []
     named_temp_files = []
     builtin_commands = set(['cat', 'diff'])
@@ -760,13 +871,8 @@ def _executeShCmd(cmd, shenv, results, timeoutHelper):
         else:
             stderrIsStdout = False
 
-            # Don't allow stderr on a PIPE except for the last
-            # process, this could deadlock.
-            #
-            # FIXME: This is slow, but so is deadlock.
-            if stderr == subprocess.PIPE and j != cmd.commands[-1]:
-                stderr = tempfile.TemporaryFile(mode='w+b')
-                stderrTempFiles.append((i, stderr))
+            # The stderr of every process but the last is drained on a
+            # separate thread once the process has been created, see below.
 
         # Resolve the executable path ourselves.
         executable = None
@@ -804,6 +910,7 @@ def _executeShCmd(cmd, shenv, results, timeoutHelper):
             args = quote_windows_command(args)
 
         try:
+            proc_start_times.append(time.time())
             procs.append(subprocess.Popen(args, cwd=cmd_shenv.cwd,
                                           executable = executable,
                                           stdin = stdin,
@@ -824,6 +931,12 @@ def _executeShCmd(cmd, shenv, results, timeoutHelper):
             procs[-1].stdin.close()
             procs[-1].stdin = None
 
+        # Don't leave stderr on a PIPE that nobody reads except for the last
+        # process, this could deadlock.
+        if stderr == subprocess.PIPE and j != cmd.commands[-1]:
+            stderrReaders.append((i, PipeReader(procs[-1].stderr)))
+            procs[-1].stderr = None
+
         # Update the current stdin source.
         if stdout == subprocess.PIPE:
             default_stdin = procs[-1].stdout
@@ -839,9 +952,16 @@ def _executeShCmd(cmd, shenv, results, timeoutHelper):
     for (name, mode, f, path) in opened_files:
         f.close()
 
-    # FIXME: There is probably still deadlock potential here. Yawn.
+    # Reap every process as it exits, to time each of them on its own.
+    waiters = [ProcessWaiter(proc) for proc in procs]
+
+    # Read the output of the last process.  We don't use communicate() because
+    # it would reap the process before we can collect its resource usage.
+    lastReaders = [PipeReader(f) if f is not None else None
+                   for f in (procs[-1].stdout, procs[-1].stderr)]
     procData = [None] * len(procs)
-    procData[-1] = procs[-1].communicate()
+    procData[-1] = tuple(r.read() if r is not None else None
+                         for r in lastReaders)
 
     for i in range(len(procs) - 1):
         if procs[i].stdout is not None:
@@ -854,15 +974,13 @@ def _executeShCmd(cmd, shenv, results, timeoutHelper):
             err = ''
         procData[i] = (out,err)
 
-    # Read stderr out of the temp files.
-    for i,f in stderrTempFiles:
-        f.seek(0, 0)
-        procData[i] = (procData[i][0], f.read())
-        f.close()
+    for i,reader in stderrReaders:
+        procData[i] = (procData[i][0], reader.read())
 
     exitCode = None
     for i,(out,err) in enumerate(procData):
-        res = procs[i].wait()
+        res, cpuTime, maxRss, endTime = waiters[i].wait()
+        elapsed = endTime - proc_start_times[i]
         # Detect Ctrl-C in subprocess.
         if res == -signal.SIGINT:
             raise KeyboardInterrupt
@@ -902,7 +1020,7 @@ def _executeShCmd(cmd, shenv, results, timeoutHelper):
 
         results.append(ShellCommandResult(
             cmd.commands[i], out, err, res, timeoutHelper.timeoutReached(),
-            output_files))
+            output_files, elapsed, cpuTime, maxRss))
         if cmd.pipe_err:
             # Take the last failing exit code from the pipeline.
             if not exitCode or res != 0:
@@ -956,6 +1074,12 @@ def executeScriptInternal(test, litConfig, tmpBase, commands, cwd):
         # Write the command line run.
         out += '$ %s\n' % (' '.join('"%s"' % s
                                     for s in result.command.args),)
+        if litConfig.time_commands and result.elapsed is not None:
+            if result.cpuTime is not None:
+                out += '# command time: %.3fs wall, %.3fs cpu\n' % (
+                    result.elapsed, result.cpuTime)
+            else:
+                out += '# command time: %.3fs wall\n' % (result.elapsed,)
 
         # If nothing interesting happened, move on.
         if litConfig.maxIndividualTestTime == 0 and \
@@ -1085,42 +1209,44 @@ def parseIntegratedTestScriptCommands(source_path, keywords):
     # remaining code can work with "strings" agnostic of the executing Python
     # version.
 
-    keywords_re = re.compile(
-        to_bytes("(%s)(.*)\n" % ("|".join(re.escape(k) for k in keywords),)))
-
     f = open(source_path, 'rb')
     try:
         # Read the entire file contents.
         data = f.read()
-
-        # Ensure the data ends with a newline.
-        if not data.endswith(to_bytes('\n')):
-            data = data + to_bytes('\n')
-
-        # Iterate over the matches.
-        line_number = 1
-        last_match_position = 0
-        for match in keywords_re.finditer(data):
-            # Compute the updated line number by counting the intervening
-            # newlines.
-            match_position = match.start()
-            line_number += data.count(to_bytes('\n'), last_match_position,
-                                      match_position)
-            last_match_position = match_position
-
-            # Convert the keyword and line to UTF-8 strings and yield the
-            # command. Note that we take care to return regular strings in
-            # Python 2, to avoid other code having to differentiate between the
-            # str and unicode types.
-            #
-            # Opening the file in binary mode prevented Windows \r newline
-            # characters from being converted to Unix \n newlines, so manually
-            # strip those from the yielded lines.
-            keyword,ln = match.groups()
-            yield (line_number, to_string(keyword.decode('utf-8')),
-                   to_string(ln.decode('utf-8').rstrip('\r')))
     finally:
         f.close()
+    return _scanIntegratedTestScriptCommands(data, keywords)
+
+def _scanIntegratedTestScriptCommands(data, keywords):
+    keywords_re = re.compile(
+        to_bytes("(%s)(.*)\n" % ("|".join(re.escape(k) for k in keywords),)))
+
+    # Ensure the data ends with a newline.
+    if not data.endswith(to_bytes('\n')):
+        data = data + to_bytes('\n')
+
+    # Iterate over the matches.
+    line_number = 1
+    last_match_position = 0
+    for match in keywords_re.finditer(data):
+        # Compute the updated line number by counting the intervening
+        # newlines.
+        match_position = match.start()
+        line_number += data.count(to_bytes('\n'), last_match_position,
+                                  match_position)
+        last_match_position = match_position
+
+        # Convert the keyword and line to UTF-8 strings and yield the
+        # command. Note that we take care to return regular strings in
+        # Python 2, to avoid other code having to differentiate between the
+        # str and unicode types.
+        #
+        # Opening the file in binary mode prevented Windows \r newline
+        # characters from being converted to Unix \n newlines, so manually
+        # strip those from the yielded lines.
+        keyword,ln = match.groups()
+        yield (line_number, to_string(keyword.decode('utf-8')),
+               to_string(ln.decode('utf-8').rstrip('\r')))
 
 def getTempPaths(test):
     """Get the temporary location, this is always relative to the test suite
@@ -1131,6 +1257,18 @@ def getTempPaths(test):
     tmpBase = os.path.join(tmpDir, execbase)
     return tmpDir, tmpBase
 
+def getOutputPath(test):
+    """Get the path of the file that holds the full output of a test when its
+    result only keeps the beginning and the end."""
+    if test.file_path:
+        # Tests from the same executable, like googletest shards, have exec
+        # paths below the executable, so their output is saved next to it.
+        execdir, execbase = os.path.split(test.file_path)
+        return os.path.join(execdir, 'Output', '%s.%s.output' % (
+            execbase, '.'.join(test.path_in_suite)))
+    tmpDir, tmpBase = getTempPaths(test)
+    return tmpBase + '.output'
+
 def colonNormalizePath(path):
     if kIsWindows:
         return re.sub(r'^(.):', r'\1', path.replace('\\', '/'))
@@ -1218,6 +1356,37 @@ def _memoize(f):
 def _caching_re_compile(r):
     return re.compile(r)
 
+@_memoize
+def _getRequiredLiteral(r):
+    """
+    Return a string that every match of the regular expression r contains, or
+    None if there is no such string or it cannot be determined.
+
+    Most substitutions are spelled out literally, like '%clang' or tool names
+    between lookarounds, so a substring test rules out nearly all of them for
+    a given line without running the regular expression.
+    """
+    try:
+        parsed = sre_parse.parse(r)
+        state = parsed.state if hasattr(parsed, 'state') else parsed.pattern
+        if state.flags & sre_parse.SRE_FLAG_IGNORECASE:
+            return None
+    except Exception:
+        return None
+
+    best = run = ''
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run += chr(av)
+        elif op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            # Zero-width, so the literals around it are still adjacent.
+            continue
+        else:
+            run = ''
+        if len(run) > len(best):
+            best = run
+    return best or None
+
 def applySubstitutions(script, substitutions, conditions={},
                        recursion_limit=None):
     """
@@ -1230,13 +1399,22 @@ def applySubstitutions(script, substitutions, conditions={},
     the line can still can be substituted after being substituted
     `recursion_limit` times, it is an error. If the `recursion_limit` is
     `None` (the default), no recursive substitution is performed at all.
+
+    A substitution is skipped for a line that lacks a literal every match of
+    its pattern contains.  If LIT_VERIFY_SUBSTITUTIONS is set in the
+    environment, every line is also substituted without skipping anything,
+    and a different result is an error.
     """
 
     # We use #_MARKER_# to hide %% while we do the other substitutions.
     def escapePercents(ln):
+        if '%%' not in ln:
+            return ln
         return _caching_re_compile('%%').sub('#_MARKER_#', ln)
 
     def unescapePercents(ln):
+        if '#_MARKER_#' not in ln:
+            return ln
         return _caching_re_compile('#_MARKER_#').sub('%', ln)
 
     def substituteIfElse(ln):
@@ -1327,10 +1505,15 @@ def applySubstitutions(script, substitutions, conditions={},
         assert len(ln) == 0
         return result
 
-    def processLine(ln):
+    def processLine(ln, skip):
         # Apply substitutions
         ln = substituteIfElse(escapePercents(ln))
         for a,b in substitutions:
+            ln = escapePercents(ln)
+            if skip:
+                literal = _getRequiredLiteral(a)
+                if literal is not None and literal not in ln:
+                    continue
             if kIsWindows:
                 b = b.replace("\\","\\\\")
             # re.compile() has a built-in LRU cache with 512 entries. In some
@@ -1340,19 +1523,19 @@ def applySubstitutions(script, substitutions, conditions={},
             # short-lived, since the set of substitutions is fairly small, and
             # since thrashing has such bad consequences, not bounding the cache
             # seems reasonable.
-            ln = _caching_re_compile(a).sub(str(b), escapePercents(ln))
+            ln = _caching_re_compile(a).sub(str(b), ln)
 
         # Strip the trailing newline and any extra whitespace.
         return ln.strip()
 
-    def processLineToFixedPoint(ln):
+    def processLineToFixedPoint(ln, skip):
         assert isinstance(recursion_limit, int) and recursion_limit >= 0
         origLine = ln
         steps = 0
-        processed = processLine(ln)
+        processed = processLine(ln, skip)
         while processed != ln and steps < recursion_limit:
             ln = processed
-            processed = processLine(ln)
+            processed = processLine(ln, skip)
             steps += 1
 
         if processed != ln:
@@ -1363,8 +1546,15 @@ def applySubstitutions(script, substitutions, conditions={},
         return processed
 
     process = processLine if recursion_limit is None else processLineToFixedPoint
-    
-    return [unescapePercents(process(ln)) for ln in script]
+
+    result = [unescapePercents(process(ln, True)) for ln in script]
+    if os.environ.get('LIT_VERIFY_SUBSTITUTIONS'):
+        for ln, processed in zip(script, result):
+            expected = unescapePercents(process(ln, False))
+            if processed != expected:
+                raise ValueError("Substitution of '%s' produced '%s' instead "
+                                 "of '%s'" % (ln, processed, expected))
+    return result
 
 
 class ParserKind(object):
@@ -1543,7 +1733,7 @@ class IntegratedTestKeywordParser(object):
 
 
 def _parseKeywords(sourcepath, additional_parsers=[],
-                   require_script=True):
+                   require_script=True, cache=None):
     """_parseKeywords
 
     Scan an LLVM/Clang style integrated test script and extract all the lines
@@ -1551,6 +1741,9 @@ def _parseKeywords(sourcepath, additional_parsers=[],
     'UNSUPPORTED' and 'ALLOW_RETRIES', as well as other specified custom
     parsers.
 
+    If a lit.ParseCache.ParseCache is given, the keyword lines are looked up
+    in it instead of scanning the file again.
+
     Returns a dictionary mapping each custom parser to its value after
     parsing the test.
     """
@@ -1577,9 +1770,19 @@ def _parseKeywords(sourcepath, additional_parsers=[],
         keyword_parsers[parser.keyword] = parser
 
     # Collect the test lines from the script.
-    for line_number, command_type, ln in \
-            parseIntegratedTestScriptCommands(sourcepath,
-                                              keyword_parsers.keys()):
+    keywords = list(keyword_parsers.keys())
+    commands = None
+    if cache is not None:
+        def scan(data):
+            return list(_scanIntegratedTestScriptCommands(data, keywords))
+        try:
+            commands = cache.get_commands(sourcepath, keywords, scan)
+        except UnicodeDecodeError:
+            # Report it when the offending line is reached, as usual.
+            commands = None
+    if commands is None:
+        commands = parseIntegratedTestScriptCommands(sourcepath, keywords)
+    for line_number, command_type, ln in commands:
         parser = keyword_parsers[command_type]
         parser.parseLine(line_number, ln)
         if command_type == 'END.' and parser.getValue() is True:
@@ -1627,7 +1830,7 @@ def parseIntegratedTestScript(test, additional_parsers=[],
     # Parse the test sources and extract test properties
     try:
         parsed = _parseKeywords(test.getSourcePath(), additional_parsers,
-                                require_script)
+                                require_script, test.suite.parse_cache)
     except ValueError as e:
         return lit.Test.Result(Test.UNRESOLVED, str(e))
     script = parsed['RUN:'] or []
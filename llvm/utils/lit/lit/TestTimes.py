@@ -1,5 +1,11 @@
 import os
 
+from lit.TestHistory import record_test_history
+
+# The time recorded for tests reported to take no time, such as googletest
+# tests under a millisecond, so that the sign still tells failures apart.
+MIN_TEST_TIME = 1e-6
+
 
 def read_test_times(suite):
     test_times = {}
@@ -17,18 +23,26 @@ def read_test_times(suite):
 
 def record_test_times(tests, lit_config):
     times_by_suite = {}
+    history_by_suite = {}
     for t in tests:
         assert t.suite.test_times is None
-        if not t.result.elapsed:
+        if t.result.elapsed is None:
             continue
         if not t.suite.exec_root in times_by_suite:
             times_by_suite[t.suite.exec_root] = read_test_times(t.suite)
-        time = -t.result.elapsed if t.isFailure() else t.result.elapsed
+        time = max(t.result.elapsed, MIN_TEST_TIME)
+        if t.isFailure():
+            time = -time
         # The "path" here is only used as a key into a dictionary. It is never
         # used as an actual path to a filesystem API, therefore we use '/' as
         # the canonical separator so that Unix and Windows machines can share
         # timing data.
-        times_by_suite[t.suite.exec_root]['/'.join(t.path_in_suite)] = t.result.elapsed
+        path = '/'.join(t.path_in_suite)
+        times_by_suite[t.suite.exec_root][path] = time
+        sample = [round(t.result.elapsed, 4), t.result.code.name]
+        if 'max_rss' in t.result.metrics:
+            sample.append(t.result.metrics['max_rss'].todata())
+        history_by_suite.setdefault(t.suite.exec_root, {})[path] = [sample]
 
     for s, value in times_by_suite.items():
         try:
@@ -39,3 +53,6 @@ def record_test_times(tests, lit_config):
         except:
             lit_config.warning('Could not save test time: ' + path)
             continue
+
+    for s, samples in history_by_suite.items():
+        record_test_history(s, samples, lit_config)
@@ -1,4 +1,6 @@
 import getopt
+import re
+import shutil
 import sys
 try:
     from StringIO import StringIO
@@ -27,6 +29,15 @@ def convertToCaretAndMNotation(data):
 
    return newdata.getvalue().encode()
 
+# Bytes that -v shows in caret and M- notation, and their notation.
+_nonprinting = re.compile(b'[^\t\n\x20-\x7e]')
+_notation = [convertToCaretAndMNotation(bytearray([i])) for i in range(256)]
+
+def showNonprinting(data):
+    """Like convertToCaretAndMNotation, but only converts the bytes that need
+    it rather than looping over all of them in Python."""
+    return _nonprinting.sub(lambda m: _notation[ord(m.group())], data)
+
 
 def main(argv):
     arguments = argv[1:]
@@ -52,13 +63,13 @@ def main(argv):
             msvcrt.setmode(sys.stdout.fileno(),os.O_BINARY)
     for filename in filenames:
         try:
-            fileToCat = open(filename,"rb")
-            contents = fileToCat.read()
-            if show_nonprinting:
-                contents = convertToCaretAndMNotation(contents)
-            writer.write(contents)
+            with open(filename, "rb") as fileToCat:
+                if show_nonprinting:
+                    writer.write(showNonprinting(fileToCat.read()))
+                else:
+                    # Large files are copied in chunks.
+                    shutil.copyfileobj(fileToCat, writer)
             sys.stdout.flush()
-            fileToCat.close()
         except IOError as error:
             sys.stderr.write(str(error))
             sys.exit(1)
@@ -2,6 +2,7 @@ import difflib
 import functools
 import getopt
 import io
+import itertools
 import locale
 import os
 import sys
@@ -9,6 +10,14 @@ import sys
 import util
 from util import to_string
 
+# Stop printing a diff after this many lines.  The test output is usually
+# truncated long before that, and formatting the rest is wasted work.
+MAX_DIFF_LINES = 10000
+
+# Myers' algorithm takes O(N * D) time for D edits.  Ranges that need more
+# edits than this are matched with difflib.SequenceMatcher instead.
+MAX_EDIT_COST = 1000
+
 class DiffFlags():
     def __init__(self):
         self.ignore_all_space = False
@@ -29,7 +38,23 @@ def getDirTree(path, basedir=""):
             child_trees.append((filename, None))
         return path, sorted(child_trees)
 
+def filesAreIdentical(filepaths, chunk_size=1 << 16):
+    """Compare two regular files chunk by chunk, stopping at the first
+    difference.  Identical files need no diff whatever the flags are."""
+    if os.path.getsize(filepaths[0]) != os.path.getsize(filepaths[1]):
+        return False
+    with open(filepaths[0], 'rb') as f0, open(filepaths[1], 'rb') as f1:
+        while True:
+            chunk = f0.read(chunk_size)
+            if chunk != f1.read(chunk_size):
+                return False
+            if not chunk:
+                return True
+
 def compareTwoFiles(flags, filepaths):
+    if "-" not in filepaths and filesAreIdentical(filepaths):
+        return 0
+
     filelines = []
     for file in filepaths:
         if file == "-":
@@ -50,27 +75,10 @@ def compareTwoFiles(flags, filepaths):
             return compareTwoBinaryFiles(flags, filepaths, filelines)
 
 def compareTwoBinaryFiles(flags, filepaths, filelines):
-    exitCode = 0
-    if hasattr(difflib, 'diff_bytes'):
-        # python 3.5 or newer
-        diffs = difflib.diff_bytes(difflib.unified_diff, filelines[0],
-                                   filelines[1], filepaths[0].encode(),
-                                   filepaths[1].encode(),
-                                   n = flags.num_context_lines)
-        diffs = [diff.decode(errors="backslashreplace") for diff in diffs]
-    else:
-        # python 2.7
-        if flags.unified_diff:
-            func = difflib.unified_diff
-        else:
-            func = difflib.context_diff
-        diffs = func(filelines[0], filelines[1], filepaths[0], filepaths[1],
-                     n = flags.num_context_lines)
-
-    for diff in diffs:
-        sys.stdout.write(to_string(diff))
-        exitCode = 1
-    return exitCode
+    filelines = [[line.decode(errors="backslashreplace") for line in lines]
+                 for lines in filelines]
+    return printDiff(unifiedDiff, filelines, filepaths,
+                     flags.num_context_lines)
 
 def compareTwoTextFiles(flags, filepaths, filelines_bin, encoding):
     filelines = []
@@ -81,7 +89,6 @@ def compareTwoTextFiles(flags, filepaths, filelines_bin, encoding):
             lines.append(line)
         filelines.append(lines)
 
-    exitCode = 0
     def compose2(f, g):
         return lambda x: f(g(x))
 
@@ -97,13 +104,259 @@ def compareTwoTextFiles(flags, filepaths, filelines_bin, encoding):
     for idx, lines in enumerate(filelines):
         filelines[idx]= [f(line) for line in lines]
 
-    func = difflib.unified_diff if flags.unified_diff else difflib.context_diff
-    for diff in func(filelines[0], filelines[1], filepaths[0], filepaths[1],
-                     n = flags.num_context_lines):
+    func = unifiedDiff if flags.unified_diff else contextDiff
+    return printDiff(func, filelines, filepaths, flags.num_context_lines)
+
+def printDiff(func, filelines, filepaths, num_context_lines):
+    exitCode = 0
+    for num, diff in enumerate(func(filelines[0], filelines[1], filepaths[0],
+                                    filepaths[1], num_context_lines)):
+        if num == MAX_DIFF_LINES:
+            sys.stdout.write("... diff truncated after %d lines\n" % num)
+            break
         sys.stdout.write(to_string(diff))
         exitCode = 1
     return exitCode
 
+# The unified and context formats below are the same as difflib's, but the
+# lines are matched with Myers' algorithm in linear space rather than with
+# difflib.SequenceMatcher, which takes quadratic time on large inputs.  Myers'
+# algorithm finds a shortest diff, so where several diffs are possible it may
+# pick different lines than difflib, but never more of them.  The lines are
+# matched lazily, one hunk at a time, so the hunks past MAX_DIFF_LINES lines
+# of output are not matched.
+
+def middleSnake(a, b, a_lo, a_hi, b_lo, b_hi):
+    """Find the middle of a shortest edit script between a[a_lo:a_hi] and
+    b[b_lo:b_hi] by searching forwards and backwards at the same time.
+    Returns the point (x, y) where the searches meet, relative to a_lo and
+    b_lo, or None if the ranges have nothing in common or need more than
+    MAX_EDIT_COST edits."""
+    n, m = a_hi - a_lo, b_hi - b_lo
+    delta = n - m
+    front = delta % 2 != 0
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    v1 = [-1] * (2 * max_d + 2)
+    v2 = [-1] * (2 * max_d + 2)
+    v1[offset + 1] = 0
+    v2[offset + 1] = 0
+    # Diagonals that ran off the edge of the grid are not searched again.
+    k1start = k1end = k2start = k2end = 0
+    for d in range(min(max_d, (MAX_EDIT_COST + 1) // 2 + 1)):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[a_lo + x1] == b[b_lo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < len(v2) and v2[k2_offset] != -1:
+                    if x1 >= n - v2[k2_offset]:
+                        return x1, y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while (x2 < n and y2 < m and
+                   a[a_hi - x2 - 1] == b[b_hi - y2 - 1]):
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < len(v1) and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    if x1 >= n - x2:
+                        return x1, x1 - (k1_offset - offset)
+    return None
+
+def getMatchingBlocks(a, b):
+    """Generate the (i, j, size) blocks of a longest common subsequence of a
+    and b in order, followed by a (len(a), len(b), 0) sentinel like
+    difflib.SequenceMatcher.get_matching_blocks()."""
+    # Compare small integers rather than the lines themselves.
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in a]
+    b = [ids.setdefault(line, len(ids)) for line in b]
+
+    def getMatches():
+        # The ranges left to match, and the matches at the end of ranges,
+        # which come after the matches found inside them.  The leftmost range
+        # is matched first so that matches are generated in order.
+        stack = [(0, len(a), 0, len(b))]
+        while stack:
+            item = stack.pop()
+            if len(item) == 3:
+                yield item
+                continue
+            a_lo, a_hi, b_lo, b_hi = item
+            start = a_lo
+            while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+                a_lo += 1
+                b_lo += 1
+            if a_lo > start:
+                yield (start, b_lo - (a_lo - start), a_lo - start)
+            end = a_hi
+            while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+                a_hi -= 1
+                b_hi -= 1
+            if a_hi < end:
+                stack.append((a_hi, b_hi, end - a_hi))
+            if a_lo == a_hi or b_lo == b_hi:
+                continue
+            # Completely rewritten regions are common and would otherwise take
+            # the search quadratic time.
+            if set(a[a_lo:a_hi]).isdisjoint(b[b_lo:b_hi]):
+                continue
+            split = middleSnake(a, b, a_lo, a_hi, b_lo, b_hi)
+            if split is None:
+                matcher = difflib.SequenceMatcher(None, a[a_lo:a_hi],
+                                                  b[b_lo:b_hi])
+                for i, j, size in matcher.get_matching_blocks()[:-1]:
+                    yield (a_lo + i, b_lo + j, size)
+                continue
+            x, y = split
+            stack.append((a_lo + x, a_hi, b_lo + y, b_hi))
+            stack.append((a_lo, a_lo + x, b_lo, b_lo + y))
+
+    # Merge adjacent matches, as the prefix and suffix of each range are
+    # found separately.
+    block = None
+    for i, j, size in getMatches():
+        if block and block[0] + block[2] == i and block[1] + block[2] == j:
+            block = (block[0], block[1], block[2] + size)
+            continue
+        if block:
+            yield block
+        block = (i, j, size)
+    if block:
+        yield block
+    yield (len(a), len(b), 0)
+
+def getOpcodes(a, b):
+    """Generate the opcodes of difflib.SequenceMatcher(None, a, b)."""
+    i = j = 0
+    for ai, bj, size in getMatchingBlocks(a, b):
+        tag = ''
+        if i < ai and j < bj:
+            tag = 'replace'
+        elif i < ai:
+            tag = 'delete'
+        elif j < bj:
+            tag = 'insert'
+        if tag:
+            yield (tag, i, ai, j, bj)
+        i, j = ai + size, bj + size
+        if size:
+            yield ('equal', ai, i, bj, j)
+
+def getGroupedOpcodes(a, b, n):
+    """Like difflib.SequenceMatcher(None, a, b).get_grouped_opcodes(n)."""
+    codes = getOpcodes(a, b)
+    code = next(codes, ('equal', 0, 1, 0, 1))
+    # Trim the unchanged lines at the start to the context size.
+    if code[0] == 'equal':
+        tag, i1, i2, j1, j2 = code
+        code = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+
+    group = []
+    for next_code in itertools.chain(codes, [None]):
+        tag, i1, i2, j1, j2 = code
+        # Trim the unchanged lines at the end to the context size.
+        if next_code is None and tag == 'equal':
+            i2, j2 = min(i2, i1 + n), min(j2, j1 + n)
+        # Start a new hunk after a long enough run of unchanged lines.
+        if tag == 'equal' and i2 - i1 > 2 * n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+        code = next_code
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+def formatRangeUnified(start, stop):
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return '{}'.format(beginning)
+    if not length:
+        beginning -= 1
+    return '{},{}'.format(beginning, length)
+
+def formatRangeContext(start, stop):
+    beginning = start + 1
+    length = stop - start
+    if not length:
+        beginning -= 1
+    if length <= 1:
+        return '{}'.format(beginning)
+    return '{},{}'.format(beginning, beginning + length - 1)
+
+def unifiedDiff(a, b, fromfile, tofile, n):
+    started = False
+    for group in getGroupedOpcodes(a, b, n):
+        if not started:
+            started = True
+            yield '--- {}\n'.format(fromfile)
+            yield '+++ {}\n'.format(tofile)
+        first, last = group[0], group[-1]
+        yield '@@ -{} +{} @@\n'.format(formatRangeUnified(first[1], last[2]),
+                                       formatRangeUnified(first[3], last[4]))
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in a[i1:i2]:
+                    yield ' ' + line
+                continue
+            if tag in ('replace', 'delete'):
+                for line in a[i1:i2]:
+                    yield '-' + line
+            if tag in ('replace', 'insert'):
+                for line in b[j1:j2]:
+                    yield '+' + line
+
+def contextDiff(a, b, fromfile, tofile, n):
+    prefix = dict(insert='+ ', delete='- ', replace='! ', equal='  ')
+    started = False
+    for group in getGroupedOpcodes(a, b, n):
+        if not started:
+            started = True
+            yield '*** {}\n'.format(fromfile)
+            yield '--- {}\n'.format(tofile)
+        first, last = group[0], group[-1]
+        yield '***************\n'
+        yield '*** {} ****\n'.format(formatRangeContext(first[1], last[2]))
+        if any(tag in ('replace', 'delete') for tag, _, _, _, _ in group):
+            for tag, i1, i2, _, _ in group:
+                if tag != 'insert':
+                    for line in a[i1:i2]:
+                        yield prefix[tag] + line
+        yield '--- {} ----\n'.format(formatRangeContext(first[3], last[4]))
+        if any(tag in ('replace', 'insert') for tag, _, _, _, _ in group):
+            for tag, _, _, j1, j2 in group:
+                if tag != 'delete':
+                    for line in b[j1:j2]:
+                        yield prefix[tag] + line
+
 def printDirVsFile(dir_path, file_path):
     if os.path.getsize(file_path):
         msg = "File %s is a directory while file %s is a regular file"
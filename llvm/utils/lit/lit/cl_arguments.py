@@ -109,7 +109,8 @@ def parse_args():
             action="append",
             default=[])
     execution_group.add_argument("--time-tests",
-            help="Track elapsed wall time for each test",
+            help="Track elapsed wall time for each test, and the wall and CPU "
+                 "time of each command run by the internal shell",
             action="store_true")
     execution_group.add_argument("--no-execute",
             dest="noExecute",
@@ -121,6 +122,10 @@ def parse_args():
     execution_group.add_argument("--resultdb-output",
             type=lit.reports.ResultDBReport,
             help="Write LuCI ResuldDB compatible JSON to the specified file")
+    execution_group.add_argument("--resource-usage",
+            help="Add the CPU time, bytes read and written and, where it is "
+                 "known, the peak RSS of each test to its metrics",
+            action="store_true")
     execution_group.add_argument("--time-trace-output",
             type=lit.reports.TimeTraceReport,
             help="Write Chrome tracing compatible JSON to the specified file")
@@ -129,6 +134,20 @@ def parse_args():
             help="Maximum time to spend running a single test (in seconds). "
                  "0 means no time limit. [Default: 0]",
             type=_non_negative_int)
+    execution_group.add_argument("--max-output-size",
+            metavar="N",
+            help="Keep only the first and last N/2 characters of the output "
+                 "of each test; the full output is saved in the test's "
+                 "Output directory.  0 means no limit. [Default: 0]",
+            type=_non_negative_int,
+            default=0)
+    execution_group.add_argument("--max-memory",
+            metavar="N",
+            help="Do not start a test while the peak RSS recorded for the "
+                 "running tests and that test would exceed N MiB, or while "
+                 "the system is short of memory",
+            type=_non_negative_int,
+            default=0)
     execution_group.add_argument("--max-failures",
             help="Stop execution after the given number of failures.",
             type=_positive_int)
@@ -139,6 +158,19 @@ def parse_args():
             dest="ignoreFail",
             action="store_true",
             help="Exit with status zero even if some tests fail")
+    execution_group.add_argument("--no-discovery-cache",
+            dest="discovery_cache",
+            help="Do not read or write the cached directory listings used to "
+                 "speed up test discovery",
+            action="store_false")
+    execution_group.add_argument("--rebuild-discovery-cache",
+            help="Ignore the cached directory listings used to speed up test "
+                 "discovery and rebuild them from scratch",
+            action="store_true")
+    execution_group.add_argument("--no-parse-cache",
+            dest="parse_cache",
+            help="Do not read or write the cached keyword lines of test files",
+            action="store_false")
     execution_group.add_argument("--no-indirectly-run-check",
             dest="indirectlyRunCheck",
             help="Do not error if a test would not be run if the user had "
@@ -160,6 +192,10 @@ def parse_args():
             choices=[x.value for x in TestOrder],
             default=TestOrder.SMART,
             help="Test order to use (default: smart)")
+    selection_group.add_argument("--median-times",
+            help="Order and schedule tests by their median time over the "
+                 "recorded history instead of their last time",
+            action="store_true")
     selection_group.add_argument("--shuffle",
             dest="order",
             help="Run tests in random order (DEPRECATED: use --order=random)",
@@ -188,6 +224,20 @@ def parse_args():
             type=_semicolon_list,
             help="do not XFAIL tests with paths in the semicolon separated list",
             default=os.environ.get("LIT_XFAIL_NOT", ""))
+    selection_group.add_argument("--changed-since",
+            metavar="REV",
+            help="Only run tests that may be affected by the changes between "
+                 "the given git revision and the working tree")
+    selection_group.add_argument("--affected-by",
+            metavar="LIST",
+            type=_semicolon_list,
+            help="Only run tests that may be affected by changes to the files "
+                 "in the semicolon separated list")
+    selection_group.add_argument("--dependency-map",
+            metavar="PATH",
+            help="JSON file mapping tool names to the source files and "
+                 "directories they are built from, used by --changed-since "
+                 "and --affected-by")
     selection_group.add_argument("--num-shards",
             dest="numShards",
             metavar="M",
@@ -200,6 +250,27 @@ def parse_args():
             help="Run shard #N of the testsuite",
             type=_positive_int,
             default=os.environ.get("LIT_RUN_SHARD"))
+    selection_group.add_argument("--balance-shards",
+            help="Split the tests into shards of roughly equal recorded time "
+                 "instead of dealing them out in turn.  Every shard must see "
+                 "the same test times (.lit_test_times.txt in each suite's "
+                 "exec root), or the shards may overlap and miss tests",
+            action="store_true")
+
+    server_group = parser.add_argument_group("Server")
+    server_group.add_argument("--serve",
+            metavar="DIR",
+            help="Discover the given paths, then keep running and execute "
+                 "tests requested by 'lit --connect=DIR'.  The socket and "
+                 "the key clients authenticate with are created in DIR, "
+                 "which only the current user may access.  Restart the "
+                 "server after changing lit configuration files")
+    server_group.add_argument("--connect",
+            metavar="DIR",
+            help="Run the tests on the lit server started with "
+                 "--serve=DIR instead of in this process.  Options that "
+                 "change how the tests are loaded or run, or that write "
+                 "reports, must be given to the server and are rejected")
 
     debug_group = parser.add_argument_group("Debug and Experimental Options")
     debug_group.add_argument("--debug",
@@ -214,6 +285,10 @@ def parse_args():
     debug_group.add_argument("--show-used-features",
             help="Show all features used in the test suite (in XFAIL, UNSUPPORTED and REQUIRES) and exit",
             action="store_true")
+    debug_group.add_argument("--history-report",
+            help="Show the selected tests whose recorded history shows that "
+                 "they became slower or fail intermittently, and exit",
+            action="store_true")
 
     # LIT is special: environment variables override command line arguments.
     env_args = shlex.split(os.environ.get("LIT_OPTS", ""))
@@ -224,6 +299,9 @@ def parse_args():
     if opts.echoAllCommands:
         opts.showOutput = True
 
+    if opts.serve and opts.connect:
+        parser.error("--serve and --connect are mutually exclusive")
+
     if opts.incremental:
         print('WARNING: --incremental is deprecated. Failing tests now always run first.')
 
@@ -236,7 +314,53 @@ def parse_args():
     else:
         opts.shard = None
 
-    opts.reports = filter(None, [opts.output, opts.xunit_xml_output, opts.resultdb_output, opts.time_trace_output])
+    opts.reports = list(filter(None, [opts.output, opts.xunit_xml_output, opts.resultdb_output, opts.time_trace_output]))
+
+    if opts.connect:
+        # The server loaded the configurations with its own options, and only
+        # the selection and scheduling options are sent with each request.
+        # Reject the others rather than silently running without them.
+        server_options = [
+            ("--config-prefix", opts.configPrefix),
+            ("--param", opts.user_params),
+            ("--echo-all-commands", opts.echoAllCommands),
+            ("--output", opts.output),
+            ("--path", opts.path),
+            ("--vg", opts.useValgrind or opts.valgrindLeakCheck or
+                     opts.valgrindArgs),
+            ("--time-tests", opts.time_tests),
+            ("--no-execute", opts.noExecute),
+            ("--xunit-xml-output", opts.xunit_xml_output),
+            ("--resultdb-output", opts.resultdb_output),
+            ("--resource-usage", opts.resource_usage),
+            ("--time-trace-output", opts.time_trace_output),
+            ("--timeout", opts.maxIndividualTestTime is not None),
+            ("--max-output-size", opts.max_output_size),
+            ("--max-memory", opts.max_memory),
+            ("--allow-empty-runs", opts.allow_empty_runs),
+            ("--no-discovery-cache", not opts.discovery_cache),
+            ("--rebuild-discovery-cache", opts.rebuild_discovery_cache),
+            ("--no-parse-cache", not opts.parse_cache),
+            ("--no-indirectly-run-check", not opts.indirectlyRunCheck),
+            ("--max-tests", opts.max_tests),
+            ("--median-times", opts.median_times),
+            ("--xfail", any(opts.xfail)),
+            ("--xfail-not", any(opts.xfail_not)),
+            ("--changed-since", opts.changed_since),
+            ("--affected-by", opts.affected_by),
+            ("--dependency-map", opts.dependency_map),
+            ("--num-shards", opts.shard),
+            ("--balance-shards", opts.balance_shards),
+            ("--debug", opts.debug),
+            ("--show-suites", opts.show_suites),
+            ("--show-tests", opts.show_tests),
+            ("--show-used-features", opts.show_used_features),
+            ("--history-report", opts.history_report),
+        ]
+        unsupported = [name for name, value in server_options if value]
+        if unsupported:
+            parser.error("--connect cannot be used with %s" %
+                         ", ".join(unsupported))
 
     return opts
 
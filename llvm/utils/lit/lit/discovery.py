@@ -6,6 +6,9 @@ import copy
 import os
 import sys
 
+from lit.DiscoveryCache import DiscoveryCache, config_fingerprint, dir_stamp
+from lit.ParseCache import ParseCache
+from lit.TestHistory import use_median_times
 from lit.TestingConfig import TestingConfig
 from lit import LitConfig, Test
 
@@ -65,7 +68,12 @@ def getTestSuite(item, litConfig, cache):
         cfg.load_from_path(cfgpath, litConfig)
         source_root = os.path.realpath(cfg.test_source_root or path)
         exec_root = os.path.realpath(cfg.test_exec_root or path)
-        return Test.TestSuite(cfg.name, source_root, exec_root, cfg), ()
+        ts = Test.TestSuite(cfg.name, source_root, exec_root, cfg)
+        if litConfig.median_test_times:
+            use_median_times(ts)
+        if litConfig.parse_cache:
+            ts.parse_cache = ParseCache(ts)
+        return ts, ()
 
     def search(path):
         # Check for an already instantiated test suite.
@@ -124,6 +132,24 @@ def getLocalConfig(ts, path_in_suite, litConfig, cache):
 
     return search(path_in_suite)
 
+def getDiscoveryCache(ts, litConfig):
+    if not litConfig.discovery_cache:
+        return None
+    if ts.discovery_cache is None:
+        ts.discovery_cache = DiscoveryCache(ts,
+                                            litConfig.rebuild_discovery_cache)
+    return ts.discovery_cache
+
+def saveDiscoveryCaches(testSuiteCache, litConfig):
+    for ts, _ in testSuiteCache.values():
+        if ts and ts.discovery_cache:
+            if litConfig.debug:
+                litConfig.note('discovery cache for %r: %d hits, %d misses' %
+                               (ts.name, ts.discovery_cache.hits,
+                                ts.discovery_cache.misses))
+            ts.discovery_cache.write(litConfig)
+            ts.discovery_cache = None
+
 def getTests(path, litConfig, testSuiteCache,
              localConfigCache, indirectlyRunCheck):
     # Find the test suite for this input and its relative path.
@@ -194,31 +220,65 @@ def getTestsInSuite(ts, path_in_suite, litConfig,
             )
         return
 
+    # Reuse the directory listing from the last run if nothing has changed.
+    cache = getDiscoveryCache(ts, litConfig)
+    fingerprint = config_fingerprint(lc) if cache else None
+    entry = None
+    if fingerprint is not None:
+        stamp = dir_stamp(ts, path_in_suite)
+        entry = cache.lookup(path_in_suite, fingerprint, stamp)
+
     # Search for tests.
-    if lc.test_format is not None:
+    if entry is not None:
+        for filename in entry['tests']:
+            yield Test.Test(ts, path_in_suite + (filename,), lc)
+    elif lc.test_format is not None:
+        tests = []
         for res in lc.test_format.getTestsInDirectory(ts, path_in_suite,
                                                       litConfig, lc):
+            tests.append(res.path_in_suite[-1])
             yield res
 
     # Search subdirectories.
-    for filename in os.listdir(source_path):
-        # FIXME: This doesn't belong here?
-        if filename in ('Output', '.svn', '.git') or filename in lc.excludes:
-            continue
-
-        # Ignore non-directories.
+    if entry is not None:
+        subdirs = entry['subdirs']
+    else:
+        subdirs = {}
+        for filename in os.listdir(source_path):
+            # FIXME: This doesn't belong here?
+            if filename in ('Output', '.svn', '.git') or filename in lc.excludes:
+                continue
+
+            # Ignore non-directories.
+            file_sourcepath = os.path.join(source_path, filename)
+            if not os.path.isdir(file_sourcepath):
+                continue
+            subdirs[filename] = None
+
+    new_subdirs = {}
+    for filename in subdirs:
         file_sourcepath = os.path.join(source_path, filename)
-        if not os.path.isdir(file_sourcepath):
-            continue
 
         # Check for nested test suites, first in the execpath in case there is a
         # site configuration and then in the source path.
         subpath = path_in_suite + (filename,)
         file_execpath = ts.getExecPath(subpath)
-        if dirContainsTestSuite(file_execpath, litConfig):
+        sub_stamp = dir_stamp(ts, subpath) if fingerprint is not None else None
+        cached = subdirs[filename]
+        if cached is not None and cached[0] == sub_stamp:
+            kind = cached[1]
+        elif dirContainsTestSuite(file_execpath, litConfig):
+            kind = 'exec'
+        elif dirContainsTestSuite(file_sourcepath, litConfig):
+            kind = 'source'
+        else:
+            kind = None
+        new_subdirs[filename] = [sub_stamp, kind]
+
+        if kind == 'exec':
             sub_ts, subpath_in_suite = getTestSuite(file_execpath, litConfig,
                                                     testSuiteCache)
-        elif dirContainsTestSuite(file_sourcepath, litConfig):
+        elif kind == 'source':
             sub_ts, subpath_in_suite = getTestSuite(file_sourcepath, litConfig,
                                                     testSuiteCache)
         else:
@@ -246,6 +306,13 @@ def getTestsInSuite(ts, path_in_suite, litConfig,
         if sub_ts and not N:
             litConfig.warning('test suite %r contained no tests' % sub_ts.name)
 
+    if fingerprint is not None and (entry is None or new_subdirs != subdirs):
+        if entry is not None:
+            tests = entry['tests']
+        elif lc.test_format is None:
+            tests = []
+        cache.store(path_in_suite, fingerprint, stamp, tests, new_subdirs)
+
 def find_tests_for_inputs(lit_config, inputs, indirectlyRunCheck):
     """
     find_tests_for_inputs(lit_config, inputs) -> [Test]
@@ -280,6 +347,8 @@ def find_tests_for_inputs(lit_config, inputs, indirectlyRunCheck):
         if prev == len(tests):
             lit_config.warning('input %r contained no tests' % input)
 
+    saveDiscoveryCaches(test_suite_cache, lit_config)
+
     # This data is no longer needed but keeping it around causes awful
     # performance problems while the test suites run.
     for k, suite in test_suite_cache.items():
@@ -13,6 +13,10 @@ from .base import TestFormat
 
 kIsWindows = sys.platform in ['win32', 'cygwin']
 
+# The longest --gtest_filter we pass via the environment.  Windows limits the
+# whole environment block to 32767 characters.
+kMaxFilterLength = 16384
+
 class GoogleTest(TestFormat):
     def __init__(self, test_sub_dirs, test_suffix, run_under = []):
         self.test_sub_dirs = str(test_sub_dirs).split(';')
@@ -26,7 +30,12 @@ class GoogleTest(TestFormat):
         self.test_suffixes = {exe_suffix, test_suffix + '.py'}
         self.run_under = run_under
 
-    def get_num_tests(self, path, litConfig, localConfig):
+    def get_test_names(self, path, litConfig, localConfig):
+        """get_test_names(path, litConfig, localConfig) -> [name] or None
+
+        Return the full names ('Suite.Test') of the enabled tests in the given
+        executable, in the order gtest runs (and shards) them.
+        """
         list_test_cmd = self.prepareCmd(
             [path, '--gtest_list_tests', '--gtest_filter=-*DISABLED_*'])
         try:
@@ -37,9 +46,46 @@ class GoogleTest(TestFormat):
                 "unable to discover google-tests in %r: %s. Process output: %s"
                 % (path, sys.exc_info()[1], exc.output))
             return None
-        return sum(
-            map(lambda line: lit.util.to_string(line).startswith('  '),
-                out.splitlines(False)))
+
+        names = []
+        suite = ''
+        for line in out.splitlines(False):
+            line = lit.util.to_string(line)
+            # Strip comments such as '# GetParam() = ...'.
+            name = line.split('#', 1)[0].strip()
+            if not name:
+                continue
+            if line.startswith('  '):
+                names.append(suite + name)
+            else:
+                suite = name
+        return names
+
+    def get_num_tests(self, path, litConfig, localConfig):
+        names = self.get_test_names(path, litConfig, localConfig)
+        return None if names is None else len(names)
+
+    @staticmethod
+    def balance_shards(names, times, nshard):
+        """balance_shards(names, times, nshard) -> [([name], duration)]
+
+        Split the tests into nshard shards of roughly equal total duration by
+        assigning the longest tests first, each to the least loaded shard.
+        Tests without a recorded time are assumed to take the average time.
+        Returns None if no test has a recorded time.
+        """
+        known = [times[n] for n in names if n in times]
+        if not known:
+            return None
+        fallback = sum(known) / len(known)
+
+        shards = [[0.0, idx, []] for idx in range(nshard)]
+        by_time = sorted(names, key=lambda n: -times.get(n, fallback))
+        for name in by_time:
+            shard = min(shards)
+            shard[0] += times.get(name, fallback)
+            shard[2].append(name)
+        return [(names_, duration) for duration, _, names_ in shards]
 
     def getTestsInDirectory(self, testSuite, path_in_suite, litConfig,
                             localConfig):
@@ -54,9 +100,10 @@ class GoogleTest(TestFormat):
                                              suffixes=self.test_suffixes):
                 # Discover the tests in this executable.
                 execpath = os.path.join(source_path, subdir, fn)
-                num_tests = self.get_num_tests(execpath, litConfig,
-                                               localConfig)
-                if num_tests is not None:
+                names = self.get_test_names(execpath, litConfig,
+                                            localConfig)
+                if names is not None:
+                    num_tests = len(names)
                     # Compute the number of shards.
                     shard_size = init_shard_size
                     nshard = int(math.ceil(num_tests / shard_size))
@@ -64,6 +111,22 @@ class GoogleTest(TestFormat):
                         shard_size = shard_size // 2
                         nshard = int(math.ceil(num_tests / shard_size))
 
+                    # If we know how long the individual tests took last
+                    # time, split them into shards of equal duration rather
+                    # than equal size.  The tests are then selected by name,
+                    # which is only possible while the filter stays short.
+                    prefix = '/'.join(path_in_suite + (subdir, fn)) + '/'
+                    times = {}
+                    if testSuite.test_times:
+                        times = {n: abs(testSuite.test_times[prefix + k])
+                                 for n in names
+                                 for k in [n.replace('.', '/', 1)]
+                                 if prefix + k in testSuite.test_times}
+                    shards = self.balance_shards(names, times, nshard)
+                    if shards and any(len(':'.join(names_)) > kMaxFilterLength
+                                      for names_, _ in shards):
+                        shards = None
+
                     # Create one lit test for each shard.
                     for idx in range(nshard):
                         testPath = path_in_suite + (subdir, fn, str(idx),
@@ -74,11 +137,15 @@ class GoogleTest(TestFormat):
                             str(idx),
                             str(nshard)
                         ]) + '.json'
-                        yield lit.Test.Test(testSuite,
-                                            testPath,
-                                            localConfig,
-                                            file_path=execpath,
-                                            gtest_json_file=json_file)
+                        test = lit.Test.Test(testSuite,
+                                             testPath,
+                                             localConfig,
+                                             file_path=execpath,
+                                             gtest_json_file=json_file)
+                        if shards:
+                            test.gtest_filter = ':'.join(shards[idx][0])
+                            test.previous_elapsed = shards[idx][1]
+                        yield test
                 else:
                     # This doesn't look like a valid gtest file.  This can
                     # have a number of causes, none of them good.  For
@@ -109,13 +176,18 @@ class GoogleTest(TestFormat):
         testName,shard_idx = os.path.split(testName)
         from lit.cl_arguments import TestOrder
         use_shuffle = TestOrder(litConfig.order) == TestOrder.RANDOM
+        gtest_filter = getattr(test, 'gtest_filter', None)
         shard_env = {
             'GTEST_OUTPUT': 'json:' + test.gtest_json_file,
             'GTEST_SHUFFLE': '1' if use_shuffle else '0',
-            'GTEST_TOTAL_SHARDS': total_shards,
-            'GTEST_SHARD_INDEX': shard_idx
         }
-        test.config.environment.update(shard_env)
+        if gtest_filter is None:
+            shard_env['GTEST_TOTAL_SHARDS'] = total_shards
+            shard_env['GTEST_SHARD_INDEX'] = shard_idx
+        else:
+            shard_env['GTEST_FILTER'] = gtest_filter
+        env = dict(test.config.environment)
+        env.update(shard_env)
 
         cmd = [testPath]
         cmd = self.prepareCmd(cmd)
@@ -133,15 +205,34 @@ class GoogleTest(TestFormat):
 
         try:
             out, _, exitCode = lit.util.executeCommand(
-                cmd, env=test.config.environment,
+                cmd, env=env,
                 timeout=litConfig.maxIndividualTestTime, redirect_stderr=True)
         except lit.util.ExecuteCommandTimeoutException as e:
             stream_msg = f"\n{e.out}\n--\nexit: {e.exitCode}\n--\n"
             return (lit.Test.TIMEOUT, f'{shard_header}{stream_msg}Reached '
                     f'timeout of {litConfig.maxIndividualTestTime} seconds')
 
+        if not os.path.exists(test.gtest_json_file) and exitCode != 0:
+            # The shard crashed before gtest could write its report.  Find the
+            # culprit(s) so that the other tests in the shard still get their
+            # own results.
+            if gtest_filter is not None:
+                names = gtest_filter.split(':')
+            else:
+                names = self.get_test_names(testPath, litConfig, test.config)
+                if names is not None:
+                    names = names[int(shard_idx)::int(total_shards)]
+            if names:
+                try:
+                    return self.bisect_crash(test, cmd, env, names, litConfig,
+                                             shard_header, out, exitCode)
+                except lit.util.ExecuteCommandTimeoutException:
+                    return (lit.Test.TIMEOUT, f'{shard_header}Reached timeout '
+                            f'of {litConfig.maxIndividualTestTime} seconds '
+                            f'while looking for the crashing test')
+
         if not os.path.exists(test.gtest_json_file):
-            errmsg = f"shard JSON output does not exist: %s" % (
+            errmsg = "shard JSON output does not exist: %s" % (
                 test.gtest_json_file)
             stream_msg = f"\n{out}\n--\nexit: {exitCode}\n--\n"
             return lit.Test.FAIL, shard_header + stream_msg + errmsg
@@ -191,6 +282,70 @@ class GoogleTest(TestFormat):
                         output += 'unresolved test result\n'
         return lit.Test.FAIL, output
 
+    def bisect_crash(self, test, cmd, env, names, litConfig, shard_header,
+                     out, exitCode):
+        """Rerun the tests of a crashed shard in halves, splitting them again
+        until each crash is pinned to a single test.  The whole shard is known
+        to crash, so it is not rerun; out and exitCode are what it printed and
+        exited with.
+
+        The results of all the tests are combined into the shard's JSON file as
+        if the shard had completed, with each crashing test reported as a
+        failure.
+        """
+        bisect_json_file = test.gtest_json_file + '.bisect.json'
+
+        def crashed(name, out, exitCode):
+            suite_name, test_name = name.split('.', 1)
+            failure = 'Test crashed with exit code %d:\n%s' % (exitCode, out)
+            testinfo = {'name': test_name, 'result': 'COMPLETED',
+                        'time': '0s', 'failures': [{'failure': failure}]}
+            return [{'name': suite_name, 'testsuite': [testinfo]}], \
+                   [(name, failure)]
+
+        def split(names):
+            mid = len(names) // 2
+            lhs, lhs_crashes = run(names[:mid])
+            rhs, rhs_crashes = run(names[mid:])
+            return lhs + rhs, lhs_crashes + rhs_crashes
+
+        def run(names):
+            run_env = dict(env)
+            run_env.pop('GTEST_TOTAL_SHARDS', None)
+            run_env.pop('GTEST_SHARD_INDEX', None)
+            run_env['GTEST_FILTER'] = ':'.join(names)
+            run_env['GTEST_OUTPUT'] = 'json:' + bisect_json_file
+            out, _, exitCode = lit.util.executeCommand(
+                cmd, env=run_env, timeout=litConfig.maxIndividualTestTime,
+                redirect_stderr=True)
+
+            if os.path.exists(bisect_json_file):
+                with open(bisect_json_file, encoding='utf-8') as f:
+                    testsuites = json.load(f)['testsuites']
+                os.remove(bisect_json_file)
+                return testsuites, []
+
+            if len(names) == 1:
+                return crashed(names[0], out, exitCode)
+            return split(names)
+
+        if len(names) == 1:
+            testsuites, crashes = crashed(names[0], out, exitCode)
+        else:
+            testsuites, crashes = split(names)
+        with open(test.gtest_json_file, 'w', encoding='utf-8') as f:
+            json.dump({'testsuites': testsuites}, f)
+
+        output = shard_header + '\n'
+        for name, failure in crashes:
+            output += "Script:\n--\n%s --gtest_filter=%s\n--\n" % (
+                ' '.join(cmd), name)
+            output += failure + '\n\n'
+        if not crashes:
+            output += 'The shard crashed, but none of its tests crashed when ' \
+                      'run on their own.\n'
+        return lit.Test.FAIL, output
+
     def prepareCmd(self, cmd):
         """Insert interpreter if needed.
 
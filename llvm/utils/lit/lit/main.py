@@ -7,6 +7,7 @@ See lit.pod for more information.
 import itertools
 import os
 import platform
+import signal
 import sys
 import time
 
@@ -16,14 +17,20 @@ import lit.display
 import lit.LitConfig
 import lit.reports
 import lit.run
+import lit.server
 import lit.Test
+import lit.TestHistory
 import lit.util
 from lit.formats.googletest import GoogleTest
+from lit.ParseCache import write_parse_caches
 from lit.TestTimes import record_test_times
 
 
 def main(builtin_params={}):
     opts = lit.cl_arguments.parse_args()
+    if opts.connect:
+        sys.exit(lit.server.connect(opts.connect, opts))
+
     params = create_params(builtin_params, opts.user_params)
     is_windows = platform.system() == 'Windows'
 
@@ -40,10 +47,27 @@ def main(builtin_params={}):
         order=opts.order,
         params=params,
         config_prefix=opts.configPrefix,
-        echo_all_commands=opts.echoAllCommands)
+        echo_all_commands=opts.echoAllCommands,
+        discovery_cache=opts.discovery_cache,
+        rebuild_discovery_cache=opts.rebuild_discovery_cache,
+        time_commands=opts.time_tests,
+        max_output_size=opts.max_output_size,
+        median_test_times=opts.median_times,
+        parse_cache=opts.parse_cache,
+        # The peak RSS recorded by these runs is what the budget is based on.
+        resource_usage=opts.resource_usage or bool(opts.max_memory),
+        max_memory=opts.max_memory)
+
+    if opts.serve:
+        server = lit.server.Server(lit_config, opts.indirectlyRunCheck)
+        server.discover(opts.test_paths)
+        server.serve(opts.serve)
+        sys.exit(0)
 
+    discovery_start = time.time()
     discovered_tests = lit.discovery.find_tests_for_inputs(lit_config, opts.test_paths,
                                                            opts.indirectlyRunCheck)
+    discovery_time = time.time() - discovery_start
     if not discovered_tests:
         sys.stderr.write('error: did not discover any tests for provided path(s)\n')
         sys.exit(2)
@@ -86,11 +110,23 @@ def main(builtin_params={}):
                              'error.\n')
             sys.exit(2)
 
+    if opts.history_report:
+        print_history_report(selected_tests)
+        sys.exit(0)
+
+    if opts.changed_since or opts.affected_by:
+        selected_tests = filter_by_impact(selected_tests, opts, lit_config)
+        if not selected_tests:
+            sys.stderr.write('warning: no tests are affected by the changed '
+                             'files.\n')
+            sys.exit(0)
+
     # When running multiple shards, don't include skipped tests in the xunit
     # output since merging the files will result in duplicates.
     if opts.shard:
         (run, shards) = opts.shard
-        selected_tests = filter_by_shard(selected_tests, run, shards, lit_config)
+        selected_tests = filter_by_shard(selected_tests, run, shards,
+                                         opts.balance_shards, lit_config)
         if not selected_tests:
             sys.stderr.write('warning: shard does not contain any tests.  '
                              'Consider decreasing the number of shards.\n')
@@ -103,16 +139,23 @@ def main(builtin_params={}):
     mark_excluded(discovered_tests, selected_tests)
 
     start = time.time()
-    run_tests(selected_tests, lit_config, opts, len(discovered_tests))
+    run = run_tests(selected_tests, lit_config, opts, len(discovered_tests))
     elapsed = time.time() - start
 
-    record_test_times(selected_tests, lit_config)
-
     selected_tests, discovered_tests = GoogleTest.post_process_shard_results(
         selected_tests, discovered_tests)
 
+    # Record the times of the individual googletest tests rather than those of
+    # their shards, so that the shards can be balanced next time.
+    record_test_times(selected_tests, lit_config)
+    write_parse_caches(selected_tests, lit_config)
+
     if opts.time_tests:
         print_histogram(discovered_tests)
+        print_makespan(run.predicted_makespan, elapsed)
+        if opts.max_memory:
+            print('Memory Wait Time: %.2fs' % run.memory_wait)
+        print('Discovery Time: %.2fs' % discovery_time)
 
     print_results(discovered_tests, elapsed, opts)
 
@@ -181,7 +224,24 @@ def determine_order(tests, order):
         tests.sort(key=lambda t: (not t.previous_failure, -t.previous_elapsed, t.getFullName()))
 
 
-def filter_by_shard(tests, run, shards, lit_config):
+def filter_by_shard(tests, run, shards, balance, lit_config):
+    # Balancing by time is opt-in: every shard computes the partition on its
+    # own, so the shards only agree if they are given the same times file.
+    partition = None
+    if balance:
+        partition = lit.run.partition_by_time(tests, shards)
+    if partition is not None:
+        test_ixs, predicted = partition
+        selected_tests = [tests[i] for i in test_ixs[run - 1]]
+        lit_config.note(f'Selecting shard {run}/{shards} = '
+                        f'size {len(selected_tests)}/{len(tests)} = '
+                        f'predicted time {predicted[run - 1]:.1f}s, '
+                        f'balanced by recorded test times')
+        lit_config.note('Predicted shard times: ' +
+                        ', '.join('%.1fs' % p for p in predicted))
+        return selected_tests
+
+    # By default, or without recorded times, deal the tests out round-robin.
     test_ixs = range(run - 1, len(tests), shards)
     selected_tests = [tests[i] for i in test_ixs]
 
@@ -198,6 +258,32 @@ def filter_by_shard(tests, run, shards, lit_config):
     return selected_tests
 
 
+def filter_by_impact(tests, opts, lit_config):
+    import lit.TestImpact
+    changed = list(opts.affected_by or [])
+    if opts.changed_since:
+        changed += lit.TestImpact.get_changed_files(opts.changed_since,
+                                                    lit_config)
+    dependencies = {}
+    if opts.dependency_map:
+        dependencies = lit.TestImpact.read_dependency_map(opts.dependency_map,
+                                                          lit_config)
+
+    affected, unknown = lit.TestImpact.select_affected_tests(
+        tests, changed, dependencies, lit_config)
+    if unknown:
+        lit_config.note('selecting all tests, cannot determine the impact of '
+                        '%s' % ', '.join(unknown))
+        return tests
+
+    lit_config.note('selecting %d of %d tests affected by %d changed files' %
+                    (len(affected), len(tests), len(changed)))
+    if not opts.quiet:
+        for test, reason in affected:
+            print('  %s: %s' % (test.getFullName(), reason))
+    return [test for test, _ in affected]
+
+
 def mark_xfail(selected_tests, opts):
     for t in selected_tests:
         test_file = os.sep.join(t.path_in_suite)
@@ -218,11 +304,25 @@ def run_tests(tests, lit_config, opts, discovered_tests):
     workers = min(len(tests), opts.workers)
     display = lit.display.create_display(opts, tests, discovered_tests, workers)
 
-    run = lit.run.Run(tests, lit_config, workers, display.update,
+    # Reports record each result as it arrives, so that they are not lost if
+    # the run is killed.
+    for report in opts.reports:
+        report.start()
+
+    def progress_callback(test):
+        display.update(test)
+        for report in opts.reports:
+            report.add_result(test)
+
+    run = lit.run.Run(tests, lit_config, workers, progress_callback,
                       opts.max_failures, opts.timeout)
 
     display.print_header()
 
+    # CI systems usually send SIGTERM when a job times out.  Treat it like
+    # Ctrl+C, so that the results so far are still printed and reported.
+    prev_handler = signal.signal(signal.SIGTERM, _interrupt)
+
     interrupted = False
     error = None
     try:
@@ -234,10 +334,17 @@ def run_tests(tests, lit_config, opts, discovered_tests):
         error = 'warning: reached maximum number of test failures'
     except lit.run.TimeoutError:
         error = 'warning: reached timeout'
+    finally:
+        signal.signal(signal.SIGTERM, prev_handler)
 
     display.clear(interrupted)
     if error:
         sys.stderr.write('%s, skipping remaining tests\n' % error)
+    return run
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
 
 
 def execute_in_tmp_dir(run, lit_config):
@@ -273,6 +380,39 @@ def print_histogram(tests):
         lit.util.printHistogram(test_times, title='Tests')
 
 
+def print_history_report(tests):
+    tests_by_path = {}
+    for t in tests:
+        tests_by_path.setdefault(t.suite, {})['/'.join(t.path_in_suite)] = t
+
+    slow = []
+    intermittent = []
+    for suite, tests in tests_by_path.items():
+        history = lit.TestHistory.read_test_history(suite)
+        history = {p: s for p, s in history.items() if p in tests}
+        slow += [(tests[p].getFullName(), before, after) for p, before, after
+                 in lit.TestHistory.find_slow_tests(history)]
+        intermittent += [(tests[p].getFullName(), runs, failures, flaky)
+                         for p, runs, failures, flaky
+                         in lit.TestHistory.find_intermittent_tests(history)]
+
+    print('Slower Tests (%d):' % len(slow))
+    for name, before, after in sorted(slow, key=lambda s: s[1] - s[2]):
+        print('  %s: %.2fs -> %.2fs (%+.0f%%)' % (
+            name, before, after, 100.0 * (after - before) / before))
+    print('\nIntermittent Tests (%d):' % len(intermittent))
+    for name, runs, failures, flaky in sorted(intermittent):
+        print('  %s: failed %d of %d runs, passed on retry %d times' % (
+            name, failures, runs, flaky))
+
+
+def print_makespan(predicted, elapsed):
+    if predicted is None:
+        return
+    print('Predicted Testing Time: %.2fs (actual: %.2fs, %+.1f%%)' % (
+        predicted, elapsed, 100.0 * (elapsed - predicted) / max(predicted, 1e-9)))
+
+
 def print_results(tests, elapsed, opts):
     tests_by_code = {code: [] for code in lit.Test.ResultCode.all_codes()}
     for test in tests:
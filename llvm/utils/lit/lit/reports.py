@@ -1,7 +1,9 @@
 import base64
 import datetime
+import io
 import itertools
 import json
+import os
 
 from xml.sax.saxutils import quoteattr as quo
 
@@ -14,13 +16,130 @@ def by_suite_and_test_path(test):
     return (test.suite.name, id(test.suite), test.path_in_suite)
 
 
-class JsonReport(object):
+def write_json_document(file, data, key, items):
+    """
+    Write json.dump(data, file, indent=2, sort_keys=True) with data[key] set to
+    the list of `items`, without building that list in memory.
+    """
+    placeholder = '"@items@"'
+    doc = json.dumps(dict(data, **{key: ['@items@']}), indent=2,
+                     sort_keys=True)
+    head, tail = doc.split(placeholder)
+    indent = head[head.rindex('\n') + 1:]
+
+    sep = head
+    for item in items:
+        file.write(sep)
+        item = json.dumps(item, indent=2, sort_keys=True)
+        file.write(item.replace('\n', '\n' + indent))
+        sep = ',\n' + indent
+    if sep is head:
+        json.dump(dict(data, **{key: []}), file, indent=2, sort_keys=True)
+    else:
+        file.write(tail)
+
+
+class StreamingReport(object):
+    """
+    Base class for reports that record each result as soon as it arrives.
+
+    While the tests run, add_result() appends the report records of each test
+    to '<output_file>.partial', one JSON line per record, so a run that is
+    killed still leaves the completed results behind.  write_results() then
+    journals the tests that did not run, and generates the report from the
+    journal into a temporary file, which atomically replaces the output file.
+    The records are reported in the order of the tests passed to
+    write_results(), not in the order the tests completed; only the offsets
+    of the records in the journal are kept in memory to reorder them.
+
+    A run that is killed before write_results() (by SIGKILL, for instance)
+    leaves the output file of the previous run, if any, and the journal.  The
+    journal is not a report: it holds one [test name, record] JSON array per
+    line, in completion order, and its last line may be cut short.  The next
+    run with the same output file overwrites it.
+
+    Subclasses implement _get_records(test) and _write_report(file, records,
+    tests, elapsed).  records() generates the records in order; for reports
+    that need to reorder them, records.with_offsets() generates (offset,
+    record) pairs and records.read(offset) reads a record back.
+    """
+
     def __init__(self, output_file):
         self.output_file = output_file
+        self.journal_file = output_file + '.partial'
+        self._journal = None
+        self._journaled = set()
+
+    def start(self):
+        self._journal = open(self.journal_file, 'w')
+        self._journaled = set()
+
+    def add_result(self, test):
+        if self._journal is None:
+            return
+        name = test.getFullName()
+        for record in self._get_records(test):
+            self._journal.write(json.dumps([name, record]) + '\n')
+        self._journal.flush()
+        self._journaled.add(name)
 
     def write_results(self, tests, elapsed):
-        unexecuted_codes = {lit.Test.EXCLUDED, lit.Test.SKIPPED}
-        tests = [t for t in tests if t.result.code not in unexecuted_codes]
+        if self._journal is None:
+            self.start()
+        for test in tests:
+            if test.getFullName() not in self._journaled:
+                self.add_result(test)
+        self._journal.close()
+
+        # Results are journaled per test name.  Journaled tests that are not
+        # reported, like googletest shards replaced by their subtests, are
+        # dropped.
+        names = {t.getFullName() for t in tests}
+        offsets = {}
+        offset = 0
+        with open(self.journal_file, 'rb') as journal:
+            for line in journal:
+                name = json.loads(line)[0]
+                if name in names:
+                    offsets.setdefault(name, []).append(offset)
+                offset += len(line)
+
+        temp_file = self.output_file + '.tmp'
+        with open(self.journal_file, 'rb') as journal, \
+                open(temp_file, 'w') as file:
+            records = _JournalRecords(journal, tests, offsets)
+            self._write_report(file, records, tests, elapsed)
+        os.replace(temp_file, self.output_file)
+
+        os.remove(self.journal_file)
+        self._journal = None
+        self._journaled = set()
+
+
+class _JournalRecords(object):
+    """The records of the reported tests in a journal, see StreamingReport."""
+
+    def __init__(self, journal, tests, offsets):
+        self._journal = journal
+        self._tests = tests
+        self._offsets = offsets
+
+    def __call__(self):
+        for _, record in self.with_offsets():
+            yield record
+
+    def with_offsets(self):
+        for test in self._tests:
+            for offset in self._offsets.get(test.getFullName(), ()):
+                yield offset, self.read(offset)
+
+    def read(self, offset):
+        self._journal.seek(offset)
+        return json.loads(self._journal.readline())[1]
+
+
+class JsonReport(StreamingReport):
+    def _write_report(self, file, records, tests, elapsed):
         # Construct the data we will write.
         data = {}
         # Encode the current lit version as a schema version.
@@ -30,44 +149,52 @@ class JsonReport(object):
         # FIXME: Record information from the individual test suites?
 
         # Encode the tests.
-        data['tests'] = tests_data = []
-        for test in tests:
-            test_data = {
-                'name': test.getFullName(),
-                'code': test.result.code.name,
-                'output': test.result.output,
-                'elapsed': test.result.elapsed}
-
-            # Add test metrics, if present.
-            if test.result.metrics:
-                test_data['metrics'] = metrics_data = {}
-                for key, value in test.result.metrics.items():
-                    metrics_data[key] = value.todata()
-
-            # Report micro-tests separately, if present
-            if test.result.microResults:
-                for key, micro_test in test.result.microResults.items():
-                    # Expand parent test name with micro test name
-                    parent_name = test.getFullName()
-                    micro_full_name = parent_name + ':' + key
-
-                    micro_test_data = {
-                        'name': micro_full_name,
-                        'code': micro_test.code.name,
-                        'output': micro_test.output,
-                        'elapsed': micro_test.elapsed}
-                    if micro_test.metrics:
-                        micro_test_data['metrics'] = micro_metrics_data = {}
-                        for key, value in micro_test.metrics.items():
-                            micro_metrics_data[key] = value.todata()
+        write_json_document(file, data, 'tests', records())
+        file.write('\n')
 
-                    tests_data.append(micro_test_data)
-
-            tests_data.append(test_data)
-
-        with open(self.output_file, 'w') as file:
-            json.dump(data, file, indent=2, sort_keys=True)
-            file.write('\n')
+    def _get_records(self, test):
+        unexecuted_codes = {lit.Test.EXCLUDED, lit.Test.SKIPPED}
+        if test.result.code in unexecuted_codes:
+            return []
+
+        tests_data = []
+        test_data = {
+            'name': test.getFullName(),
+            'code': test.result.code.name,
+            'output': test.result.output,
+            'elapsed': test.result.elapsed}
+
+        # Point to the full output, if it was truncated.
+        if test.result.output_file:
+            test_data['output_file'] = test.result.output_file
+
+        # Add test metrics, if present.
+        if test.result.metrics:
+            test_data['metrics'] = metrics_data = {}
+            for key, value in test.result.metrics.items():
+                metrics_data[key] = value.todata()
+
+        # Report micro-tests separately, if present
+        if test.result.microResults:
+            for key, micro_test in test.result.microResults.items():
+                # Expand parent test name with micro test name
+                parent_name = test.getFullName()
+                micro_full_name = parent_name + ':' + key
+
+                micro_test_data = {
+                    'name': micro_full_name,
+                    'code': micro_test.code.name,
+                    'output': micro_test.output,
+                    'elapsed': micro_test.elapsed}
+                if micro_test.metrics:
+                    micro_test_data['metrics'] = micro_metrics_data = {}
+                    for key, value in micro_test.metrics.items():
+                        micro_metrics_data[key] = value.todata()
+
+                tests_data.append(micro_test_data)
+
+        tests_data.append(test_data)
+        return tests_data
 
 
 _invalid_xml_chars_dict = {c: None for c in range(32) if chr(c) not in ('\t', '\n', '\r')}
@@ -84,31 +211,48 @@ def remove_invalid_xml_chars(s):
     return s.translate(_invalid_xml_chars_dict)
 
 
-class XunitReport(object):
+class XunitReport(StreamingReport):
     def __init__(self, output_file):
-        self.output_file = output_file
+        super().__init__(output_file)
         self.skipped_codes = {lit.Test.EXCLUDED,
                               lit.Test.SKIPPED, lit.Test.UNSUPPORTED}
 
-    def write_results(self, tests, elapsed):
-        tests.sort(key=by_suite_and_test_path)
-        tests_by_suite = itertools.groupby(tests, lambda t: t.suite)
-
-        with open(self.output_file, 'w') as file:
-            file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-            file.write('<testsuites time="{time:.2f}">\n'.format(time=elapsed))
-            for suite, test_iter in tests_by_suite:
-                self._write_testsuite(file, suite, list(test_iter))
-            file.write('</testsuites>\n')
-
-    def _write_testsuite(self, file, suite, tests):
-        skipped = sum(1 for t in tests if t.result.code in self.skipped_codes)
-        failures = sum(1 for t in tests if t.isFailure())
-
+    def _write_report(self, file, records, tests, elapsed):
+        # Tests are reported sorted by suite and path.  Only the keys are
+        # sorted in memory; the XML of each test is read back from the journal
+        # when it is written.
+        keys = sorted((tuple(r['suite']), r['path'], r['failure'],
+                       r['skipped'], offset)
+                      for offset, r in records.with_offsets())
+        keys_by_suite = itertools.groupby(keys, lambda k: k[0])
+
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        file.write('<testsuites time="{time:.2f}">\n'.format(time=elapsed))
+        for (_, _, name), key_iter in keys_by_suite:
+            self._write_testsuite(file, name, list(key_iter), records)
+        file.write('</testsuites>\n')
+
+    def _get_records(self, test):
+        # Suite names are not necessarily unique.  Include the exec root in
+        # the key to avoid mixing tests of different suites.
+        suite = test.suite
         name = suite.config.name.replace('.', '-')
-        file.write(f'<testsuite name={quo(name)} tests="{len(tests)}" failures="{failures}" skipped="{skipped}">\n')
-        for test in tests:
-            self._write_test(file, test, name)
+        xml = io.StringIO()
+        self._write_test(xml, test, name)
+        return [{
+            'suite': [suite.name, suite.exec_root, name],
+            'path': list(test.path_in_suite),
+            'failure': test.isFailure(),
+            'skipped': test.result.code in self.skipped_codes,
+            'xml': xml.getvalue()}]
+
+    def _write_testsuite(self, file, name, keys, records):
+        skipped = sum(1 for _, _, _, is_skipped, _ in keys if is_skipped)
+        failures = sum(1 for _, _, is_failure, _, _ in keys if is_failure)
+
+        file.write(f'<testsuite name={quo(name)} tests="{len(keys)}" failures="{failures}" skipped="{skipped}">\n')
+        for _, _, _, _, offset in keys:
+            file.write(records.read(offset)['xml'])
         file.write('</testsuite>\n')
 
     def _write_test(self, file, test, suite_name):
@@ -156,7 +300,8 @@ class XunitReport(object):
 
 
 def gen_resultdb_test_entry(
-    test_name, start_time, elapsed_time, test_output, result_code, is_expected
+    test_name, start_time, elapsed_time, test_output, result_code, is_expected,
+    output_file=None
 ):
     test_data = {
         'testId': test_name,
@@ -172,6 +317,8 @@ def gen_resultdb_test_entry(
         },
         'expected': is_expected,
     }
+    if output_file:
+        test_data['artifacts']['full-output'] = {'filePath': output_file}
     if (
         result_code == lit.Test.PASS
         or result_code == lit.Test.XPASS
@@ -191,81 +338,95 @@ def gen_resultdb_test_entry(
     return test_data
 
 
-class ResultDBReport(object):
-    def __init__(self, output_file):
-        self.output_file = output_file
-
-    def write_results(self, tests, elapsed):
-        unexecuted_codes = {lit.Test.EXCLUDED, lit.Test.SKIPPED}
-        tests = [t for t in tests if t.result.code not in unexecuted_codes]
+class ResultDBReport(StreamingReport):
+    def _write_report(self, file, records, tests, elapsed):
         data = {}
         data['__version__'] = lit.__versioninfo__
         data['elapsed'] = elapsed
         # Encode the tests.
-        data['tests'] = tests_data = []
-        for test in tests:
-            tests_data.append(
-                gen_resultdb_test_entry(
-                    test_name=test.getFullName(),
-                    start_time=test.result.start,
-                    elapsed_time=test.result.elapsed,
-                    test_output=test.result.output,
-                    result_code=test.result.code,
-                    is_expected=not test.result.code.isFailure,
-                )
+        write_json_document(file, data, 'tests', records())
+        file.write('\n')
+
+    def _get_records(self, test):
+        unexecuted_codes = {lit.Test.EXCLUDED, lit.Test.SKIPPED}
+        if test.result.code in unexecuted_codes:
+            return []
+
+        tests_data = []
+        tests_data.append(
+            gen_resultdb_test_entry(
+                test_name=test.getFullName(),
+                start_time=test.result.start,
+                elapsed_time=test.result.elapsed,
+                test_output=test.result.output,
+                result_code=test.result.code,
+                is_expected=not test.result.code.isFailure,
+                output_file=test.result.output_file,
             )
-            if test.result.microResults:
-                for key, micro_test in test.result.microResults.items():
-                    # Expand parent test name with micro test name
-                    parent_name = test.getFullName()
-                    micro_full_name = parent_name + ':' + key + 'microres'
-                    tests_data.append(
-                        gen_resultdb_test_entry(
-                            test_name=micro_full_name,
-                            start_time=micro_test.start
-                            if micro_test.start
-                            else test.result.start,
-                            elapsed_time=micro_test.elapsed
-                            if micro_test.elapsed
-                            else test.result.elapsed,
-                            test_output=micro_test.output,
-                            result_code=micro_test.code,
-                            is_expected=not micro_test.code.isFailure,
-                        )
+        )
+        if test.result.microResults:
+            for key, micro_test in test.result.microResults.items():
+                # Expand parent test name with micro test name
+                parent_name = test.getFullName()
+                micro_full_name = parent_name + ':' + key + 'microres'
+                tests_data.append(
+                    gen_resultdb_test_entry(
+                        test_name=micro_full_name,
+                        start_time=micro_test.start
+                        if micro_test.start
+                        else test.result.start,
+                        elapsed_time=micro_test.elapsed
+                        if micro_test.elapsed
+                        else test.result.elapsed,
+                        test_output=micro_test.output,
+                        result_code=micro_test.code,
+                        is_expected=not micro_test.code.isFailure,
                     )
-
-        with open(self.output_file, 'w') as file:
-            json.dump(data, file, indent=2, sort_keys=True)
-            file.write('\n')
+                )
+        return tests_data
 
 
-class TimeTraceReport(object):
+class TimeTraceReport(StreamingReport):
     def __init__(self, output_file):
-        self.output_file = output_file
+        super().__init__(output_file)
         self.skipped_codes = {lit.Test.EXCLUDED,
                               lit.Test.SKIPPED, lit.Test.UNSUPPORTED}
 
-    def write_results(self, tests, elapsed):
+    def _write_report(self, file, records, tests, elapsed):
         # Find when first test started so we can make start times relative.
-        first_start_time = min([t.result.start for t in tests])
-        events = [self._get_test_event(
-            x, first_start_time) for x in tests if x.result.code not in self.skipped_codes]
-
-        json_data = {'traceEvents': events}
-
-        with open(self.output_file, "w") as time_trace_file:
-            json.dump(json_data, time_trace_file, indent=2, sort_keys=True)
-
-    def _get_test_event(self, test, first_start_time):
-        test_name = test.getFullName()
-        elapsed_time = test.result.elapsed or 0.0
-        start_time = test.result.start - first_start_time if test.result.start else 0.0
-        pid = test.result.pid or 0
-        return {
-            'pid': pid,
+        first_start_time = min([r['start'] for r in records() if r['start']],
+                               default=0.0)
+        events = (self._get_test_event(r['event'], first_start_time)
+                  for r in records() if r['event'])
+
+        write_json_document(file, {}, 'traceEvents', events)
+
+    def _get_records(self, test):
+        event = None
+        if test.result.code not in self.skipped_codes:
+            event = {
+                'name': test.getFullName(),
+                'start': test.result.start,
+                'elapsed': test.result.elapsed or 0.0,
+                'pid': test.result.pid or 0,
+            }
+            if test.result.metrics:
+                event['args'] = {k: v.todata()
+                                 for k, v in test.result.metrics.items()}
+        return [{'start': test.result.start, 'event': event}]
+
+    def _get_test_event(self, event, first_start_time):
+        start = event['start']
+        start_time = start - first_start_time if start else 0.0
+        trace_event = {
+            'pid': event['pid'],
             'tid': 1,
             'ph': 'X',
             'ts': int(start_time * 1000000.),
-            'dur': int(elapsed_time * 1000000.),
-            'name': test_name,
+            'dur': int(event['elapsed'] * 1000000.),
+            'name': event['name'],
         }
+        # Shown by trace viewers when the event is selected.
+        if 'args' in event:
+            trace_event['args'] = event['args']
+        return trace_event
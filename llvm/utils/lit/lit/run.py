@@ -1,8 +1,13 @@
+import heapq
+import math
 import multiprocessing
 import os
+import queue
+import statistics
 import time
 
 import lit.Test
+import lit.TestHistory
 import lit.util
 import lit.worker
 
@@ -24,6 +29,10 @@ class Run(object):
         self.progress_callback = progress_callback
         self.max_failures = max_failures
         self.timeout = timeout
+        self.predicted_makespan = None
+        # Seconds during which a worker was idle because the next test did
+        # not fit into the memory budget, see --max-memory.
+        self.memory_wait = 0.0
         assert workers > 0
 
     def execute(self):
@@ -62,48 +71,104 @@ class Run(object):
     def _execute(self, deadline):
         self._increase_process_limit()
 
-        semaphores = {k: multiprocessing.BoundedSemaphore(v)
-                      for k, v in self.lit_config.parallelism_groups.items()
-                      if v is not None}
+        memory = None
+        if self.lit_config.max_memory:
+            memory = (self.lit_config.max_memory * 1024 * 1024,
+                      get_peak_memory(self.tests))
+        self.predicted_makespan = predict_makespan(
+            self.tests, self.workers, self.lit_config.parallelism_groups,
+            memory)
+        scheduler = Scheduler(self.tests, self.lit_config.parallelism_groups,
+                              memory)
 
+        # Only the index of a test is sent with each task.  Forked workers
+        # inherit the tests; otherwise they are pickled once per worker.
+        tests = self.tests
+        if multiprocessing.get_start_method() == 'fork':
+            lit.worker.set_tests(self.tests)
+            tests = None
         pool = multiprocessing.Pool(self.workers, lit.worker.initialize,
-                                    (self.lit_config, semaphores))
-
-        async_results = [
-            pool.apply_async(lit.worker.execute, args=[test],
-                             callback=self.progress_callback)
-            for test in self.tests]
-        pool.close()
+                                    (self.lit_config, tests))
 
         try:
-            self._wait_for(async_results, deadline)
+            self._wait_for(pool, scheduler, deadline)
         except:
             pool.terminate()
             raise
+        else:
+            pool.close()
         finally:
             pool.join()
 
-    def _wait_for(self, async_results, deadline):
-        timeout = deadline - time.time()
-        for idx, ar in enumerate(async_results):
+    # Tests are submitted to the pool lazily so that the scheduler can pick
+    # the next test when a slot frees up.  A few extra tests are kept in flight
+    # so that workers do not sit idle while a result travels back to us,
+    # unless the tests in flight count against a memory budget.
+    def _wait_for(self, pool, scheduler, deadline):
+        completed = queue.Queue()
+        max_in_flight = 2 * self.workers
+        if self.lit_config.max_memory:
+            max_in_flight = self.workers
+        in_flight = 0
+        held_back_since = None
+
+        def on_error(ex):
+            completed.put((None, ex))
+
+        while True:
+            held_back = False
+            while in_flight < max_in_flight:
+                if in_flight and self.lit_config.max_memory and \
+                        is_memory_low():
+                    held_back = True
+                    break
+                idx = scheduler.next()
+                if idx is None:
+                    held_back = scheduler.memory_blocked
+                    break
+                pool.apply_async(lit.worker.execute, args=[idx],
+                                 callback=lambda t, idx=idx: completed.put((idx, t)),
+                                 error_callback=on_error)
+                in_flight += 1
+
+            now = time.time()
+            if held_back and held_back_since is None:
+                held_back_since = now
+            elif not held_back and held_back_since is not None:
+                self.memory_wait += now - held_back_since
+                held_back_since = None
+
+            if not in_flight:
+                assert scheduler.done(), 'scheduler stalled'
+                return
+
             try:
-                test = ar.get(timeout)
-            except multiprocessing.TimeoutError:
+                idx, remote = completed.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
                 raise TimeoutError()
-            else:
-                self._update_test(self.tests[idx], test)
-                if test.isFailure():
-                    self.failures += 1
-                    if self.failures == self.max_failures:
-                        raise MaxFailuresError()
-
-    # Update local test object "in place" from remote test object.  This
+            if idx is None:
+                raise remote
+            in_flight -= 1
+            scheduler.complete(idx)
+
+            test = self.tests[idx]
+            self._update_test(test, remote)
+            self.progress_callback(test)
+            if test.isFailure():
+                self.failures += 1
+                if self.failures == self.max_failures:
+                    raise MaxFailuresError()
+
+    # Update local test object "in place" from the remote result.  This
     # ensures that the original test object which is used for printing test
     # results reflects the changes.
-    def _update_test(self, local_test, remote_test):
+    def _update_test(self, local_test, remote):
+        result, requires, parse_cache_updates = remote
         # Needed for getMissingRequiredFeatures()
-        local_test.requires = remote_test.requires
-        local_test.result = remote_test.result
+        local_test.requires = requires
+        local_test.result = result
+        if parse_cache_updates:
+            local_test.suite.parse_cache.merge(parse_cache_updates)
 
     # TODO(yln): interferes with progress bar
     # Some tests use threads internally, and at least on Linux each of these
@@ -129,3 +194,221 @@ class Run(object):
             # Warn, unless this is Windows, in which case this is expected.
             if os.name != 'nt':
                 self.lit_config.warning('Failed to raise process limit: %s' % ex)
+
+
+def get_parallelism_group(test):
+    pg = test.config.parallelism_group
+    if callable(pg):
+        pg = pg(test)
+    return pg
+
+
+class Scheduler(object):
+    """
+    Hands out tests in the order of the given list, which for the default
+    'smart' order is longest-processing-time first.
+
+    Parallelism groups are enforced here, in the main process: a test whose
+    group is already running at capacity is passed over in favor of the next
+    eligible test instead of tying up a worker while it waits for a slot.
+
+    If `memory` is a (budget, [bytes per test]) tuple, a test is also passed
+    over while the memory of the running tests plus its own would exceed the
+    budget.  A test is always admitted when no memory is in use, even if it
+    needs more than the budget on its own.  Smaller tests that fit, among the
+    next MEMORY_LOOKAHEAD of each queue, run ahead of a test waiting for
+    memory, but only MEMORY_SKIP_LIMIT times: then no other test is started
+    until the memory it needs is free, so that a large test is not starved.
+    """
+
+    MEMORY_LOOKAHEAD = 32
+    MEMORY_SKIP_LIMIT = 8
+
+    def __init__(self, tests, parallelism_groups, memory=None):
+        self.memory_budget, self.memory = memory or (None, None)
+        self.memory_in_use = 0
+        # Whether the last call to next() passed over a test for memory.
+        self.memory_blocked = False
+        # How many times each test waiting for memory was overtaken.
+        self.skipped = {}
+        self.limits = {k: max(v, 1) for k, v in parallelism_groups.items()
+                       if v is not None}
+        self.running = {k: 0 for k in self.limits}
+        self.groups = []
+        # Unlimited tests share the `None` queue.
+        self.pending = {None: []}
+        for idx, test in enumerate(tests):
+            pg = get_parallelism_group(test)
+            if pg not in self.limits:
+                pg = None
+            self.groups.append(pg)
+            self.pending.setdefault(pg, []).append(idx)
+        # Queues are consumed from the front; reverse them so that we can pop.
+        for q in self.pending.values():
+            q.reverse()
+
+    def next(self):
+        """
+        next() -> index of the next test to run, or None
+
+        Returns None if no test is eligible right now, either because
+        everything has been dispatched or because all remaining tests belong
+        to parallelism groups that are at capacity.
+        """
+        blocked = []
+        fitting = []
+        for pg, q in self.pending.items():
+            if not q or (pg is not None and
+                         self.running[pg] >= self.limits[pg]):
+                continue
+            stop = max(len(q) - 1 - self.MEMORY_LOOKAHEAD, -1)
+            for pos in range(len(q) - 1, stop, -1):
+                if self._fits(q[pos]):
+                    fitting.append((q[pos], pg, pos))
+                    break
+                blocked.append(q[pos])
+                if self.skipped.get(q[pos], 0) >= self.MEMORY_SKIP_LIMIT:
+                    break
+        self.memory_blocked = bool(blocked)
+        if not fitting:
+            return None
+        idx, pg, pos = min(fitting)
+        overtaken = [b for b in blocked if b < idx]
+        if any(self.skipped.get(b, 0) >= self.MEMORY_SKIP_LIMIT
+               for b in overtaken):
+            return None
+        for b in overtaken:
+            self.skipped[b] = self.skipped.get(b, 0) + 1
+        del self.pending[pg][pos]
+        self.skipped.pop(idx, None)
+        if pg is not None:
+            self.running[pg] += 1
+        if self.memory:
+            self.memory_in_use += self.memory[idx]
+        return idx
+
+    def _fits(self, idx):
+        if not self.memory or not self.memory_in_use:
+            return True
+        return self.memory_in_use + self.memory[idx] <= self.memory_budget
+
+    def complete(self, idx):
+        pg = self.groups[idx]
+        if pg is not None:
+            self.running[pg] -= 1
+        if self.memory:
+            self.memory_in_use -= self.memory[idx]
+
+    def done(self):
+        return not any(self.pending.values())
+
+
+def get_peak_memory(tests):
+    """
+    get_peak_memory(tests) -> [bytes]
+
+    The largest peak RSS recorded in the history of each test.  Tests without
+    one, like new tests, are estimated at the median peak RSS of the tests of
+    their suite, or 0 if no test of their suite has one.
+    """
+    peaks = {}
+    fallbacks = {}
+    memory = []
+    for t in tests:
+        root = t.suite.exec_root
+        if root not in peaks:
+            peaks[root] = lit.TestHistory.get_peak_memory(
+                lit.TestHistory.read_test_history(t.suite))
+            fallbacks[root] = int(statistics.median(peaks[root].values())) \
+                if peaks[root] else 0
+        memory.append(peaks[root].get('/'.join(t.path_in_suite),
+                                      fallbacks[root]))
+    return memory
+
+
+# Tests are held back while less than this fraction of the system's memory is
+# available, whatever the budget says.
+MIN_AVAILABLE_MEMORY = 0.1
+
+
+def is_memory_low():
+    """Whether /proc/meminfo shows that the system is short of memory."""
+    try:
+        with open('/proc/meminfo') as f:
+            info = dict(line.split(':', 1) for line in f)
+        total = int(info['MemTotal'].split()[0])
+        available = int(info['MemAvailable'].split()[0])
+    except (OSError, KeyError, ValueError):
+        return False
+    return available < MIN_AVAILABLE_MEMORY * total
+
+
+def predict_makespan(tests, workers, parallelism_groups, memory=None):
+    """
+    predict_makespan(tests, workers, parallelism_groups, memory=None)
+        -> seconds or None
+
+    Simulates the scheduler dispatching the tests onto the given number of
+    workers using the recorded test times.  Tests without history are assumed
+    to take the average time of the tests that have one.  Returns None if no
+    test has recorded history.
+    """
+    known = [t.previous_elapsed for t in tests if t.previous_elapsed]
+    if not known:
+        return None
+    fallback = sum(known) / len(known)
+
+    scheduler = Scheduler(tests, parallelism_groups, memory)
+    running = []
+    now = 0.0
+    while True:
+        while len(running) < workers:
+            idx = scheduler.next()
+            if idx is None:
+                break
+            elapsed = tests[idx].previous_elapsed or fallback
+            heapq.heappush(running, (now + elapsed, idx))
+        if not running:
+            return now
+        now, idx = heapq.heappop(running)
+        scheduler.complete(idx)
+
+
+def partition_by_time(tests, shards):
+    """
+    partition_by_time(tests, shards) -> ([[index]], [seconds]) or None
+
+    Splits the tests into the given number of shards with roughly equal total
+    recorded time, and returns the indices of the tests of each shard (in
+    their original order) along with each shard's predicted time.  Returns
+    None if no test has recorded history.
+
+    Every shard of a run computes the partition on its own, so it depends only
+    on the recorded times and the test names, and every shard must be given
+    the same times files: shards that see different times can select
+    overlapping tests and miss others.  The times are rounded to 1/8 of a
+    binary order of magnitude first, so that a little noise between the files
+    is tolerated, but this is not a guarantee.  Tests without history are
+    assumed to take the average time of the tests that have one.
+    """
+    known = [t.previous_elapsed for t in tests if t.previous_elapsed]
+    if not known:
+        return None
+    fallback = sum(known) / len(known)
+
+    def rounded(elapsed):
+        return 2.0 ** (round(math.log2(elapsed) * 8) / 8)
+
+    times = [rounded(t.previous_elapsed or fallback) for t in tests]
+    # Longest processing time first, onto the least loaded shard.
+    order = sorted(range(len(tests)),
+                   key=lambda i: (-times[i], tests[i].getFullName()))
+    loads = [(0.0, s) for s in range(shards)]
+    partition = [[] for _ in range(shards)]
+    for i in order:
+        load, s = heapq.heappop(loads)
+        partition[s].append(i)
+        heapq.heappush(loads, (load + times[i], s))
+
+    predicted = [sum(times[i] for i in p) for p in partition]
+    return [sorted(p) for p in partition], predicted
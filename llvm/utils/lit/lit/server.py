@@ -0,0 +1,311 @@
+"""
+A long-lived lit process that keeps discovered test suites and evaluated
+configuration files in memory and runs tests on request.
+
+The server is started with `lit --serve=DIR <paths>` and clients connect
+with `lit --connect=DIR <paths>`.  The server creates DIR, readable only by
+its user, and listens on a Unix domain socket in it (or on a named pipe
+derived from its path on Windows).  DIR also holds a random key that clients
+must prove they read, so only the server's user can run tests through it;
+on Linux, connections from other users are also refused outright.  Only the
+requested paths and the test selection and scheduling options are sent to the
+server, and only test names and results are sent back, so re-running a single
+test does not pay for starting Python, importing lit, or evaluating lit.cfg
+files.  Options that change how the tests are loaded or run, or that write
+reports, would be ignored by the server, so the client rejects them.
+
+The server does not notice changes to lit.cfg/lit.local.cfg files; restart it
+after editing them.  New tests are picked up because the requested paths are
+re-scanned (with warm configuration caches) for every request.
+"""
+
+import hashlib
+import multiprocessing.connection
+import os
+import socket
+import stat
+import struct
+import sys
+import time
+
+import lit.discovery
+import lit.display
+import lit.main
+import lit.run
+import lit.Test
+import lit.TestHistory
+from lit.ParseCache import write_parse_caches
+from lit.TestTimes import read_test_times, record_test_times
+
+AUTHKEY_FILE = 'authkey'
+SOCKET_FILE = 'socket'
+
+
+class ServerError(Exception):
+    pass
+
+
+def _address(directory):
+    """The address of the server listening in the given directory."""
+    if sys.platform == 'win32':
+        digest = hashlib.sha1(os.path.realpath(directory).encode('utf-8'))
+        return r'\\.\pipe\lit-' + digest.hexdigest()[:16]
+    return os.path.join(directory, SOCKET_FILE)
+
+
+def _create_server_dir(directory):
+    """
+    Create the directory of a server, or check that an existing one is only
+    accessible to the current user.  Return the address to listen on and a
+    new random authkey, stored in the directory for clients to read.
+    """
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode):
+        raise ServerError('%r is not a directory' % directory)
+    if hasattr(os, 'getuid') and (st.st_uid != os.getuid() or
+                                  st.st_mode & 0o077):
+        raise ServerError('%r must be owned by the current user and not be '
+                          'accessible to others' % directory)
+
+    authkey = os.urandom(32)
+    path = os.path.join(directory, AUTHKEY_FILE)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(authkey)
+
+    # Remove the socket of a server that did not shut down cleanly.
+    address = _address(directory)
+    if sys.platform != 'win32' and os.path.exists(address):
+        os.unlink(address)
+    return address, authkey
+
+
+def _same_user(conn):
+    """Whether the peer of a connection runs as the current user, or True
+    if that cannot be told."""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return True
+    sock = socket.socket(fileno=os.dup(conn.fileno()))
+    try:
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                struct.calcsize('3i'))
+    finally:
+        sock.close()
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid == os.getuid()
+
+
+class Server(object):
+    def __init__(self, lit_config, indirectlyRunCheck):
+        self.lit_config = lit_config
+        self.indirectlyRunCheck = indirectlyRunCheck
+        self.test_suite_cache = {}
+        self.local_config_cache = {}
+
+    def discover(self, paths):
+        """
+        discover(paths) -> [Test]
+
+        Like lit.discovery.find_tests_for_inputs, but reuses the suites and
+        local configurations loaded by previous calls.
+        """
+        suites = [ts for ts, _ in self.test_suite_cache.values() if ts]
+        for ts in suites:
+            ts.test_times = read_test_times(ts)
+            if self.lit_config.median_test_times:
+                lit.TestHistory.use_median_times(ts)
+
+        tests = []
+        for path in paths:
+            prev = len(tests)
+            tests.extend(lit.discovery.getTests(
+                path, self.lit_config, self.test_suite_cache,
+                self.local_config_cache, self.indirectlyRunCheck)[1])
+            if prev == len(tests):
+                self.lit_config.warning('input %r contained no tests' % path)
+
+        for ts, _ in self.test_suite_cache.values():
+            if ts:
+                ts.test_times = None
+        return tests
+
+    def serve(self, directory):
+        try:
+            address, authkey = _create_server_dir(directory)
+        except (OSError, ServerError) as e:
+            self.lit_config.fatal('could not create the server directory: %s'
+                                  % e)
+        try:
+            with multiprocessing.connection.Listener(
+                    address, authkey=authkey) as listener:
+                self.lit_config.note('listening on %s' % address)
+                self._serve(listener)
+        finally:
+            try:
+                os.unlink(os.path.join(directory, AUTHKEY_FILE))
+            except OSError:
+                pass
+
+    def _serve(self, listener):
+        while True:
+            try:
+                conn = listener.accept()
+            except (multiprocessing.AuthenticationError, EOFError,
+                    OSError) as e:
+                self.lit_config.note('refused a client: %s' % e)
+                continue
+            with conn:
+                if not _same_user(conn):
+                    self.lit_config.note('refused a client of another user')
+                    continue
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    continue
+                try:
+                    self._handle(conn, request)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.lit_config.note('client disconnected')
+                except SystemExit:
+                    # lit_config.fatal() printed the message on the server.
+                    self._send_error(conn, 'fatal error in the lit server; '
+                                           'see its output')
+                except Exception as e:
+                    self.lit_config.note('request failed: %s' % e)
+                    self._send_error(conn, str(e) or type(e).__name__)
+
+    def _send_error(self, conn, message):
+        # A bad request fails only that request, not the server.
+        try:
+            conn.send(('error', message))
+        except OSError:
+            pass
+
+    def _handle(self, conn, request):
+        # Errors and warnings are counted per request.
+        self.lit_config.numErrors = 0
+        self.lit_config.numWarnings = 0
+
+        os.chdir(request['cwd'])
+        tests = self.discover(request['paths'])
+        if self.lit_config.numErrors:
+            conn.send(('error', 'errors during test discovery'))
+            return
+
+        lit.main.determine_order(tests, request['order'])
+        selected = [t for t in tests
+                    if request['filter'].search(t.getFullName()) and
+                    not request['filter_out'].search(t.getFullName())]
+        if not selected:
+            conn.send(('error', 'did not discover any tests for provided '
+                                'path(s)'))
+            return
+
+        workers = min(len(selected), request['workers'])
+        conn.send(('start', len(selected), len(tests), workers))
+
+        def report(test):
+            conn.send(('result', test.getFullName(), test.result))
+
+        start = time.time()
+        run = lit.run.Run(selected, self.lit_config, workers, report,
+                          request['max_failures'], request['timeout'])
+        error = None
+        try:
+            lit.main.execute_in_tmp_dir(run, self.lit_config)
+        except lit.run.MaxFailuresError:
+            error = 'warning: reached maximum number of test failures'
+        except lit.run.TimeoutError:
+            error = 'warning: reached timeout'
+        elapsed = time.time() - start
+
+        record_test_times(selected, self.lit_config)
+        write_parse_caches(selected, self.lit_config)
+        skipped = [t.getFullName() for t in selected
+                   if t.result.code is lit.Test.SKIPPED]
+        conn.send(('done', elapsed, error, skipped))
+
+
+class RemoteTest(object):
+    """The subset of the Test interface needed to display a remote result."""
+
+    def __init__(self, name, result):
+        self.name = name
+        self.result = result
+        self.previous_elapsed = 0.0
+        self.previous_failure = False
+
+    def getFullName(self):
+        return self.name
+
+    def isFailure(self):
+        return self.result.code.isFailure
+
+
+def connect(directory, opts):
+    """
+    connect(directory, opts) -> exit code
+
+    Send the test paths and options to the server running in the given
+    directory and print the results as they arrive.
+    """
+    try:
+        with open(os.path.join(directory, AUTHKEY_FILE), 'rb') as f:
+            authkey = f.read()
+        conn = multiprocessing.connection.Client(_address(directory),
+                                                 authkey=authkey)
+    except (OSError, EOFError, multiprocessing.AuthenticationError) as e:
+        sys.stderr.write('error: could not connect to lit server in %r: %s\n'
+                         % (directory, e))
+        return 2
+
+    with conn:
+        conn.send({
+            'cwd': os.getcwd(),
+            'paths': [os.path.abspath(p) for p in opts.test_paths],
+            'order': opts.order,
+            'filter': opts.filter,
+            'filter_out': opts.filter_out,
+            'workers': opts.workers,
+            'max_failures': opts.max_failures,
+            'timeout': opts.timeout,
+        })
+
+        tests = []
+        display = None
+        while True:
+            msg = conn.recv()
+            kind = msg[0]
+            if kind == 'error':
+                sys.stderr.write('error: %s\n' % msg[1])
+                return 2
+            elif kind == 'start':
+                _, num_tests, total_tests, workers = msg
+                placeholders = [RemoteTest(None, None)] * num_tests
+                display = lit.display.create_display(
+                    opts, placeholders, total_tests, workers)
+                display.print_header()
+            elif kind == 'result':
+                test = RemoteTest(msg[1], msg[2])
+                tests.append(test)
+                display.update(test)
+            else:
+                assert kind == 'done'
+                _, elapsed, error, skipped = msg
+                break
+
+    display.clear(interrupted=False)
+    if error:
+        sys.stderr.write('%s, skipping remaining tests\n' % error)
+
+    result = lit.Test.Result(lit.Test.SKIPPED)
+    tests.extend(RemoteTest(name, result) for name in skipped)
+    lit.main.print_results(tests, elapsed, opts)
+
+    if any(t.isFailure() for t in tests) and not opts.ignoreFail:
+        return 1
+    return 0
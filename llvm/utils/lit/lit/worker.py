@@ -5,66 +5,80 @@ Exception: in single process mode _execute is called directly.
 For efficiency, we copy all data needed to execute all tests into each worker
 and store it in global variables. This reduces the cost of each task.
 """
-import contextlib
 import os
 import signal
+import sys
 import time
 import traceback
 
 import lit.Test
+import lit.TestRunner
 import lit.util
 
 
 _lit_config = None
-_parallelism_semaphores = None
+_tests = None
 
 
-def initialize(lit_config, parallelism_semaphores):
+def set_tests(tests):
+    """Set the tests that forked worker processes inherit"""
+    global _tests
+    _tests = tests
+
+
+def initialize(lit_config, tests):
     """Copy data shared by all test executions into worker processes"""
     global _lit_config
-    global _parallelism_semaphores
     _lit_config = lit_config
-    _parallelism_semaphores = parallelism_semaphores
+    if tests is not None:
+        set_tests(tests)
 
     # We use the following strategy for dealing with Ctrl+C/KeyboardInterrupt in
     # subprocesses created by the multiprocessing.Pool.
     # https://noswap.com/blog/python-multiprocessing-keyboardinterrupt
     signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The main process turns SIGTERM into KeyboardInterrupt while tests run,
+    # but Pool.terminate() relies on SIGTERM killing the workers.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
 
 
-def execute(test):
+def execute(idx):
     """Run one test in a multiprocessing.Pool
 
     Side effects in this function and functions it calls are not visible in the
     main lit process.
 
     Arguments and results of this function are pickled, so they should be cheap
-    to copy.
+    to copy.  The test is identified by its index into the list passed to
+    initialize(), and only the fields the main process needs are sent back.
+    This includes the entries the test added to the parse cache of its suite,
+    since that cache is saved by the main process.
+
+    Parallelism groups are enforced by the scheduler in the main process, so
+    by the time a test gets here it is free to run.
     """
-    with _get_parallelism_semaphore(test):
-        result = _execute(test, _lit_config)
+    test = _tests[idx]
+    result = _execute(test, _lit_config)
 
     test.setResult(result)
-    return test
-
-
-# TODO(python3): replace with contextlib.nullcontext
-@contextlib.contextmanager
-def NopSemaphore():
-    yield
-
-
-def _get_parallelism_semaphore(test):
-    pg = test.config.parallelism_group
-    if callable(pg):
-        pg = pg(test)
-    return _parallelism_semaphores.get(pg, NopSemaphore())
+    parse_cache = test.suite.parse_cache
+    updates = parse_cache.take_updates() if parse_cache else None
+    return test.result, test.requires, updates
 
 
 # Do not inline! Directly used by LitTestCase.py
 def _execute(test, lit_config):
     start = time.time()
+    usage = None
+    if lit_config.resource_usage:
+        usage = _get_resource_usage()
+        lit.TestRunner.takePeakCommandRSS()
     result = _execute_test_handle_errors(test, lit_config)
+    if usage is not None:
+        _add_resource_metrics(result, usage, _get_resource_usage(),
+                              lit.TestRunner.takePeakCommandRSS())
+    if lit_config.max_output_size:
+        _limit_output(test, result, lit_config.max_output_size)
     result.elapsed = time.time() - start
     result.start = start
     result.pid = os.getpid()
@@ -84,6 +98,99 @@ def _execute_test_handle_errors(test, lit_config):
         return lit.Test.Result(lit.Test.UNRESOLVED, output)
 
 
+def _limit_output(test, result, max_size):
+    """
+    Keep the beginning and the end of a huge test output, so that it is cheap
+    to send to the main process and to report, and save the full output in
+    the test's Output directory.
+    """
+    output = result.output
+    if not isinstance(output, str) or len(output) <= max_size:
+        return
+
+    path = lit.TestRunner.getOutputPath(test)
+    try:
+        lit.util.mkdir_p(os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8', errors='replace') as f:
+            f.write(output)
+    except OSError as e:
+        note = 'note: full output could not be saved: %s' % e
+    else:
+        result.output_file = path
+        note = 'note: full output saved to %s' % path
+
+    head = output[:max_size // 2]
+    tail = output[len(output) - max_size // 2:]
+    result.output = '%s\n...\nnote: %d characters of output omitted\n%s\n...\n%s' % (
+        head, len(output) - len(head) - len(tail), note, tail)
+
+
+def _get_resource_usage():
+    """
+    The CPU time, I/O and peak RSS used so far by this worker and the
+    processes it has waited for, or None if they cannot be measured here.
+
+    A worker runs one test at a time, so the difference between two samples
+    taken around a test is what the test used.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    usage = {
+        'user_time': own.ru_utime + children.ru_utime,
+        'system_time': own.ru_stime + children.ru_stime,
+        # Blocks of 512 bytes that went to or from the disk.
+        'read_bytes': (own.ru_inblock + children.ru_inblock) * 512,
+        'write_bytes': (own.ru_oublock + children.ru_oublock) * 512,
+        # Kilobytes, but bytes on macOS.
+        'max_rss': children.ru_maxrss * (1 if sys.platform == 'darwin'
+                                         else 1024),
+    }
+    # On Linux, the I/O of reaped children is added to their parent's, and
+    # this also counts the reads and writes served by the page cache.
+    try:
+        with open('/proc/self/io') as f:
+            io = dict(line.split(': ') for line in f.read().splitlines())
+        usage['read_bytes'] = int(io['rchar'])
+        usage['write_bytes'] = int(io['wchar'])
+    except (OSError, KeyError, ValueError):
+        pass
+    return usage
+
+
+def _add_resource_metrics(result, before, after, peak_rss=None):
+    """
+    Add the CPU time, I/O and peak RSS used by a test to its metrics, unless
+    the test reported metrics of the same name itself.
+
+    The peak RSS is the largest one of the commands the internal shell ran
+    for the test, as given by peak_rss.  Without it, as with the external
+    shell, the kernel only keeps the peak RSS of the largest child this
+    worker ever waited for, so the peak RSS of the test is only known if it
+    set a new maximum for this worker.  It is left out otherwise.
+    """
+    metrics = {
+        'user_time': lit.Test.RealMetricValue(
+            after['user_time'] - before['user_time']),
+        'system_time': lit.Test.RealMetricValue(
+            after['system_time'] - before['system_time']),
+        'read_bytes': lit.Test.IntMetricValue(
+            after['read_bytes'] - before['read_bytes']),
+        'write_bytes': lit.Test.IntMetricValue(
+            after['write_bytes'] - before['write_bytes']),
+    }
+    if peak_rss is not None:
+        metrics['max_rss'] = lit.Test.IntMetricValue(peak_rss)
+    elif after['max_rss'] > before['max_rss']:
+        metrics['max_rss'] = lit.Test.IntMetricValue(after['max_rss'])
+    for name, value in metrics.items():
+        if name not in result.metrics:
+            result.addMetric(name, value)
+
+
 # Support deprecated result from execute() which returned the result
 # code and additional output as a tuple.
 def _adapt_result(result):
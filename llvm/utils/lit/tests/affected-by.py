@@ -0,0 +1,31 @@
+# Check that --affected-by only selects the tests that may be affected by the
+# given files, and reports why each one was selected.
+#
+# RUN: %{lit} --affected-by=%{inputs}/affected-by/Inputs/input.dat \
+# RUN:   %{inputs}/affected-by | FileCheck --check-prefix=CHECK-INPUT %s
+#
+# CHECK-INPUT: affected-by :: uses-input.txt: input {{.*}}input.dat changed
+# CHECK-INPUT: -- Testing: 1 of 3 tests, 1 workers --
+# CHECK-INPUT: PASS: affected-by :: uses-input.txt
+# CHECK-INPUT: Excluded: 2
+#
+# RUN: %{lit} --affected-by="%{inputs}/affected-by/plain.txt;%{inputs}/affected-by/other/unreferenced.dat" \
+# RUN:   %{inputs}/affected-by | FileCheck --check-prefix=CHECK-MULTI %s
+#
+# CHECK-MULTI: affected-by :: other/nested.txt: file {{.*}}unreferenced.dat changed
+# CHECK-MULTI: affected-by :: plain.txt: test changed
+# CHECK-MULTI: -- Testing: 2 of 3 tests, 1 workers --
+#
+# Lit's own state files next to the tests do not affect them.
+#
+# RUN: %{lit} --affected-by="%{inputs}/affected-by/plain.txt;%{inputs}/affected-by/.lit_test_times.txt" \
+# RUN:   %{inputs}/affected-by | FileCheck --check-prefix=CHECK-STATE %s
+#
+# CHECK-STATE: affected-by :: plain.txt: test changed
+# CHECK-STATE: -- Testing: 1 of 3 tests, 1 workers --
+#
+# RUN: %{lit} --affected-by=%{inputs}/../../lit.py %{inputs}/affected-by 2>&1 \
+# RUN:   | FileCheck --check-prefix=CHECK-UNKNOWN %s
+#
+# CHECK-UNKNOWN: note: selecting all tests, cannot determine the impact of {{.*}}lit.py
+# CHECK-UNKNOWN: -- Testing: 3 tests, 1 workers --
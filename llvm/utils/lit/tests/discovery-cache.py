@@ -0,0 +1,41 @@
+# Check that directory listings are cached between runs and that the cache is
+# invalidated when a directory changes.
+#
+# RUN: rm -rf %t && cp -R %{inputs}/discovery-cache %t
+#
+# RUN: %{lit} --debug --show-tests %t > %t.out 2> %t.err
+# RUN: FileCheck --check-prefix=CHECK-COLD < %t.err %s
+# RUN: FileCheck --check-prefix=CHECK-TESTS < %t.out %s
+#
+# RUN: %{lit} --debug --show-tests %t > %t.out 2> %t.err
+# RUN: FileCheck --check-prefix=CHECK-WARM < %t.err %s
+# RUN: FileCheck --check-prefix=CHECK-TESTS < %t.out %s
+#
+# Running the tests rewrites lit's state files in the exec root, which must
+# not invalidate its listing.  (The first run creates the Output directories.)
+#
+# RUN: %{lit} %t
+# RUN: %{lit} %t
+# RUN: %{lit} --debug --show-tests %t > %t.out 2> %t.err
+# RUN: FileCheck --check-prefix=CHECK-WARM < %t.err %s
+#
+# RUN: %{python} -c "open(r'%t/subdir/test3.txt', 'w').write('# RUN: true')"
+# RUN: %{lit} --debug --show-tests %t > %t.out 2> %t.err
+# RUN: FileCheck --check-prefix=CHECK-CHANGED < %t.err %s
+# RUN: FileCheck --check-prefixes=CHECK-TESTS,CHECK-NEW < %t.out %s
+#
+# RUN: %{lit} --debug --show-tests --rebuild-discovery-cache %t > %t.out 2> %t.err
+# RUN: FileCheck --check-prefix=CHECK-COLD < %t.err %s
+#
+# RUN: %{lit} --debug --show-tests --no-discovery-cache %t > %t.out 2> %t.err
+# RUN: FileCheck --check-prefix=CHECK-DISABLED < %t.err %s
+
+# CHECK-COLD: discovery cache for 'discovery-cache': 0 hits, 2 misses
+# CHECK-WARM: discovery cache for 'discovery-cache': 2 hits, 0 misses
+# CHECK-CHANGED: discovery cache for 'discovery-cache': 1 hits, 1 misses
+# CHECK-DISABLED-NOT: discovery cache
+
+# CHECK-TESTS: -- Available Tests --
+# CHECK-TESTS-NEXT: discovery-cache :: subdir/test2.txt
+# CHECK-NEW-NEXT: discovery-cache :: subdir/test3.txt
+# CHECK-TESTS-NEXT: discovery-cache :: test1.txt
@@ -61,6 +61,15 @@
 # CHECK-SHARD2-OUT: Testing: 1 of 5 tests
 
 
+# Check that --balance-shards splits the testsuite by the test times recorded
+# by the earlier runs.
+#
+# RUN: %{lit} --num-shards 3 --run-shard 1 --balance-shards %{inputs}/discovery >%t.out 2>%t.err
+# RUN: FileCheck --check-prefix=CHECK-SHARD-TIME-ERR < %t.err %s
+# CHECK-SHARD-TIME-ERR: note: Selecting shard 1/3 = size {{[0-9]}}/5 = predicted time {{[0-9.]+}}s, balanced by recorded test times
+# CHECK-SHARD-TIME-ERR: note: Predicted shard times: {{[0-9.]+}}s, {{[0-9.]+}}s, {{[0-9.]+}}s
+
+
 # Check that sharding via env vars works.
 #
 # RUN: env LIT_NUM_SHARDS=3 LIT_RUN_SHARD=1 %{lit} %{inputs}/discovery >%t.out 2>%t.err
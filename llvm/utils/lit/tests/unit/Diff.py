@@ -0,0 +1,138 @@
+# RUN: %{python} %s
+
+import difflib
+import io
+import os
+import random
+import sys
+import unittest
+
+import lit
+
+# The builtin commands run as scripts, with lit/ on their path.
+lit_dir = os.path.dirname(os.path.abspath(lit.__file__))
+sys.path.insert(0, os.path.join(lit_dir, 'builtin_commands'))
+sys.path.insert(0, lit_dir)
+import diff
+
+
+def random_lines(rng, alphabet, max_lines):
+    return [rng.choice(alphabet) + '\n'
+            for _ in range(rng.randint(0, max_lines))]
+
+
+def apply_unified_diff(a, udiff):
+    """Return the lines a unified diff of a turns a into."""
+    result = []
+    i = 0
+    for line in udiff[2:]:
+        if line.startswith('@@'):
+            old = line.split()[1][1:].split(',')
+            start = int(old[0])
+            if len(old) == 1 or int(old[1]):
+                start -= 1
+            result += a[i:start]
+            i = start
+        elif line[0] == ' ':
+            result.append(line[1:])
+            i += 1
+        elif line[0] == '-':
+            i += 1
+        else:
+            result.append(line[1:])
+    return result + a[i:]
+
+
+class TestDiffAgainstDifflib(unittest.TestCase):
+    def test_random_inputs(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            a = random_lines(rng, 'abcd', 12)
+            b = random_lines(rng, 'abcd', 12)
+            blocks = list(diff.getMatchingBlocks(a, b))
+            self.assertEqual(blocks[-1], (len(a), len(b), 0))
+            end_a = end_b = 0
+            for i, j, size in blocks[:-1]:
+                self.assertGreater(size, 0)
+                self.assertGreaterEqual(i, end_a)
+                self.assertGreaterEqual(j, end_b)
+                self.assertEqual(a[i:i + size], b[j:j + size])
+                end_a, end_b = i + size, j + size
+
+            # A shortest diff keeps at least as many lines as difflib's.
+            matcher = difflib.SequenceMatcher(None, a, b)
+            self.assertGreaterEqual(
+                sum(size for _, _, size in blocks),
+                sum(size for _, _, size in matcher.get_matching_blocks()))
+
+            for n in (0, 1, 3):
+                udiff = list(diff.unifiedDiff(a, b, 'a', 'b', n))
+                self.assertEqual(apply_unified_diff(a, udiff), b)
+                self.assertEqual(bool(udiff), a != b)
+
+    def test_same_as_difflib(self):
+        # With unique lines there is a single shortest diff, which difflib
+        # finds as well.
+        rng = random.Random(0)
+        for _ in range(200):
+            a = ['line %d\n' % i for i in range(rng.randint(0, 40))]
+            b = [line for line in a if rng.random() > 0.1]
+            for i in range(rng.randint(0, 3)):
+                b.insert(rng.randint(0, len(b)), 'new %d\n' % i)
+            for n in (0, 3):
+                self.assertEqual(
+                    list(diff.unifiedDiff(a, b, 'a', 'b', n)),
+                    list(difflib.unified_diff(a, b, 'a', 'b', n=n)))
+                self.assertEqual(
+                    list(diff.contextDiff(a, b, 'a', 'b', n)),
+                    list(difflib.context_diff(a, b, 'a', 'b', n=n)))
+
+    def test_many_edits_use_difflib(self):
+        a = ['line %d\n' % i for i in range(100)]
+        b = [line if i % 2 else 'changed\n' for i, line in enumerate(a)]
+        max_edit_cost = diff.MAX_EDIT_COST
+        diff.MAX_EDIT_COST = 10
+        try:
+            self.assertEqual(list(diff.unifiedDiff(a, b, 'a', 'b', 3)),
+                             list(difflib.unified_diff(a, b, 'a', 'b')))
+        finally:
+            diff.MAX_EDIT_COST = max_edit_cost
+
+
+class TestDiffOutputLimit(unittest.TestCase):
+    def test_matching_stops_at_limit(self):
+        a = ['line %d\n' % i for i in range(2000)]
+        b = [line if i % 20 else 'changed\n' for i, line in enumerate(a)]
+
+        calls = []
+        middle_snake = diff.middleSnake
+        def counting_middle_snake(*args):
+            calls.append(args)
+            return middle_snake(*args)
+
+        stdout = sys.stdout
+        max_diff_lines = diff.MAX_DIFF_LINES
+        diff.middleSnake = counting_middle_snake
+        try:
+            for limit in (max_diff_lines, 10):
+                diff.MAX_DIFF_LINES = limit
+                sys.stdout = io.StringIO()
+                self.assertEqual(diff.printDiff(diff.unifiedDiff, [a, b],
+                                                ['a', 'b'], 3), 1)
+                output = sys.stdout.getvalue()
+                sys.stdout = stdout
+                if limit == 10:
+                    self.assertIn('diff truncated after 10 lines', output)
+                    truncated_calls = len(calls)
+                else:
+                    full_calls = len(calls)
+                calls[:] = []
+        finally:
+            sys.stdout = stdout
+            diff.middleSnake = middle_snake
+            diff.MAX_DIFF_LINES = max_diff_lines
+        self.assertLess(truncated_calls * 10, full_calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
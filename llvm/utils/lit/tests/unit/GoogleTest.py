@@ -0,0 +1,27 @@
+# RUN: %{python} %s
+
+import unittest
+
+from lit.formats.googletest import GoogleTest
+
+
+class TestBalanceShards(unittest.TestCase):
+    def test_no_history(self):
+        self.assertIsNone(GoogleTest.balance_shards(['A.a', 'A.b'], {}, 2))
+
+    def test_equal_duration(self):
+        names = ['A.a', 'A.b', 'A.c', 'A.d', 'A.e']
+        times = {'A.a': 1.0, 'A.b': 1.0, 'A.c': 1.0, 'A.d': 1.0, 'A.e': 4.0}
+        shards = GoogleTest.balance_shards(names, times, 2)
+        self.assertEqual(shards, [(['A.e'], 4.0),
+                                  (['A.a', 'A.b', 'A.c', 'A.d'], 4.0)])
+
+    def test_fallback(self):
+        names = ['A.a', 'A.b', 'A.new']
+        times = {'A.a': 3.0, 'A.b': 1.0}
+        shards = GoogleTest.balance_shards(names, times, 2)
+        self.assertEqual(shards, [(['A.a'], 3.0), (['A.new', 'A.b'], 3.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+# RUN: %{python} %s
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import lit.Test
+import lit.worker
+
+
+class TestOutputLimit(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.suite = lit.Test.TestSuite('suite', self.dir, self.dir, None)
+        self.test = lit.Test.Test(self.suite, ('t.txt',), None)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_small_output(self):
+        result = lit.Test.Result(lit.Test.FAIL, 'abc')
+        lit.worker._limit_output(self.test, result, 10)
+        self.assertEqual(result.output, 'abc')
+        self.assertIsNone(result.output_file)
+
+    def test_head_and_tail(self):
+        output = 'HEAD' + 'x' * 1000 + 'TAIL'
+        result = lit.Test.Result(lit.Test.FAIL, output)
+        lit.worker._limit_output(self.test, result, 8)
+        self.assertTrue(result.output.startswith('HEAD\n'))
+        self.assertTrue(result.output.endswith('\nTAIL'))
+        self.assertIn('1000 characters of output omitted', result.output)
+        self.assertEqual(result.output_file,
+                         os.path.join(self.dir, 'Output', 't.txt.output'))
+        with open(result.output_file) as f:
+            self.assertEqual(f.read(), output)
+
+    def test_shared_executable(self):
+        # A googletest shard, whose exec path is below the executable.
+        exe = os.path.join(self.dir, 'Tests')
+        open(exe, 'w').close()
+        shard = lit.Test.Test(self.suite, ('Tests', '0', '2'), None,
+                              file_path=exe)
+        result = lit.Test.Result(lit.Test.FAIL, 'x' * 100)
+        lit.worker._limit_output(shard, result, 8)
+        self.assertEqual(result.output_file,
+                         os.path.join(self.dir, 'Output',
+                                      'Tests.Tests.0.2.output'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# RUN: %{python} %s
+#
+# END.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import lit.ParseCache
+import lit.Test
+from lit.ParseCache import ParseCache
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.suite = lit.Test.TestSuite('suite', root, root, None)
+        self.path = os.path.join(self.suite.exec_root, 't.txt')
+        self.write('// RUN: true\n', age=10)
+        self.scans = []
+
+    def tearDown(self):
+        shutil.rmtree(self.suite.exec_root)
+
+    def write(self, contents, age):
+        with open(self.path, 'w') as f:
+            f.write(contents)
+        mtime = time.time() - age
+        os.utime(self.path, (mtime, mtime))
+
+    def scan(self, data):
+        self.scans.append(data)
+        return [[1, 'RUN:', data.decode()]]
+
+    def test_reuse_across_runs(self):
+        cache = ParseCache(self.suite)
+        commands = cache.get_commands(self.path, ['RUN:'], self.scan)
+        self.assertEqual(commands, [[1, 'RUN:', '// RUN: true\n']])
+        cache.write(None)
+
+        cache = ParseCache(self.suite)
+        self.assertEqual(cache.get_commands(self.path, ['RUN:'], self.scan),
+                         commands)
+        self.assertEqual(len(self.scans), 1)
+        self.assertEqual(cache.take_updates(), {})
+
+    def test_keywords(self):
+        cache = ParseCache(self.suite)
+        cache.get_commands(self.path, ['RUN:'], self.scan)
+        cache.get_commands(self.path, ['RUN:', 'REQUIRES:'], self.scan)
+        self.assertEqual(len(self.scans), 2)
+
+    def test_changed_file(self):
+        cache = ParseCache(self.suite)
+        cache.get_commands(self.path, ['RUN:'], self.scan)
+        self.write('// RUN: false\n', age=5)
+        commands = cache.get_commands(self.path, ['RUN:'], self.scan)
+        self.assertEqual(commands, [[1, 'RUN:', '// RUN: false\n']])
+
+    def test_touched_file(self):
+        cache = ParseCache(self.suite)
+        cache.get_commands(self.path, ['RUN:'], self.scan)
+        self.write('// RUN: true\n', age=5)
+        cache.get_commands(self.path, ['RUN:'], self.scan)
+        self.assertEqual(len(self.scans), 1)
+
+    def test_recently_modified_file(self):
+        self.write('// RUN: true\n', age=0)
+        cache = ParseCache(self.suite)
+        cache.get_commands(self.path, ['RUN:'], self.scan)
+        self.assertIsNone(cache.files[self.path]['stamp'])
+        cache.get_commands(self.path, ['RUN:'], self.scan)
+        self.assertEqual(len(self.scans), 1)
+
+    def test_merge_updates(self):
+        worker_cache = ParseCache(self.suite)
+        worker_cache.get_commands(self.path, ['RUN:'], self.scan)
+        cache = ParseCache(self.suite)
+        cache.merge(worker_cache.take_updates())
+        cache.write(None)
+        self.assertTrue(os.path.exists(os.path.join(
+            self.suite.exec_root, lit.ParseCache.CACHE_FILE)))
+        self.assertEqual(ParseCache(self.suite).files, cache.files)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# RUN: %{python} %s
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import lit.Test
+import lit.TestingConfig
+from lit.reports import JsonReport, TimeTraceReport, XunitReport
+
+
+class TestStreamingReports(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.dir, 'report')
+        config = lit.TestingConfig.TestingConfig(
+            None, 'suite', suffixes=[], test_format=None, environment={},
+            substitutions=[], unsupported=False, test_exec_root=self.dir,
+            test_source_root=self.dir, excludes=[], available_features=[],
+            pipefail=False)
+        self.suite = lit.Test.TestSuite('suite', self.dir, self.dir, config)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def make_test(self, name, code, output=''):
+        test = lit.Test.Test(self.suite, (name,), self.suite.config)
+        test.result = lit.Test.Result(code, output, 0.5)
+        test.result.start = 100.0
+        return test
+
+    def test_journal(self):
+        report = JsonReport(self.output)
+        report.start()
+        report.add_result(self.make_test('a', lit.Test.PASS, 'out'))
+        with open(self.output + '.partial') as f:
+            self.assertEqual(json.loads(f.readline())[1]['output'], 'out')
+        self.assertFalse(os.path.exists(self.output))
+
+    def test_finalize(self):
+        a = self.make_test('a', lit.Test.PASS)
+        b = self.make_test('b', lit.Test.FAIL, 'boom')
+        report = JsonReport(self.output)
+        report.start()
+        report.add_result(b)
+        # Tests that did not run are not journaled, and journaled tests that
+        # are not reported are dropped.
+        report.add_result(self.make_test('shard', lit.Test.PASS))
+        # The output of journaled tests is read back from the journal.
+        b.result.output = ''
+        report.write_results([a, b], 1.0)
+
+        self.assertFalse(os.path.exists(self.output + '.partial'))
+        with open(self.output) as f:
+            data = json.load(f)
+        # Tests are reported in order, not in the order they completed.
+        self.assertEqual([(t['name'], t['output']) for t in data['tests']],
+                         [('suite :: a', ''), ('suite :: b', 'boom')])
+
+    def test_interrupted(self):
+        a = self.make_test('a', lit.Test.PASS)
+        b = self.make_test('b', lit.Test.SKIPPED)
+        for cls in (JsonReport, TimeTraceReport):
+            report = cls(self.output)
+            report.start()
+            report.add_result(a)
+            report.write_results([a, b], 1.0)
+            with open(self.output) as f:
+                data = json.load(f)
+            self.assertEqual(len(data.get('tests', data.get('traceEvents'))), 1)
+
+    def test_xunit_sorted(self):
+        tests = [self.make_test('c', lit.Test.PASS),
+                 self.make_test('a', lit.Test.FAIL, 'boom'),
+                 self.make_test('b', lit.Test.UNSUPPORTED)]
+        report = XunitReport(self.output)
+        report.start()
+        for test in tests:
+            report.add_result(test)
+        report.write_results(tests, 1.0)
+        with open(self.output) as f:
+            xml = f.read()
+        self.assertIn('tests="3" failures="1" skipped="1"', xml)
+        self.assertLess(xml.index('name="a"'), xml.index('name="b"'))
+        self.assertLess(xml.index('name="b"'), xml.index('name="c"'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# RUN: %{python} %s
+
+import os
+import subprocess
+import sys
+import unittest
+
+import lit.Test
+import lit.TestRunner
+import lit.worker
+
+
+def usage(user_time, max_rss):
+    return {'user_time': user_time, 'system_time': 0.5,
+            'read_bytes': 100, 'write_bytes': 200, 'max_rss': max_rss}
+
+
+class TestResourceMetrics(unittest.TestCase):
+    def test_deltas(self):
+        result = lit.Test.Result(lit.Test.PASS)
+        before = usage(1.0, 1000)
+        after = dict(usage(3.5, 4000), read_bytes=150)
+        lit.worker._add_resource_metrics(result, before, after)
+        metrics = {k: v.todata() for k, v in result.metrics.items()}
+        self.assertEqual(metrics, {'user_time': 2.5, 'system_time': 0.0,
+                                   'read_bytes': 50, 'write_bytes': 0,
+                                   'max_rss': 4000})
+
+    def test_unknown_peak_rss(self):
+        result = lit.Test.Result(lit.Test.PASS)
+        lit.worker._add_resource_metrics(result, usage(1.0, 4000),
+                                         usage(2.0, 4000))
+        self.assertNotIn('max_rss', result.metrics)
+
+    def test_peak_rss_of_commands(self):
+        result = lit.Test.Result(lit.Test.PASS)
+        lit.worker._add_resource_metrics(result, usage(1.0, 4000),
+                                         usage(2.0, 4000), 1500)
+        self.assertEqual(result.metrics['max_rss'].todata(), 1500)
+
+    def test_peak_rss_of_waited_processes(self):
+        lit.TestRunner.takePeakCommandRSS()
+        proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+        code, _, max_rss = lit.TestRunner.waitForProcess(proc)
+        self.assertEqual(code, 0)
+        if max_rss is None:
+            self.skipTest('resource usage is not available')
+        self.assertGreater(max_rss, 0)
+        self.assertEqual(lit.TestRunner.takePeakCommandRSS(), max_rss)
+        self.assertIsNone(lit.TestRunner.takePeakCommandRSS())
+
+    def test_wait_error_is_raised(self):
+        class BrokenProcess(object):
+            # Not a child of this process, so wait4() fails too.
+            pid = os.getpid()
+
+            def wait(self):
+                raise OSError('cannot wait')
+
+        waiter = lit.TestRunner.ProcessWaiter(BrokenProcess())
+        with self.assertRaisesRegex(OSError, 'cannot wait'):
+            waiter.wait()
+
+    def test_test_metrics_are_kept(self):
+        result = lit.Test.Result(lit.Test.PASS)
+        result.addMetric('user_time', lit.Test.IntMetricValue(7))
+        lit.worker._add_resource_metrics(result, usage(1.0, 0),
+                                         usage(2.0, 0))
+        self.assertEqual(result.metrics['user_time'].todata(), 7)
+
+    def test_sample(self):
+        sample = lit.worker._get_resource_usage()
+        if sample is None:
+            self.skipTest('resource usage is not available')
+        self.assertEqual(sorted(sample), ['max_rss', 'read_bytes',
+                                          'system_time', 'user_time',
+                                          'write_bytes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+# RUN: %{python} %s
+
+import shutil
+import tempfile
+import unittest
+
+import lit.Test
+import lit.TestHistory
+import lit.TestingConfig
+from lit.run import (Scheduler, get_peak_memory, partition_by_time,
+                     predict_makespan)
+
+
+def make_config(parallelism_group=None):
+    return lit.TestingConfig.TestingConfig(
+        None, 'suite', suffixes=[], test_format=None, environment={},
+        substitutions=[], unsupported=False, test_exec_root=None,
+        test_source_root=None, excludes=[], available_features=[],
+        pipefail=False, parallelism_group=parallelism_group)
+
+
+def setUpModule():
+    global suite
+    root = tempfile.mkdtemp()
+    suite = lit.Test.TestSuite('suite', root, root, make_config())
+
+
+def tearDownModule():
+    shutil.rmtree(suite.exec_root)
+
+
+def make_test(previous_elapsed, parallelism_group=None, name=''):
+    test = lit.Test.Test(suite, (name,), make_config(parallelism_group))
+    test.previous_elapsed = previous_elapsed
+    return test
+
+
+class TestScheduler(unittest.TestCase):
+    def test_list_order(self):
+        tests = [make_test(3), make_test(2), make_test(1)]
+        s = Scheduler(tests, {})
+        self.assertEqual([s.next(), s.next(), s.next()], [0, 1, 2])
+        self.assertIsNone(s.next())
+        self.assertTrue(s.done())
+
+    def test_parallelism_group_skips_ahead(self):
+        tests = [make_test(3, 'g'), make_test(2, 'g'), make_test(1)]
+        s = Scheduler(tests, {'g': 1})
+        self.assertEqual(s.next(), 0)
+        # Test 1 is blocked by the group limit, so test 2 is dispatched.
+        self.assertEqual(s.next(), 2)
+        self.assertIsNone(s.next())
+        self.assertFalse(s.done())
+        s.complete(0)
+        self.assertEqual(s.next(), 1)
+        self.assertTrue(s.done())
+
+    def test_unlimited_group(self):
+        tests = [make_test(1, 'g'), make_test(1, 'g')]
+        s = Scheduler(tests, {'g': None})
+        self.assertEqual([s.next(), s.next()], [0, 1])
+
+    def test_callable_group(self):
+        tests = [make_test(1, lambda t: 'g'), make_test(1, lambda t: 'g')]
+        s = Scheduler(tests, {'g': 1})
+        self.assertEqual(s.next(), 0)
+        self.assertIsNone(s.next())
+
+    def test_memory_budget(self):
+        tests = [make_test(3), make_test(2), make_test(1)]
+        s = Scheduler(tests, {}, (10, [6, 6, 1]))
+        self.assertEqual(s.next(), 0)
+        # Test 1 does not fit next to test 0, but test 2 does.
+        self.assertEqual(s.next(), 2)
+        self.assertTrue(s.memory_blocked)
+        self.assertIsNone(s.next())
+        s.complete(0)
+        self.assertEqual(s.next(), 1)
+        self.assertFalse(s.memory_blocked)
+        self.assertEqual(s.memory_in_use, 7)
+
+    def test_memory_budget_no_starvation(self):
+        limit = Scheduler.MEMORY_SKIP_LIMIT
+        tests = [make_test(1) for _ in range(limit + 3)]
+        memory = [6, 6] + [1] * (limit + 1)
+        s = Scheduler(tests, {}, (10, memory))
+        self.assertEqual(s.next(), 0)
+        # Small tests run ahead of test 1 until it was overtaken too often.
+        for idx in range(2, limit + 2):
+            self.assertEqual(s.next(), idx)
+            s.complete(idx)
+        self.assertIsNone(s.next())
+        s.complete(0)
+        self.assertEqual([s.next(), s.next()], [1, limit + 2])
+
+    def test_memory_budget_skips_ahead(self):
+        tests = [make_test(3), make_test(2), make_test(1, 'g')]
+        s = Scheduler(tests, {'g': 1}, (10, [6, 6, 1]))
+        self.assertEqual([s.next(), s.next()], [0, 2])
+        self.assertIsNone(s.next())
+
+    def test_over_budget_test_runs_alone(self):
+        tests = [make_test(2), make_test(1)]
+        s = Scheduler(tests, {}, (10, [20, 0]))
+        self.assertEqual(s.next(), 0)
+        self.assertIsNone(s.next())
+        s.complete(0)
+        self.assertEqual(s.next(), 1)
+
+
+class TestPredictMakespan(unittest.TestCase):
+    def test_no_history(self):
+        self.assertIsNone(predict_makespan([make_test(0.0)], 4, {}))
+
+    def test_lpt(self):
+        tests = [make_test(t) for t in (5, 4, 3, 3, 2, 1)]
+        self.assertEqual(predict_makespan(tests, 2, {}), 9)
+
+    def test_fallback(self):
+        tests = [make_test(4), make_test(2), make_test(0.0)]
+        self.assertEqual(predict_makespan(tests, 1, {}), 9)
+
+    def test_parallelism_group(self):
+        tests = [make_test(1, 'g') for _ in range(4)]
+        self.assertEqual(predict_makespan(tests, 4, {'g': 2}), 2)
+
+
+class TestPartitionByTime(unittest.TestCase):
+    def test_no_history(self):
+        self.assertIsNone(partition_by_time([make_test(0.0)] * 3, 2))
+
+    def test_balanced(self):
+        tests = [make_test(t, name=str(i))
+                 for i, t in enumerate((1, 8, 1, 4, 2, 1, 1))]
+        shards, predicted = partition_by_time(tests, 2)
+        self.assertEqual(shards, [[1, 5], [0, 2, 3, 4, 6]])
+        self.assertEqual(predicted, [9, 9])
+
+    def test_stable(self):
+        # Small differences in the recorded times and the order of the tests
+        # do not change the partition.
+        times = [(str(i), 2 ** (i / 8.0)) for i in range(20)]
+        a = [make_test(t, name=n) for n, t in times]
+        b = [make_test(t * 1.01, name=n) for n, t in reversed(times)]
+        def names(tests, shards):
+            return [sorted(tests[i].getFullName() for i in s) for s in shards]
+        self.assertEqual(names(a, partition_by_time(a, 4)[0]),
+                         names(b, partition_by_time(b, 4)[0]))
+
+    def test_fallback(self):
+        tests = [make_test(4, name='a'), make_test(0.0, name='b'),
+                 make_test(0.0, name='c')]
+        shards, predicted = partition_by_time(tests, 2)
+        self.assertEqual(shards, [[0, 2], [1]])
+        self.assertEqual(predicted, [8, 4])
+
+
+class TestPeakMemory(unittest.TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.suite = lit.Test.TestSuite('suite', root, root, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.suite.exec_root)
+
+    def test_unsampled_tests_use_the_median(self):
+        lit.TestHistory.record_test_history(
+            self.suite.exec_root,
+            {'a': [[1.0, 'PASS', 100]], 'b': [[1.0, 'PASS', 300]],
+             'c': [[1.0, 'PASS', 900]], 'd': [[1.0, 'PASS']]}, None)
+        tests = [lit.Test.Test(self.suite, (p,), None) for p in 'abcde']
+        self.assertEqual(get_peak_memory(tests), [100, 300, 900, 300, 300])
+
+    def test_no_samples(self):
+        tests = [lit.Test.Test(self.suite, ('a',), None)]
+        self.assertEqual(get_peak_memory(tests), [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
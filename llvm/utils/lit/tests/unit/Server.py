@@ -0,0 +1,94 @@
+# RUN: %{python} %s
+#
+# END.
+
+import multiprocessing.connection
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+import lit.server
+
+
+@unittest.skipIf(sys.platform == 'win32', 'uses Unix domain sockets')
+class TestServerDir(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tmp, 'server')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_created_private(self):
+        address, authkey = lit.server._create_server_dir(self.directory)
+        self.assertEqual(os.stat(self.directory).st_mode & 0o777, 0o700)
+        path = os.path.join(self.directory, lit.server.AUTHKEY_FILE)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), authkey)
+        self.assertEqual(address, os.path.join(self.directory,
+                                               lit.server.SOCKET_FILE))
+
+    def test_new_key_per_server(self):
+        _, first = lit.server._create_server_dir(self.directory)
+        _, second = lit.server._create_server_dir(self.directory)
+        self.assertNotEqual(first, second)
+
+    def test_shared_dir_refused(self):
+        os.mkdir(self.directory, 0o755)
+        os.chmod(self.directory, 0o755)
+        with self.assertRaises(lit.server.ServerError):
+            lit.server._create_server_dir(self.directory)
+
+    def test_wrong_key_refused(self):
+        address, authkey = lit.server._create_server_dir(self.directory)
+        with multiprocessing.connection.Listener(
+                address, authkey=authkey) as listener:
+            errors = []
+
+            def accept():
+                try:
+                    listener.accept()
+                except multiprocessing.AuthenticationError as e:
+                    errors.append(e)
+
+            thread = threading.Thread(target=accept)
+            thread.start()
+            with self.assertRaises(multiprocessing.AuthenticationError):
+                multiprocessing.connection.Client(address, authkey=b'x' * 32)
+            thread.join()
+            self.assertEqual(len(errors), 1)
+
+    def test_failed_request_keeps_serving(self):
+        class FakeConfig(object):
+            def note(self, message):
+                pass
+
+        class FailingServer(lit.server.Server):
+            failures = [SystemExit(2), ValueError('bad request')]
+
+            def discover(self, paths):
+                raise self.failures.pop(0)
+
+        address, authkey = lit.server._create_server_dir(self.directory)
+        with multiprocessing.connection.Listener(
+                address, authkey=authkey) as listener:
+            server = FailingServer(FakeConfig(), True)
+            thread = threading.Thread(target=server._serve, args=(listener,),
+                                      daemon=True)
+            thread.start()
+            replies = []
+            for _ in range(2):
+                with multiprocessing.connection.Client(
+                        address, authkey=authkey) as conn:
+                    conn.send({'cwd': os.getcwd(), 'paths': []})
+                    replies.append(conn.recv())
+        self.assertEqual(replies[0][0], 'error')
+        self.assertEqual(replies[1], ('error', 'bad request'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# RUN: %{python} %s
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import lit.Test
+import lit.TestHistory
+from lit.TestHistory import (COMPACT_LINES, HISTORY_SIZE,
+                             find_intermittent_tests, find_slow_tests,
+                             get_median_times, get_peak_memory,
+                             read_test_history,
+                             record_test_history, use_median_times)
+from lit.TestTimes import MIN_TEST_TIME, read_test_times, record_test_times
+
+
+class TestHistoryFile(unittest.TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.suite = lit.Test.TestSuite('suite', root, root, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.suite.exec_root)
+
+    def test_append_and_compact(self):
+        for i in range(COMPACT_LINES + 5):
+            record_test_history(self.suite.exec_root,
+                                {'a': [[float(i), 'PASS']]}, None)
+        with open(os.path.join(self.suite.exec_root,
+                               lit.TestHistory.HISTORY_FILE)) as f:
+            self.assertLess(len(f.readlines()), COMPACT_LINES)
+        samples = read_test_history(self.suite)['a']
+        self.assertEqual(len(samples), HISTORY_SIZE)
+        self.assertEqual(samples[-1], [COMPACT_LINES + 4.0, 'PASS'])
+
+    def test_read_only_to_compact(self):
+        reads = []
+        read_lines = lit.TestHistory._read_lines
+
+        def counting_read_lines(exec_root):
+            reads.append(exec_root)
+            return read_lines(exec_root)
+
+        lit.TestHistory._read_lines = counting_read_lines
+        try:
+            for i in range(COMPACT_LINES * 2):
+                record_test_history(self.suite.exec_root,
+                                    {'a': [[float(i), 'PASS']]}, None)
+        finally:
+            lit.TestHistory._read_lines = read_lines
+        self.assertEqual(len(reads), 2)
+
+    def test_truncated_line(self):
+        record_test_history(self.suite.exec_root, {'a': [[1.0, 'PASS']]}, None)
+        with open(os.path.join(self.suite.exec_root,
+                               lit.TestHistory.HISTORY_FILE), 'a') as f:
+            f.write('{"a": [[2.0, "PA')
+        self.assertEqual(read_test_history(self.suite), {'a': [[1.0, 'PASS']]})
+
+    def test_median_times(self):
+        for t, code in [(1.0, 'PASS'), (9.0, 'FAIL'), (2.0, 'PASS'),
+                        (8.0, 'PASS'), (3.0, 'FAIL')]:
+            record_test_history(self.suite.exec_root, {'a': [[t, code]]}, None)
+        self.suite.test_times = {'a': -3.0, 'b': 1.0}
+        use_median_times(self.suite)
+        self.assertEqual(self.suite.test_times, {'a': -2.0, 'b': 1.0})
+
+
+class TestHistoryStatistics(unittest.TestCase):
+    def test_median(self):
+        history = {'a': [[1.0, 'PASS'], [3.0, 'PASS']], 'b': [[1.0, 'FAIL']]}
+        self.assertEqual(get_median_times(history), {'a': 2.0})
+
+    def test_peak_memory(self):
+        history = {'a': [[1.0, 'PASS', 300], [1.0, 'FAIL'],
+                         [3.0, 'PASS', 200]],
+                   'b': [[1.0, 'PASS']]}
+        self.assertEqual(get_peak_memory(history), {'a': 300})
+        self.assertEqual(get_median_times(history), {'a': 2.0, 'b': 1.0})
+
+    def test_slow(self):
+        noisy = [[1.0 + 0.01 * (i % 3), 'PASS'] for i in range(10)]
+        history = {
+            'stable': noisy,
+            'slower': noisy + [[2.0, 'PASS']] * 3,
+            'one-outlier': noisy + [[2.0, 'PASS'], [1.0, 'PASS'],
+                                    [1.0, 'PASS']],
+            'few-samples': [[1.0, 'PASS']] * 2 + [[2.0, 'PASS']] * 3,
+        }
+        self.assertEqual(find_slow_tests(history), [('slower', 1.01, 2.0)])
+
+    def test_intermittent(self):
+        history = {
+            'flaky': [[1.0, 'PASS'], [1.0, 'FLAKYPASS']],
+            'flipping': [[1.0, c] for c in ('PASS', 'FAIL', 'PASS', 'FAIL')],
+            'fixed': [[1.0, c] for c in ('PASS', 'FAIL', 'FAIL', 'PASS')],
+        }
+        self.assertEqual(sorted(find_intermittent_tests(history)),
+                         [('flaky', 2, 0, 1), ('flipping', 4, 2, 0)])
+
+
+class TestRecordTimes(unittest.TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.suite = lit.Test.TestSuite('suite', root, root, None)
+        # As after discovery, see find_tests_for_inputs().
+        self.suite.test_times = None
+
+    def tearDown(self):
+        shutil.rmtree(self.suite.exec_root)
+
+    def make_test(self, name, code, elapsed):
+        test = lit.Test.Test(self.suite, [name], None)
+        test.result = lit.Test.Result(code, elapsed=elapsed)
+        return test
+
+    def test_instant_tests(self):
+        tests = [self.make_test('pass', lit.Test.PASS, 0.0),
+                 self.make_test('fail', lit.Test.FAIL, 0.0),
+                 self.make_test('unrun', lit.Test.PASS, None)]
+        record_test_times(tests, None)
+        self.assertEqual(read_test_times(self.suite),
+                         {'pass': MIN_TEST_TIME, 'fail': -MIN_TEST_TIME})
+
+
+if __name__ == '__main__':
+    unittest.main()
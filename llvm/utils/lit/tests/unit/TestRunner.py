@@ -289,6 +289,51 @@ class TestApplySubtitutions(unittest.TestCase):
             except AssertionError:
                 pass
 
+    def test_required_literal(self):
+        get = lit.TestRunner._getRequiredLiteral
+        self.assertEqual(get('%clang_cc1'), '%clang_cc1')
+        self.assertEqual(get(r'(?<!(\.|/))\bFileCheck\b(?!(-|\.))'),
+                         'FileCheck')
+        self.assertEqual(get('%{a+}'), '%{')
+        self.assertEqual(get('ab*cd'), 'cd')
+        self.assertEqual(get('%a|%b'), '%')
+        self.assertIsNone(get('ab|cd'))
+        self.assertIsNone(get('(?i)opt'))
+        self.assertIsNone(get('['))
+
+    def test_skipped_substitutions_are_identical(self):
+        # Substitutions see the output of the earlier ones, and the %% escape
+        # is reapplied before each of them.
+        substitutions = [
+            ("%clang_cc1", "clang -cc1 %%s"),
+            ("%clang", "clang"),
+            (r"(?<!(\.|/))\bopt\b(?!(-|\.))", "/bin/opt"),
+            ("%s", "source.ll"),
+            ("%{x}", "%%{y}"),
+            ("ab*c", "X"),
+            ("(?i)FOO", "foo"),
+            ("%(one|two)", "\\1!"),
+            ("%rec", "%clang"),
+        ]
+        script = ["%clang_cc1 %s", "opt < %s | FileCheck %s", "x.opt opt-y",
+                  "%%s %{x}", "ac abbc", "Foo %two", "%rec %%rec", "no subst",
+                  "%if feature %{ %s %} %else %{ opt %}"]
+        conditions = {'feature': True}
+        old = os.environ.pop('LIT_VERIFY_SUBSTITUTIONS', None)
+        try:
+            for limit in [None, 5]:
+                os.environ.pop('LIT_VERIFY_SUBSTITUTIONS', None)
+                result = lit.TestRunner.applySubstitutions(
+                    script, substitutions, conditions, recursion_limit=limit)
+                os.environ['LIT_VERIFY_SUBSTITUTIONS'] = '1'
+                self.assertEqual(lit.TestRunner.applySubstitutions(
+                    script, substitutions, conditions, recursion_limit=limit),
+                    result)
+        finally:
+            os.environ.pop('LIT_VERIFY_SUBSTITUTIONS', None)
+            if old is not None:
+                os.environ['LIT_VERIFY_SUBSTITUTIONS'] = old
+
 
 if __name__ == '__main__':
     TestIntegratedTestKeywordParser.load_keyword_parser_lit_tests()
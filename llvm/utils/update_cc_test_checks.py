@@ -228,61 +228,76 @@ def exec_run_line(exe):
     sys.stderr.write(stdout)
     sys.exit(3)
 
+def get_run_list(ti):
+  # Build a list of filechecked and non-filechecked RUN lines.
+  run_list = []
+
+  subs = {
+    '%s' : ti.path,
+    '%t' : tempfile.NamedTemporaryFile().name,
+    '%S' : os.path.dirname(ti.path),
+  }
+
+  for l in ti.run_lines:
+    commands = [cmd.strip() for cmd in l.split('|')]
+
+    triple_in_cmd = None
+    m = common.TRIPLE_ARG_RE.search(commands[0])
+    if m:
+      triple_in_cmd = m.groups()[0]
+
+    # Parse executable args.
+    exec_args = shlex.split(commands[0])
+    # Execute non-clang runline.
+    if exec_args[0] not in SUBST:
+      # Do lit-like substitutions.
+      for s in subs:
+        exec_args = [i.replace(s, subs[s]) if s in i else i for i in exec_args]
+      run_list.append((None, exec_args, None, None))
+      continue
+    # This is a clang runline, apply %clang substitution rule, do lit-like substitutions,
+    # and append args.clang_args
+    clang_args = exec_args
+    clang_args[0:1] = SUBST[clang_args[0]]
+    for s in subs:
+      clang_args = [i.replace(s, subs[s]) if s in i else i for i in clang_args]
+    clang_args += ti.args.clang_args
+
+    # Extract -check-prefix in FileCheck args
+    filecheck_cmd = commands[-1]
+    common.verify_filecheck_prefixes(filecheck_cmd)
+    if not filecheck_cmd.startswith('FileCheck '):
+      # Execute non-filechecked clang runline.
+      exe = [ti.args.clang] + clang_args
+      run_list.append((None, exe, None, None))
+      continue
+
+    check_prefixes = [item for m in common.CHECK_PREFIX_RE.finditer(filecheck_cmd)
+                             for item in m.group(1).split(',')]
+    if not check_prefixes:
+      check_prefixes = ['CHECK']
+    run_list.append((check_prefixes, clang_args, commands[1:-1], triple_in_cmd))
+  return run_list
+
 def main():
   initial_args, parser = config()
   script_name = os.path.basename(__file__)
 
-  for ti in common.itertests(initial_args.tests, parser, 'utils/' + script_name,
-                             comment_prefix='//', argparse_callback=infer_dependent_args):
-    # Build a list of filechecked and non-filechecked RUN lines.
-    run_list = []
-    line2func_list = collections.defaultdict(list)
+  tests = common.itertests(initial_args.tests, parser, 'utils/' + script_name,
+                           comment_prefix='//', argparse_callback=infer_dependent_args)
 
-    subs = {
-      '%s' : ti.path,
-      '%t' : tempfile.NamedTemporaryFile().name,
-      '%S' : os.path.dirname(ti.path),
-    }
-
-    for l in ti.run_lines:
-      commands = [cmd.strip() for cmd in l.split('|')]
-
-      triple_in_cmd = None
-      m = common.TRIPLE_ARG_RE.search(commands[0])
-      if m:
-        triple_in_cmd = m.groups()[0]
-
-      # Parse executable args.
-      exec_args = shlex.split(commands[0])
-      # Execute non-clang runline.
-      if exec_args[0] not in SUBST:
-        # Do lit-like substitutions.
-        for s in subs:
-          exec_args = [i.replace(s, subs[s]) if s in i else i for i in exec_args]
-        run_list.append((None, exec_args, None, None))
-        continue
-      # This is a clang runline, apply %clang substitution rule, do lit-like substitutions,
-      # and append args.clang_args
-      clang_args = exec_args
-      clang_args[0:1] = SUBST[clang_args[0]]
-      for s in subs:
-        clang_args = [i.replace(s, subs[s]) if s in i else i for i in clang_args]
-      clang_args += ti.args.clang_args
-
-      # Extract -check-prefix in FileCheck args
-      filecheck_cmd = commands[-1]
-      common.verify_filecheck_prefixes(filecheck_cmd)
-      if not filecheck_cmd.startswith('FileCheck '):
-        # Execute non-filechecked clang runline.
-        exe = [ti.args.clang] + clang_args
-        run_list.append((None, exe, None, None))
-        continue
+  # Start the clang invocations of the next tests, to run in parallel with
+  # --jobs.  Tests with non-FileChecked RUN lines are left alone, as these may
+  # produce files the other RUN lines depend on.
+  def start(ti):
+    run_list = get_run_list(ti)
+    if all(prefixes for prefixes, _, _, _ in run_list):
+      for _, clang_args, _, _ in run_list:
+        common.prefetch_tool_output(ti.args.clang, clang_args, ti.path)
+    return run_list
 
-      check_prefixes = [item for m in common.CHECK_PREFIX_RE.finditer(filecheck_cmd)
-                               for item in m.group(1).split(',')]
-      if not check_prefixes:
-        check_prefixes = ['CHECK']
-      run_list.append((check_prefixes, clang_args, commands[1:-1], triple_in_cmd))
+  for ti, run_list in common.iter_prefetched(tests, start):
+    line2func_list = collections.defaultdict(list)
 
     # Execute clang, generate LLVM IR, and extract functions.
 
@@ -412,11 +427,13 @@ def main():
       common.add_global_checks(builder.global_var_dict(), '//', run_list,
                                output_lines, global_vars_seen_dict, True, False)
     common.debug('Writing %d lines to %s...' % (len(output_lines), ti.path))
-    with open(ti.path, 'wb') as f:
-      f.writelines(['{}\n'.format(l).encode('utf-8') for l in output_lines])
+    common.write_test_file(ti.path, output_lines)
 
   return 0
 
 
 if __name__ == '__main__':
-  sys.exit(main())
+  try:
+    sys.exit(main())
+  finally:
+    common.shutdown_tool_pool()
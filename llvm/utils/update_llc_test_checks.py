@@ -18,6 +18,64 @@ from UpdateTestChecks import common
 # additional ones here if they have them.
 LLC_LIKE_TOOLS = ('llc',)
 
+def get_run_list(ti):
+  # The output type of the last RUN line is used for all of them.
+  output_type = None
+  run_list = []
+  for l in ti.run_lines:
+    if '|' not in l:
+      common.warn('Skipping unparseable RUN line: ' + l)
+      continue
+
+    commands = [cmd.strip() for cmd in l.split('|')]
+    assert len(commands) >= 2
+    preprocess_cmd = None
+    if len(commands) > 2:
+      preprocess_cmd = " | ".join(commands[:-2])
+    llc_cmd = commands[-2]
+    filecheck_cmd = commands[-1]
+    llc_tool = llc_cmd.split(' ')[0]
+
+    triple_in_cmd = None
+    m = common.TRIPLE_ARG_RE.search(llc_cmd)
+    if m:
+      triple_in_cmd = m.groups()[0]
+
+    march_in_cmd = None
+    m = common.MARCH_ARG_RE.search(llc_cmd)
+    if m:
+      march_in_cmd = m.groups()[0]
+
+    m = common.DEBUG_ONLY_ARG_RE.search(llc_cmd)
+    if m and m.groups()[0] == 'isel':
+      from UpdateTestChecks import isel as output_type
+    else:
+      from UpdateTestChecks import asm as output_type
+
+    common.verify_filecheck_prefixes(filecheck_cmd)
+    if llc_tool not in LLC_LIKE_TOOLS:
+      common.warn('Skipping non-llc RUN line: ' + l)
+      continue
+
+    if not filecheck_cmd.startswith('FileCheck '):
+      common.warn('Skipping non-FileChecked RUN line: ' + l)
+      continue
+
+    llc_cmd_args = llc_cmd[len(llc_tool):].strip()
+    llc_cmd_args = llc_cmd_args.replace('< %s', '').replace('%s', '').strip()
+    if ti.path.endswith('.mir'):
+      llc_cmd_args += ' -x mir'
+    check_prefixes = [item for m in common.CHECK_PREFIX_RE.finditer(filecheck_cmd)
+                             for item in m.group(1).split(',')]
+    if not check_prefixes:
+      check_prefixes = ['CHECK']
+
+    # FIXME: We should use multiple check prefixes to common check lines. For
+    # now, we just ignore all but the last.
+    run_list.append((check_prefixes, llc_tool, llc_cmd_args, preprocess_cmd,
+                     triple_in_cmd, march_in_cmd))
+  return run_list, output_type
+
 def main():
   parser = argparse.ArgumentParser(description=__doc__)
   parser.add_argument('--llc-binary', default=None,
@@ -45,8 +103,20 @@ def main():
 
   script_name = os.path.basename(__file__)
 
-  for ti in common.itertests(initial_args.tests, parser,
-                             script_name='utils/' + script_name):
+  tests = common.itertests(initial_args.tests, parser,
+                           script_name='utils/' + script_name)
+
+  # Start the llc invocations of the next tests, to run in parallel with
+  # --jobs.
+  def start(ti):
+    run_list, output_type = get_run_list(ti)
+    for _, llc_tool, llc_args, preprocess_cmd, _, _ in run_list:
+      common.prefetch_tool_output(ti.args.llc_binary or llc_tool, llc_args,
+                                  ti.path, preprocess_cmd,
+                                  verbose=ti.args.verbose)
+    return run_list, output_type
+
+  for ti, (run_list, output_type) in common.iter_prefetched(tests, start):
     triple_in_ir = None
     for l in ti.input_lines:
       m = common.TRIPLE_IR_RE.match(l)
@@ -54,60 +124,6 @@ def main():
         triple_in_ir = m.groups()[0]
         break
 
-    run_list = []
-    for l in ti.run_lines:
-      if '|' not in l:
-        common.warn('Skipping unparseable RUN line: ' + l)
-        continue
-
-      commands = [cmd.strip() for cmd in l.split('|')]
-      assert len(commands) >= 2
-      preprocess_cmd = None
-      if len(commands) > 2:
-        preprocess_cmd = " | ".join(commands[:-2])
-      llc_cmd = commands[-2]
-      filecheck_cmd = commands[-1]
-      llc_tool = llc_cmd.split(' ')[0]
-
-      triple_in_cmd = None
-      m = common.TRIPLE_ARG_RE.search(llc_cmd)
-      if m:
-        triple_in_cmd = m.groups()[0]
-
-      march_in_cmd = None
-      m = common.MARCH_ARG_RE.search(llc_cmd)
-      if m:
-        march_in_cmd = m.groups()[0]
-
-      m = common.DEBUG_ONLY_ARG_RE.search(llc_cmd)
-      if m and m.groups()[0] == 'isel':
-        from UpdateTestChecks import isel as output_type
-      else:
-        from UpdateTestChecks import asm as output_type
-
-      common.verify_filecheck_prefixes(filecheck_cmd)
-      if llc_tool not in LLC_LIKE_TOOLS:
-        common.warn('Skipping non-llc RUN line: ' + l)
-        continue
-
-      if not filecheck_cmd.startswith('FileCheck '):
-        common.warn('Skipping non-FileChecked RUN line: ' + l)
-        continue
-
-      llc_cmd_args = llc_cmd[len(llc_tool):].strip()
-      llc_cmd_args = llc_cmd_args.replace('< %s', '').replace('%s', '').strip()
-      if ti.path.endswith('.mir'):
-        llc_cmd_args += ' -x mir'
-      check_prefixes = [item for m in common.CHECK_PREFIX_RE.finditer(filecheck_cmd)
-                               for item in m.group(1).split(',')]
-      if not check_prefixes:
-        check_prefixes = ['CHECK']
-
-      # FIXME: We should use multiple check prefixes to common check lines. For
-      # now, we just ignore all but the last.
-      run_list.append((check_prefixes, llc_tool, llc_cmd_args, preprocess_cmd,
-                       triple_in_cmd, march_in_cmd))
-
     if ti.path.endswith('.mir'):
       check_indent = '  '
     else:
@@ -221,9 +237,11 @@ def main():
           run_list, generated_prefixes))
     
     common.debug('Writing %d lines to %s...' % (len(output_lines), ti.path))
-    with open(ti.path, 'wb') as f:
-      f.writelines(['{}\n'.format(l).encode('utf-8') for l in output_lines])
+    common.write_test_file(ti.path, output_lines)
 
 
 if __name__ == '__main__':
-  main()
+  try:
+    main()
+  finally:
+    common.shutdown_tool_pool()
@@ -39,6 +39,44 @@ import sys
 from UpdateTestChecks import common
 
 
+def get_prefix_list(ti, opt_basename):
+  prefix_list = []
+  for l in ti.run_lines:
+    if '|' not in l:
+      common.warn('Skipping unparseable RUN line: ' + l)
+      continue
+
+    commands = [cmd.strip() for cmd in l.split('|')]
+    assert len(commands) >= 2
+    preprocess_cmd = None
+    if len(commands) > 2:
+      preprocess_cmd = " | ".join(commands[:-2])
+    tool_cmd = commands[-2]
+    filecheck_cmd = commands[-1]
+    common.verify_filecheck_prefixes(filecheck_cmd)
+    if not tool_cmd.startswith(opt_basename + ' '):
+      common.warn('Skipping non-%s RUN line: %s' % (opt_basename, l))
+      continue
+
+    if not filecheck_cmd.startswith('FileCheck '):
+      common.warn('Skipping non-FileChecked RUN line: ' + l)
+      continue
+
+    tool_cmd_args = tool_cmd[len(opt_basename):].strip()
+    tool_cmd_args = tool_cmd_args.replace('< %s', '').replace('%s', '').strip()
+
+    check_prefixes = [item for m in
+                      common.CHECK_PREFIX_RE.finditer(filecheck_cmd)
+                      for item in m.group(1).split(',')]
+    if not check_prefixes:
+      check_prefixes = ['CHECK']
+
+    # FIXME: We should use multiple check prefixes to common check lines. For
+    # now, we just ignore all but the last.
+    prefix_list.append((check_prefixes, tool_cmd_args, preprocess_cmd))
+  return prefix_list
+
+
 def main():
   from argparse import RawTextHelpFormatter
   parser = argparse.ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
@@ -66,49 +104,26 @@ def main():
     sys.exit(1)
   opt_basename = 'opt'
 
-  for ti in common.itertests(initial_args.tests, parser,
-                             script_name='utils/' + script_name):
+  tests = common.itertests(initial_args.tests, parser,
+                           script_name='utils/' + script_name)
+
+  # Start the opt invocations of the next tests, to run in parallel with
+  # --jobs.
+  def start(ti):
+    prefix_list = get_prefix_list(ti, opt_basename)
+    for _, opt_args, preprocess_cmd in prefix_list:
+      common.prefetch_tool_output(ti.args.opt_binary, opt_args, ti.path,
+                                  preprocess_cmd=preprocess_cmd,
+                                  verbose=ti.args.verbose)
+    return prefix_list
+
+  for ti, prefix_list in common.iter_prefetched(tests, start):
     # If requested we scrub trailing attribute annotations, e.g., '#0', together with whitespaces
     if ti.args.scrub_attributes:
       common.SCRUB_TRAILING_WHITESPACE_TEST_RE = common.SCRUB_TRAILING_WHITESPACE_AND_ATTRIBUTES_RE
     else:
       common.SCRUB_TRAILING_WHITESPACE_TEST_RE = common.SCRUB_TRAILING_WHITESPACE_RE
 
-    prefix_list = []
-    for l in ti.run_lines:
-      if '|' not in l:
-        common.warn('Skipping unparseable RUN line: ' + l)
-        continue
-
-      commands = [cmd.strip() for cmd in l.split('|')]
-      assert len(commands) >= 2
-      preprocess_cmd = None
-      if len(commands) > 2:
-        preprocess_cmd = " | ".join(commands[:-2])
-      tool_cmd = commands[-2]
-      filecheck_cmd = commands[-1]
-      common.verify_filecheck_prefixes(filecheck_cmd)
-      if not tool_cmd.startswith(opt_basename + ' '):
-        common.warn('Skipping non-%s RUN line: %s' % (opt_basename, l))
-        continue
-
-      if not filecheck_cmd.startswith('FileCheck '):
-        common.warn('Skipping non-FileChecked RUN line: ' + l)
-        continue
-
-      tool_cmd_args = tool_cmd[len(opt_basename):].strip()
-      tool_cmd_args = tool_cmd_args.replace('< %s', '').replace('%s', '').strip()
-
-      check_prefixes = [item for m in
-                        common.CHECK_PREFIX_RE.finditer(filecheck_cmd)
-                        for item in m.group(1).split(',')]
-      if not check_prefixes:
-        check_prefixes = ['CHECK']
-
-      # FIXME: We should use multiple check prefixes to common check lines. For
-      # now, we just ignore all but the last.
-      prefix_list.append((check_prefixes, tool_cmd_args, preprocess_cmd))
-
     global_vars_seen_dict = {}
     builder = common.FunctionTestBuilder(
       run_list=prefix_list,
@@ -214,9 +229,11 @@ def main():
         common.add_global_checks(builder.global_var_dict(), ';', prefix_list, output_lines, global_vars_seen_dict, args.preserve_names, False)
     common.debug('Writing %d lines to %s...' % (len(output_lines), ti.path))
 
-    with open(ti.path, 'wb') as f:
-      f.writelines(['{}\n'.format(l).encode('utf-8') for l in output_lines])
+    common.write_test_file(ti.path, output_lines)
 
 
 if __name__ == '__main__':
-  main()
+  try:
+    main()
+  finally:
+    common.shutdown_tool_pool()